@@ -0,0 +1,169 @@
+"""
+数据库配置基准测试脚本
+在不同的 DJANGO_DB_PROFILE 下并发请求主要页面，比较读写吞吐量
+
+用法:
+    python scripts/benchmark_db_profiles.py
+    python scripts/benchmark_db_profiles.py --profiles development production --threads 8 --duration 10
+    # PostgreSQL需先配置 POSTGRES_* 环境变量并导入数据
+    python scripts/benchmark_db_profiles.py --profiles production postgresql
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 读场景：浏览页面；写场景：加购并结算
+READ_MIX = ['home', 'products', 'product_detail']
+WRITE_MIX = ['add_to_cart', 'checkout']
+
+
+def run_worker(args):
+    """在当前配置下执行基准测试（子进程中运行），结果以JSON输出到stdout"""
+    sys.path.append(BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'version.settings')
+    import django
+    django.setup()
+
+    from django.db import OperationalError, connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+    from shop.models import Product, User
+
+    setup_test_environment()
+
+    users = list(User.objects.filter(is_superuser=False, family__isnull=False)[:args.threads])
+    product_ids = list(Product.objects.filter(stock__gt=0).values_list('id', flat=True)[:200])
+    if not users or not product_ids:
+        raise SystemExit('错误：数据库中没有用户或商品，请先生成测试数据')
+
+    deadline = time.perf_counter() + args.duration
+    counts = {'read': 0, 'write': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def client_loop(index, user):
+        # 请求异常（如 database is locked）计为错误，不中断测试
+        client = Client(raise_request_exception=False)
+        local = {'read': 0, 'write': 0, 'errors': 0}
+        while True:
+            try:
+                client.force_login(user)
+                break
+            except OperationalError:
+                local['errors'] += 1
+        step = 0
+        while time.perf_counter() < deadline:
+            product_id = product_ids[(index * 31 + step) % len(product_ids)]
+            is_write = step % args.write_every == args.write_every - 1
+            names = WRITE_MIX if is_write else READ_MIX
+            for name in names:
+                if name in ('product_detail', 'add_to_cart'):
+                    url = reverse(name, args=[product_id])
+                else:
+                    url = reverse(name)
+                response = client.get(url)
+                if response.status_code >= 400:
+                    local['errors'] += 1
+            local['write' if is_write else 'read'] += len(names)
+            step += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=client_loop, args=(i, user)) for i, user in enumerate(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    journal_mode = None
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+
+    print(json.dumps({
+        'profile': os.environ.get('DJANGO_DB_PROFILE', 'development'),
+        'vendor': connection.vendor,
+        'journal_mode': journal_mode,
+        'threads': len(users),
+        'elapsed': elapsed,
+        'reads': counts['read'],
+        'writes': counts['write'],
+        'errors': counts['errors'],
+        'read_rps': counts['read'] / elapsed,
+        'write_rps': counts['write'] / elapsed,
+    }))
+
+
+def run_profile(profile, args, sqlite_path):
+    """在子进程中以指定配置运行基准测试"""
+    env = dict(os.environ, DJANGO_DB_PROFILE=profile, DJANGO_SQLITE_PATH=sqlite_path)
+    subprocess.run(
+        [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+        cwd=BASE_DIR, env=env, check=True
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker',
+         '--threads', str(args.threads), '--duration', str(args.duration),
+         '--write-every', str(args.write_every)],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库配置吞吐量基准测试')
+    parser.add_argument('--profiles', nargs='+', default=['development', 'production'],
+                        choices=['development', 'production', 'postgresql'])
+    parser.add_argument('--threads', type=int, default=8, help='并发客户端数量')
+    parser.add_argument('--duration', type=float, default=10.0, help='每个配置的测试时长(秒)')
+    parser.add_argument('--write-every', type=int, default=5, help='每N轮浏览执行一次加购+结算')
+    parser.add_argument('--source-db', default=os.path.join(BASE_DIR, 'db.sqlite3'),
+                        help='SQLite测试数据来源（会复制后使用，不修改原文件）')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    print("=" * 60)
+    print("数据库配置基准测试")
+    print("=" * 60)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for profile in args.profiles:
+            # 每个配置使用独立的数据副本，保证起始数据一致
+            sqlite_path = os.path.join(tmpdir, f'{profile}.sqlite3')
+            shutil.copy(args.source_db, sqlite_path)
+            print(f"运行配置: {profile} ...")
+            results.append(run_profile(profile, args, sqlite_path))
+
+    print("\n" + "=" * 60)
+    print(f"{'配置':<14}{'日志模式':<10}{'读请求/秒':>12}{'写请求/秒':>12}{'错误':>8}")
+    print("-" * 60)
+    for r in results:
+        print(f"{r['profile']:<14}{str(r['journal_mode'] or '-'):<10}"
+              f"{r['read_rps']:>12.1f}{r['write_rps']:>12.1f}{r['errors']:>8}")
+    print("=" * 60)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+推荐系统微基准测试脚本
+在多个规模（用户数 x 商品数，固定稀疏度）的合成数据上测量推荐引擎各阶段的耗时和峰值内存，
+结果写入JSON，可与其他提交的结果对比以发现性能回退
+
+测量阶段:
+    build_matrices          从数据库构建用户-商品矩阵
+    cosine_similarity_user  用户相似度矩阵
+    cosine_similarity_item  商品相似度矩阵
+    user_based_cf           单个用户的基于用户协同过滤（相似度已缓存）
+    item_based_cf           单个用户的基于商品协同过滤（相似度已缓存）
+    lifecycle               单个用户的生命周期推荐查询
+    get_recommendations     端到端推荐（与线上一样每次新建推荐系统）
+
+用法:
+    python scripts/benchmark_recommender.py
+    python scripts/benchmark_recommender.py --scales 1000x1000 3000x5000 --sparsity 0.005 --json bench.json
+    # 与基线对比，任一阶段变慢超过20%时以非零状态退出
+    python scripts/benchmark_recommender.py --json new.json --baseline old.json --threshold 0.2
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCALES = ['1000x1000', '10000x10000', '100000x100000']
+# 稠密矩阵按 float64 存储：评分矩阵、归一化副本以及用户、商品两个相似度矩阵
+BYTES_PER_CELL = 8
+
+
+def parse_scale(value):
+    try:
+        users, products = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'规模格式应为 用户数x商品数: {value}')
+    return users, products
+
+
+def estimate_bytes(users, products):
+    """估算稠密实现所需内存"""
+    return BYTES_PER_CELL * (2 * users * products + users * users + products * products)
+
+
+def measure(func, repeat):
+    """重复执行并统计耗时（秒），最后一次的返回值一并返回"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.fmean(durations),
+        'repeat': repeat,
+    }, result
+
+
+def peak_memory(func):
+    """用 tracemalloc 测量单次执行的峰值内存（MB，包含NumPy分配）"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def run_worker(args):
+    """在独立数据库上生成数据并执行基准测试（子进程中运行），结果以JSON输出到stdout"""
+    sys.path.append(BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'version.settings')
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from shop.models import User, UserBehavior
+    from shop.recommender import RecommenderSystem
+
+    n_users, n_products = args.scale
+    behaviors = max(1, int(n_users * n_products * args.sparsity))
+    orders = max(1, n_users // 4)
+
+    started = time.perf_counter()
+    call_command('migrate', verbosity=0)
+    call_command(
+        'generate_test_data', families=max(1, n_users // 2), users=n_users, products=n_products,
+        behaviors=behaviors, orders=orders, seed=args.seed, stdout=io.StringIO(),
+    )
+    generate_seconds = time.perf_counter() - started
+
+    sample = list(User.objects.filter(is_superuser=False).order_by('id')[:args.sample_users])
+    stages = {}
+
+    recommender = RecommenderSystem()
+    stages['build_matrices'], (user_idx, product_idx) = measure(recommender.build_matrices, args.repeat)
+    stages['cosine_similarity_user'], _ = measure(
+        lambda: recommender.cosine_similarity(recommender.user_item_matrix), args.repeat)
+    stages['cosine_similarity_item'], _ = measure(
+        lambda: recommender.cosine_similarity(recommender.item_user_matrix), args.repeat)
+
+    # 相似度缓存后测量单用户打分
+    recommender.get_user_similarity()
+    recommender.get_item_similarity()
+
+    def per_user(func):
+        return lambda: [func(user) for user in sample]
+
+    def per_user_stats(stats):
+        # 换算为单用户耗时
+        count = len(sample)
+        return dict(stats, min=stats['min'] / count, median=stats['median'] / count,
+                    mean=stats['mean'] / count, users=count)
+
+    stats, _ = measure(per_user(lambda u: recommender.user_based_cf(u.id, user_idx, product_idx)), args.repeat)
+    stages['user_based_cf'] = per_user_stats(stats)
+    stats, _ = measure(per_user(lambda u: recommender.item_based_cf(u.id, user_idx, product_idx)), args.repeat)
+    stages['item_based_cf'] = per_user_stats(stats)
+    stats, _ = measure(per_user(recommender.get_lifecycle_recommendations), args.repeat)
+    stages['lifecycle'] = per_user_stats(stats)
+
+    e2e_sample = sample[:args.e2e_users]
+    stats, _ = measure(lambda: [RecommenderSystem().get_recommendations(u) for u in e2e_sample], 1)
+    stages['get_recommendations'] = dict(stats, min=stats['min'] / len(e2e_sample),
+                                         median=stats['median'] / len(e2e_sample),
+                                         mean=stats['mean'] / len(e2e_sample), users=len(e2e_sample))
+
+    # 峰值内存单独测量，避免 tracemalloc 的开销影响耗时
+    if not args.skip_memory:
+        fresh = RecommenderSystem()
+        stages['build_matrices']['peak_mb'] = peak_memory(fresh.build_matrices)
+        stages['cosine_similarity_user']['peak_mb'] = peak_memory(
+            lambda: fresh.cosine_similarity(fresh.user_item_matrix))
+        stages['cosine_similarity_item']['peak_mb'] = peak_memory(
+            lambda: fresh.cosine_similarity(fresh.item_user_matrix))
+        stages['user_based_cf']['peak_mb'] = peak_memory(
+            lambda: recommender.user_based_cf(sample[0].id, user_idx, product_idx))
+        stages['item_based_cf']['peak_mb'] = peak_memory(
+            lambda: recommender.item_based_cf(sample[0].id, user_idx, product_idx))
+        stages['lifecycle']['peak_mb'] = peak_memory(
+            lambda: recommender.get_lifecycle_recommendations(sample[0]))
+        stages['get_recommendations']['peak_mb'] = peak_memory(
+            lambda: RecommenderSystem().get_recommendations(sample[0]))
+
+    print(json.dumps({
+        'scale': f'{n_users}x{n_products}',
+        'users': n_users,
+        'products': n_products,
+        'behaviors': UserBehavior.objects.count(),
+        'sparsity': args.sparsity,
+        'generate_seconds': generate_seconds,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stages,
+    }))
+
+
+def run_scale(scale, args, tmpdir):
+    """在子进程中以全新的SQLite数据库运行一个规模"""
+    users, products = scale
+    env = dict(os.environ, DJANGO_SQLITE_PATH=os.path.join(tmpdir, f'{users}x{products}.sqlite3'))
+    env.pop('DJANGO_DB_PROFILE', None)
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker', '--scales', f'{users}x{products}',
+        '--sparsity', str(args.sparsity), '--repeat', str(args.repeat),
+        '--sample-users', str(args.sample_users), '--e2e-users', str(args.e2e_users),
+        '--seed', str(args.seed),
+    ]
+    if args.skip_memory:
+        command.append('--skip-memory')
+    output = subprocess.run(command, cwd=BASE_DIR, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """与基线结果对比，返回变慢超过阈值的 (规模, 阶段, 基线耗时, 当前耗时) 列表"""
+    previous = {r['scale']: r for r in baseline.get('results', []) if 'stages' in r}
+    regressions = []
+    for result in results:
+        old = previous.get(result['scale'])
+        if 'stages' not in result or old is None:
+            continue
+        for stage, stats in result['stages'].items():
+            if stage not in old['stages']:
+                continue
+            before, after = old['stages'][stage]['median'], stats['median']
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append((result['scale'], stage, before, after))
+    return regressions
+
+
+def print_results(results):
+    print("\n" + "=" * 78)
+    print(f"{'规模':<16}{'阶段':<26}{'中位数(ms)':>14}{'最小值(ms)':>14}{'峰值(MB)':>10}")
+    print("-" * 78)
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['scale']:<16}跳过：{result['skipped']}")
+            continue
+        for stage, stats in result['stages'].items():
+            peak = stats.get('peak_mb')
+            print(f"{result['scale']:<16}{stage:<26}{stats['median'] * 1000:>14.2f}"
+                  f"{stats['min'] * 1000:>14.2f}{'-' if peak is None else f'{peak:.1f}':>10}")
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推荐系统微基准测试')
+    parser.add_argument('--scales', type=parse_scale, nargs='+',
+                        default=[parse_scale(s) for s in DEFAULT_SCALES], help='规模列表，如 1000x1000')
+    parser.add_argument('--sparsity', type=float, default=0.002, help='行为数占 用户数x商品数 的比例')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数')
+    parser.add_argument('--sample-users', type=int, default=20, help='单用户阶段的抽样用户数')
+    parser.add_argument('--e2e-users', type=int, default=3, help='端到端推荐的抽样用户数')
+    parser.add_argument('--max-memory-gb', type=float, default=4.0,
+                        help='估算内存超过该值的规模会被跳过（稠密矩阵实现）')
+    parser.add_argument('--skip-memory', action='store_true', help='不测量峰值内存')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--baseline', help='基线结果JSON，用于对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定为回退的变慢比例')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.scale = args.scales[0]
+        run_worker(args)
+        return
+
+    print("=" * 78)
+    print("推荐系统微基准测试")
+    print("=" * 78)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for users, products in args.scales:
+            scale = f'{users}x{products}'
+            estimated = estimate_bytes(users, products) / 1024 ** 3
+            if estimated > args.max_memory_gb:
+                print(f"跳过规模 {scale}：估算需要 {estimated:.1f} GB 内存")
+                results.append({'scale': scale, 'users': users, 'products': products,
+                                'skipped': f'估算内存 {estimated:.1f} GB 超过 {args.max_memory_gb} GB'})
+                continue
+            print(f"运行规模 {scale}（生成数据并测量）...")
+            results.append(run_scale((users, products), args, tmpdir))
+
+    print_results(results)
+
+    import numpy
+    report = {
+        'commit': git_commit(),
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'sparsity': args.sparsity,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\n与基线 {baseline.get('commit') or args.baseline} 对比（阈值 {args.threshold:.0%}）:")
+        if not regressions:
+            print("  未发现性能回退")
+            return
+        for scale, stage, before, after in regressions:
+            print(f"  {scale} {stage}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms "
+                  f"({after / before - 1:+.0%})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
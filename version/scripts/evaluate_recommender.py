@@ -1,196 +1,236 @@
 """
 推荐系统评估脚本
-计算准确率(Precision)、召回率(Recall)和F1分数
+按时间划分训练集/测试集，在训练集上训练一次后批量评估测试用户，
+计算 precision@k、recall@k、F1、NDCG@k、覆盖率和耗时
+
+用法:
+    python scripts/evaluate_recommender.py
+    python scripts/evaluate_recommender.py --split leave-last-out -k 20
+    python scripts/evaluate_recommender.py --cutoff 2025-06-01 --alpha 0.7 --json report.json
+    # 参数搜索：训练一次，并行评估 alpha × 生命周期提升 × 邻居数 的所有组合
+    python scripts/evaluate_recommender.py --sweep --alphas 0 0.25 0.5 0.75 1 --boosts 0 1 2 --neighbors 0 20 50
 """
+import argparse
+import json
 import os
 import sys
+from datetime import datetime, timezone as dt_timezone
+
 import django
-from collections import defaultdict
 
 # 设置Django环境
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'version.settings')
 django.setup()
 
-from shop.models import User, UserBehavior, Product
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from shop.evaluation import RANK_METRICS, SPLITS, evaluate, sweep
 from shop.recommender import RecommenderSystem
 
 
-def evaluate_recommender():
-    """评估推荐系统性能"""
+def get_grade(f1):
+    if f1 >= 0.7:
+        return "优秀"
+    elif f1 >= 0.5:
+        return "良好"
+    elif f1 >= 0.3:
+        return "中等"
+    return "需要改进"
+
+
+def parse_cutoff(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise argparse.ArgumentTypeError(f'无效的截止时间: {value}')
+        parsed = datetime(date.year, date.month, date.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def describe_split(report):
+    if report['split'] == 'temporal':
+        cutoff = timezone.localtime(datetime.fromtimestamp(report['cutoff'], dt_timezone.utc))
+        return f"时间切分（截止 {cutoff.strftime('%Y-%m-%d %H:%M')}）"
+    return "留一法（每个用户最后一次购买）"
+
+
+def print_report(report):
+    k = report['k']
+    metrics = report['metrics']
+    timings = report['timings']
+
     print("="*60)
-    print("推荐系统评估")
+    print("评估结果")
+    print("="*60)
+    print(f"划分方式: {describe_split(report)}")
+    print(f"训练行为数: {report['train_interactions']}，测试行为数: {report['test_interactions']}")
+    print(f"评估用户数: {report['users']}（训练集中无行为的用户: {report['cold_users']}）")
+    print(f"准确率 (Precision@{k}): {metrics['precision']['mean']:.4f}")
+    print(f"召回率 (Recall@{k}):    {metrics['recall']['mean']:.4f}")
+    print(f"F1分数 (F1@{k}):        {metrics['f1']['mean']:.4f}")
+    print(f"NDCG@{k}:               {metrics['ndcg']['mean']:.4f}")
+    print(f"命中率 (HitRate@{k}):   {metrics['hit_rate']['mean']:.4f}")
+    print(f"覆盖率 (Coverage):      {report['coverage']:.4f}")
     print("="*60)
-    
-    # 获取所有普通用户
-    users = User.objects.filter(is_superuser=False)
-    
-    if not users.exists():
-        print("错误：没有找到用户数据")
-        return
-    
-    # 初始化推荐系统
-    recommender = RecommenderSystem(alpha=0.5)
-    
-    # 存储评估指标
-    precision_scores = []
-    recall_scores = []
-    f1_scores = []
-    
-    print(f"\n开始评估 {users.count()} 个用户的推荐结果...\n")
-    
-    for user in users:
-        # 获取用户实际购买的商品
-        actual_purchases = set(
-            UserBehavior.objects.filter(
-                user=user,
-                behavior_type='purchase'
-            ).values_list('product_id', flat=True)
-        )
-        
-        if not actual_purchases:
-            continue
-        
-        # 获取推荐结果
-        recommendations = recommender.get_recommendations(user, top_n=10)
-        recommended_ids = set([p.id for p in recommendations])
-        
-        # 计算指标
-        if recommended_ids:
-            # 真正例（推荐且购买）
-            true_positives = len(recommended_ids & actual_purchases)
-            
-            # 准确率 = 推荐中实际购买的比例
-            precision = true_positives / len(recommended_ids) if recommended_ids else 0
-            
-            # 召回率 = 实际购买中被推荐的比例
-            recall = true_positives / len(actual_purchases) if actual_purchases else 0
-            
-            # F1分数
-            if precision + recall > 0:
-                f1 = 2 * (precision * recall) / (precision + recall)
-            else:
-                f1 = 0
-            
-            precision_scores.append(precision)
-            recall_scores.append(recall)
-            f1_scores.append(f1)
-    
-    # 计算平均值
-    if precision_scores:
-        avg_precision = sum(precision_scores) / len(precision_scores)
-        avg_recall = sum(recall_scores) / len(recall_scores)
-        avg_f1 = sum(f1_scores) / len(f1_scores)
-        
-        print("="*60)
-        print("评估结果")
-        print("="*60)
-        print(f"评估用户数: {len(precision_scores)}")
-        print(f"平均准确率 (Precision): {avg_precision:.4f} ({avg_precision*100:.2f}%)")
-        print(f"平均召回率 (Recall):    {avg_recall:.4f} ({avg_recall*100:.2f}%)")
-        print(f"平均F1分数 (F1-Score):  {avg_f1:.4f} ({avg_f1*100:.2f}%)")
-        print("="*60)
-        
-        # 详细统计
-        print("\n详细统计:")
-        print(f"准确率分布:")
-        print(f"  最小值: {min(precision_scores):.4f}")
-        print(f"  最大值: {max(precision_scores):.4f}")
-        print(f"  中位数: {sorted(precision_scores)[len(precision_scores)//2]:.4f}")
-        
-        print(f"\n召回率分布:")
-        print(f"  最小值: {min(recall_scores):.4f}")
-        print(f"  最大值: {max(recall_scores):.4f}")
-        print(f"  中位数: {sorted(recall_scores)[len(recall_scores)//2]:.4f}")
-        
-        print(f"\nF1分数分布:")
-        print(f"  最小值: {min(f1_scores):.4f}")
-        print(f"  最大值: {max(f1_scores):.4f}")
-        print(f"  中位数: {sorted(f1_scores)[len(f1_scores)//2]:.4f}")
-        
-        # 性能等级评估
-        print("\n" + "="*60)
-        print("性能评估")
-        print("="*60)
-        
-        if avg_f1 >= 0.7:
-            grade = "优秀"
-        elif avg_f1 >= 0.5:
-            grade = "良好"
-        elif avg_f1 >= 0.3:
-            grade = "中等"
-        else:
-            grade = "需要改进"
-        
-        print(f"综合评级: {grade}")
-        
-        # 推荐系统分析
-        print("\n推荐系统分析:")
-        if avg_precision > avg_recall:
-            print("- 推荐系统倾向于保守，推荐的商品质量较高但覆盖面较窄")
-        elif avg_recall > avg_precision:
-            print("- 推荐系统倾向于激进，推荐覆盖面广但精准度有待提高")
-        else:
-            print("- 推荐系统在准确率和召回率之间取得了良好平衡")
-        
-        # 算法说明
-        print("\n算法说明:")
-        print("- 使用基于用户的协同过滤 (User-based CF)")
-        print("- 使用基于商品的协同过滤 (Item-based CF)")
-        print("- 采用余弦相似度计算")
-        print("- 评分归一化处理")
-        print(f"- 加权融合 (alpha={recommender.alpha})")
-        print("- 生命周期推荐增强")
-        
-        print("\n" + "="*60)
-        
-        # 保存报告
-        save_report(avg_precision, avg_recall, avg_f1, len(precision_scores))
-        
-    else:
-        print("错误：没有足够的数据进行评估")
 
+    print("\n详细统计:")
+    for name, label in [('precision', '准确率'), ('recall', '召回率'), ('ndcg', 'NDCG')]:
+        stats = metrics[name]
+        print(f"{label}分布: 最小值 {stats['min']:.4f}  中位数 {stats['median']:.4f}  最大值 {stats['max']:.4f}")
+
+    print("\n耗时:")
+    print(f"  加载与划分: {timings['load_seconds']:.3f} 秒")
+    print(f"  训练（矩阵+相似度）: {timings['train_seconds']:.3f} 秒")
+    print(f"  生命周期计算: {timings['lifecycle_seconds']:.3f} 秒")
+    print(f"  批量打分: {timings['score_seconds']:.3f} 秒（{timings['ms_per_user']:.2f} 毫秒/用户）")
+
+    print("\n" + "="*60)
+    print(f"综合评级: {get_grade(metrics['f1']['mean'])}")
+    print("\n算法说明:")
+    for line in algorithm_notes(report):
+        print(line)
+    print("="*60)
+
+
+def algorithm_notes(report):
+    return [
+        "- 基于用户的协同过滤 (User-based CF)",
+        "- 基于商品的协同过滤 (Item-based CF)",
+        "- 余弦相似度计算",
+        "- 评分归一化",
+        f"- 加权融合 (alpha={report['alpha']})",
+        f"- 邻居数 (K={report['k_neighbors'] or '全部用户'})",
+        f"- 生命周期推荐增强 (boost={report['lifecycle_boost']})",
+    ]
+
+
+def save_report(report, json_path=None):
+    """保存评估报告（文本报告 + JSON报告）"""
+    report_path = os.path.join(BASE_DIR, 'evaluation_report.txt')
+    json_path = json_path or os.path.join(BASE_DIR, 'evaluation_report.json')
+    k = report['k']
+    metrics = report['metrics']
 
-def save_report(precision, recall, f1, user_count):
-    """保存评估报告"""
-    report_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        'evaluation_report.txt'
-    )
-    
     with open(report_path, 'w', encoding='utf-8') as f:
         f.write("="*60 + "\n")
         f.write("推荐系统评估报告\n")
         f.write("="*60 + "\n\n")
-        f.write(f"评估时间: {django.utils.timezone.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"评估用户数: {user_count}\n\n")
+        f.write(f"评估时间: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"划分方式: {describe_split(report)}\n")
+        f.write(f"评估用户数: {report['users']}\n\n")
         f.write("评估指标:\n")
-        f.write(f"  准确率 (Precision): {precision:.4f} ({precision*100:.2f}%)\n")
-        f.write(f"  召回率 (Recall):    {recall:.4f} ({recall*100:.2f}%)\n")
-        f.write(f"  F1分数 (F1-Score):  {f1:.4f} ({f1*100:.2f}%)\n\n")
-        
-        if f1 >= 0.7:
-            grade = "优秀"
-        elif f1 >= 0.5:
-            grade = "良好"
-        elif f1 >= 0.3:
-            grade = "中等"
-        else:
-            grade = "需要改进"
-        
-        f.write(f"综合评级: {grade}\n\n")
+        f.write(f"  准确率 (Precision@{k}): {metrics['precision']['mean']:.4f}\n")
+        f.write(f"  召回率 (Recall@{k}):    {metrics['recall']['mean']:.4f}\n")
+        f.write(f"  F1分数 (F1@{k}):        {metrics['f1']['mean']:.4f}\n")
+        f.write(f"  NDCG@{k}:               {metrics['ndcg']['mean']:.4f}\n")
+        f.write(f"  覆盖率 (Coverage):      {report['coverage']:.4f}\n\n")
+        f.write(f"综合评级: {get_grade(metrics['f1']['mean'])}\n\n")
         f.write("算法说明:\n")
-        f.write("- 基于用户的协同过滤 (User-based CF)\n")
-        f.write("- 基于商品的协同过滤 (Item-based CF)\n")
-        f.write("- 余弦相似度计算\n")
-        f.write("- 评分归一化\n")
-        f.write("- 加权融合 (alpha=0.5)\n")
-        f.write("- 生命周期推荐增强\n")
+        for line in algorithm_notes(report):
+            f.write(line + "\n")
         f.write("="*60 + "\n")
-    
+
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(report, generated_at=timezone.now().isoformat()), f,
+                  ensure_ascii=False, indent=2)
+
     print(f"\n评估报告已保存到: {report_path}")
+    print(f"JSON报告已保存到: {json_path}")
 
 
-if __name__ == '__main__':
-    evaluate_recommender()
+def print_sweep(results, data, rank_by, limit):
+    k = data.k
+    print("="*78)
+    print(f"参数搜索结果（{describe_split({'split': data.split.name, 'cutoff': data.split.cutoff})}，"
+          f"评估用户数: {len(data.eval_rows)}，按 {rank_by} 排序）")
+    print("="*78)
+    print(f"{'排名':<6}{'alpha':>8}{'boost':>8}{'K':>8}{f'P@{k}':>10}{f'R@{k}':>10}"
+          f"{f'NDCG@{k}':>10}{'HitRate':>10}{'覆盖率':>8}")
+    print("-"*78)
+    for rank, r in enumerate(results[:limit], start=1):
+        print(f"{rank:<6}{r['alpha']:>8.2f}{r['lifecycle_boost']:>8.2f}{r['k_neighbors'] or '全部':>8}"
+              f"{r['precision']:>10.4f}{r['recall']:>10.4f}{r['ndcg']:>10.4f}"
+              f"{r['hit_rate']:>10.4f}{r['coverage']:>10.4f}")
+    print("="*78)
+    timings = data.timings
+    print(f"训练 {timings['train_seconds']:.2f} 秒，协同过滤评分 {timings['cf_seconds']:.2f} 秒，"
+          f"{len(results)} 组参数 {timings['sweep_seconds']:.2f} 秒"
+          f"（{timings['configs_per_second']:.1f} 组/秒）")
+
+
+def run_sweep(args):
+    neighbors = [n or None for n in args.neighbors]
+    results, data = sweep(args.alphas, args.boosts, neighbors, split=args.split, k=args.k,
+                          test_ratio=args.test_ratio, cutoff=args.cutoff,
+                          processes=args.processes, rank_by=args.rank_by)
+    if not results:
+        print("错误：没有足够的数据进行评估")
+        return
+
+    print_sweep(results, data, args.rank_by, args.top)
+    json_path = args.json or os.path.join(BASE_DIR, 'evaluation_sweep.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'generated_at': timezone.now().isoformat(),
+            'split': data.split.name,
+            'cutoff': data.split.cutoff,
+            'k': data.k,
+            'users': len(data.eval_rows),
+            'rank_by': args.rank_by,
+            'timings': data.timings,
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n搜索结果已保存到: {json_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推荐系统离线评估')
+    parser.add_argument('--split', choices=SPLITS, default='temporal', help='训练/测试划分方式')
+    parser.add_argument('--test-ratio', type=float, default=0.2, help='时间切分时测试集所占比例')
+    parser.add_argument('--cutoff', type=parse_cutoff, help='时间切分的截止时间（优先于 --test-ratio）')
+    parser.add_argument('-k', type=int, default=10, help='推荐列表长度')
+    parser.add_argument('--alpha', type=float, default=0.5, help='用户/商品协同过滤融合权重')
+    parser.add_argument('--lifecycle-boost', type=float, default=2.0, help='生命周期商品的评分提升')
+    parser.add_argument('--neighbor-k', type=int, default=0, help='用户协同过滤的邻居数（0表示全部用户）')
+    parser.add_argument('--batch-size', type=int, default=256, help='每批打分的用户数')
+    parser.add_argument('--json', help='JSON报告路径（默认 evaluation_report.json / evaluation_sweep.json）')
+
+    sweep_group = parser.add_argument_group('参数搜索')
+    sweep_group.add_argument('--sweep', action='store_true', help='网格搜索 alpha、生命周期提升和邻居数')
+    sweep_group.add_argument('--alphas', type=float, nargs='+', default=[0, 0.25, 0.5, 0.75, 1])
+    sweep_group.add_argument('--boosts', type=float, nargs='+', default=[0, 0.5, 1, 2])
+    sweep_group.add_argument('--neighbors', type=int, nargs='+', default=[0, 10, 50],
+                             help='邻居数列表（0表示全部用户）')
+    sweep_group.add_argument('--processes', type=int, help='并行进程数（默认CPU核数）')
+    sweep_group.add_argument('--rank-by', choices=RANK_METRICS, default='ndcg', help='排序依据的指标')
+    sweep_group.add_argument('--top', type=int, default=20, help='显示前N组参数')
+    args = parser.parse_args()
+
+    print("="*60)
+    print("推荐系统评估")
+    print("="*60)
 
+    if args.sweep:
+        run_sweep(args)
+        return
+
+    recommender = RecommenderSystem(alpha=args.alpha, lifecycle_boost=args.lifecycle_boost,
+                                    k_neighbors=args.neighbor_k or None)
+    report = evaluate(recommender, split=args.split, k=args.k, test_ratio=args.test_ratio,
+                      cutoff=args.cutoff, batch_size=args.batch_size)
+    if report is None:
+        print("错误：没有足够的数据进行评估")
+        return
+
+    print_report(report)
+    save_report(report, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+商城HTTP压力测试脚本
+在临时数据库上生成测试数据并启动本地服务器，用 asyncio 并发模拟家庭成员
+“浏览 → 加购 → 结算”的访问流程，按 shop/urls.py 中的URL名称统计
+p50/p95/p99 延迟、吞吐量和错误率
+
+用法:
+    python scripts/load_test.py
+    python scripts/load_test.py --clients 32 --duration 60 --users 200 --products 2000
+    # 使用已有数据库（复制后使用，不修改原文件）
+    python scripts/load_test.py --source-db db.sqlite3 --clients 16
+    # 压测已启动的服务器（需已有测试数据，用户密码为 123456）
+    python scripts/load_test.py --url http://127.0.0.1:8000 --clients 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动本地服务器的命令，{port} 为监听端口
+SERVER_COMMANDS = {
+    'runserver': [sys.executable, 'manage.py', 'runserver', '127.0.0.1:{port}', '--noreload'],
+    # ASGI（单进程），首页/商品列表/商品详情使用异步视图；需要 pip install uvicorn
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'version.asgi:application',
+                '--host', '127.0.0.1', '--port', '{port}', '--no-access-log'],
+}
+# 生成数据的用户密码与 generate_test_data 一致
+PASSWORD = '123456'
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+SEARCH_TERMS = ['牛奶', '洗衣液', '面膜', '苹果', '纸尿裤', '猫粮', '耳机', '瑜伽垫']
+
+
+class HttpClient:
+    """最小的异步HTTP/1.1客户端：每个请求一个连接，自动保存Cookie，不跟随重定向"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+
+    async def request(self, method, path, data=None):
+        return await asyncio.wait_for(self._request(method, path, data), self.timeout)
+
+    async def _request(self, method, path, data):
+        body = urlencode(data).encode() if data else b''
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: close',
+            'User-Agent: shop-load-test',
+        ]
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        if body:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+            lines.append(f'Content-Length: {len(body)}')
+        if method == 'POST':
+            # Django的CSRF检查要求同源Referer（仅HTTPS）或Origin
+            lines.append(f'Origin: http://{self.host}:{self.port}')
+
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                name = name.strip().lower()
+                if name == 'set-cookie':
+                    for key, morsel in SimpleCookie(value.strip()).items():
+                        self.cookies[key] = morsel.value
+                headers[name] = value.strip()
+            body = await reader.read()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        return status, headers, body
+
+
+class Stats:
+    """按URL名称记录延迟和错误"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = {}
+
+    def record(self, name, seconds, error=None):
+        self.latencies.setdefault(name, []).append(seconds)
+        if error is not None:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self.error_samples.setdefault(name, error)
+
+    def summary(self, elapsed):
+        rows = {}
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            errors = self.errors.get(name, 0)
+            rows[name] = {
+                'requests': len(values),
+                'errors': errors,
+                'error_rate': errors / len(values),
+                'throughput': len(values) / elapsed,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+            if name in self.error_samples:
+                rows[name]['error_sample'] = self.error_samples[name]
+        return rows
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class VirtualUser:
+    """模拟一个家庭成员的会话"""
+
+    def __init__(self, client, username, product_ids, stats, args, rng):
+        self.client = client
+        self.username = username
+        self.product_ids = product_ids
+        self.stats = stats
+        self.args = args
+        self.rng = rng
+
+    async def call(self, name, path, method='GET', data=None):
+        started = time.perf_counter()
+        try:
+            status, headers, body = await self.client.request(method, path, data)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+            self.stats.record(name, time.perf_counter() - started, f'{type(e).__name__}: {e}')
+            return None, None
+        error = f'HTTP {status}' if status >= 400 else None
+        if status == 302 and urlsplit(headers.get('location', '')).path.startswith('/login/'):
+            error = '会话失效，被重定向到登录页'
+        self.stats.record(name, time.perf_counter() - started, error)
+        return status, body
+
+    async def login(self):
+        _, body = await self.call('login', '/login/')
+        match = CSRF_INPUT_RE.search((body or b'').decode('utf-8', 'replace'))
+        if not match:
+            return False
+        status, _ = await self.call('login', '/login/', 'POST', {
+            'csrfmiddlewaretoken': match.group(1),
+            'username': self.username,
+            'password': PASSWORD,
+        })
+        return status == 302 and 'sessionid' in self.client.cookies
+
+    async def think(self):
+        if self.args.think_ms:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_ms) / 1000)
+
+    async def session(self):
+        """一轮访问：首页 → 商品列表（部分带搜索）→ 若干商品详情 → 可能加购 → 可能结算"""
+        await self.call('home', '/')
+        await self.think()
+        if self.rng.random() < self.args.search_rate:
+            path = '/products/?' + urlencode({'search': self.rng.choice(SEARCH_TERMS)})
+        else:
+            path = '/products/'
+        await self.call('products', path)
+        await self.think()
+
+        viewed = [self.rng.choice(self.product_ids) for _ in range(self.rng.randint(1, 3))]
+        for product_id in viewed:
+            await self.call('product_detail', f'/product/{product_id}/')
+            await self.think()
+
+        if self.rng.random() < self.args.add_rate:
+            await self.call('add_to_cart', f'/cart/add/{viewed[-1]}/')
+            await self.think()
+            if self.rng.random() < self.args.checkout_rate:
+                await self.call('checkout', '/checkout/')
+                await self.think()
+
+    async def run(self, deadline):
+        while time.perf_counter() < deadline:
+            await self.session()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def prepare_database(args, sqlite_path, env):
+    """复制已有数据库或生成新的测试数据"""
+    if args.source_db:
+        shutil.copy(args.source_db, sqlite_path)
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                       cwd=BASE_DIR, env=env, check=True)
+        return
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                   cwd=BASE_DIR, env=env, check=True)
+    subprocess.run([
+        sys.executable, 'manage.py', 'generate_test_data',
+        '--families', str(args.families), '--users', str(args.users),
+        '--products', str(args.products), '--behaviors', str(args.behaviors),
+        '--orders', str(args.orders), '--seed', str(args.seed),
+    ], cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def load_fixtures(env, clients):
+    """读取参与压测的家庭成员和有库存的商品（在子进程中查询，避免本进程加载Django）"""
+    script = (
+        'import json; from shop.models import Product, User; '
+        'users = User.objects.filter(is_superuser=False, family__isnull=False).order_by("family_id", "id"); '
+        f'print(json.dumps({{"users": list(users.values_list("username", flat=True)[:{clients}]), '
+        '"products": list(Product.objects.filter(stock__gt=0).values_list("id", flat=True)[:2000])}))'
+    )
+    output = subprocess.run([sys.executable, 'manage.py', 'shell', '-c', script],
+                            cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def wait_for_server(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            status, _, _ = await HttpClient(host, port, 5).request('GET', '/login/')
+            if status < 500:
+                return
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit('错误：服务器未能在规定时间内启动')
+
+
+async def run_load(host, port, usernames, product_ids, args):
+    stats = Stats()
+    users = [
+        VirtualUser(HttpClient(host, port, args.timeout), username, product_ids, stats, args,
+                    random.Random(args.seed + index))
+        for index, username in enumerate(usernames)
+    ]
+    logged_in = await asyncio.gather(*(user.login() for user in users))
+    active = [user for user, ok in zip(users, logged_in) if ok]
+    if not active:
+        raise SystemExit('错误：没有用户登录成功')
+
+    # 登录阶段不计入吞吐量
+    stats.latencies.pop('login', None)
+    login_errors = stats.errors.pop('login', 0)
+    started = time.perf_counter()
+    await asyncio.gather(*(user.run(started + args.duration) for user in active))
+    elapsed = time.perf_counter() - started
+    return stats, elapsed, len(active), login_errors
+
+
+def print_summary(rows, elapsed, clients):
+    total = sum(row['requests'] for row in rows.values())
+    errors = sum(row['errors'] for row in rows.values())
+    print("\n" + "=" * 92)
+    print(f"{'URL名称':<18}{'请求数':>8}{'请求/秒':>10}{'错误率':>9}"
+          f"{'p50(ms)':>11}{'p95(ms)':>11}{'p99(ms)':>11}{'max(ms)':>11}")
+    print("-" * 92)
+    for name, row in sorted(rows.items()):
+        print(f"{name:<18}{row['requests']:>8}{row['throughput']:>10.1f}{row['error_rate']:>9.1%}"
+              f"{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}{row['p99_ms']:>11.1f}{row['max_ms']:>11.1f}")
+    print("-" * 92)
+    print(f"{'合计':<18}{total:>8}{total / elapsed:>10.1f}{(errors / total if total else 0):>9.1%}")
+    print("=" * 92)
+    print(f"并发用户: {clients}，测试时长: {elapsed:.1f} 秒")
+    for name, row in sorted(rows.items()):
+        if 'error_sample' in row:
+            print(f"  {name} 错误示例: {row['error_sample']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='商城HTTP压力测试')
+    parser.add_argument('--clients', type=int, default=16, help='并发模拟用户数（家庭成员）')
+    parser.add_argument('--duration', type=float, default=30.0, help='测试时长(秒)')
+    parser.add_argument('--think-ms', type=float, default=0, help='请求之间的平均思考时间(毫秒)')
+    parser.add_argument('--search-rate', type=float, default=0.3, help='商品列表带搜索词的比例')
+    parser.add_argument('--add-rate', type=float, default=0.3, help='浏览后加购的比例')
+    parser.add_argument('--checkout-rate', type=float, default=0.3, help='加购后结算的比例')
+    parser.add_argument('--timeout', type=float, default=30.0, help='单个请求超时(秒)')
+    parser.add_argument('--url', help='压测已启动的服务器，不再生成数据和启动服务器')
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='runserver',
+                        help='本地服务器类型')
+    parser.add_argument('--profile', help='服务器使用的 DJANGO_DB_PROFILE')
+    parser.add_argument('--source-db', help='复制该SQLite数据库作为测试数据（不修改原文件）')
+    parser.add_argument('--families', type=int, default=50, help='生成的家庭数量')
+    parser.add_argument('--users', type=int, default=100, help='生成的用户数量')
+    parser.add_argument('--products', type=int, default=1000, help='生成的商品数量')
+    parser.add_argument('--behaviors', type=int, default=20000, help='生成的行为数量')
+    parser.add_argument('--orders', type=int, default=1000, help='生成的订单数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("商城HTTP压力测试")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, DJANGO_SQLITE_PATH=os.path.join(tmpdir, 'loadtest.sqlite3'))
+        if args.profile:
+            env['DJANGO_DB_PROFILE'] = args.profile
+        if args.url:
+            env = dict(os.environ)
+
+        if not args.url:
+            print("准备测试数据...")
+            prepare_database(args, env['DJANGO_SQLITE_PATH'], env)
+        fixtures = load_fixtures(env, args.clients)
+        if not fixtures['users'] or not fixtures['products']:
+            raise SystemExit('错误：数据库中没有家庭成员或商品')
+
+        server = None
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            host, port = '127.0.0.1', free_port()
+            command = [part.format(port=port) for part in SERVER_COMMANDS[args.server]]
+            server = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_for_server(host, port))
+            print(f"服务器: http://{host}:{port}/，{len(fixtures['users'])} 个用户登录中...")
+            stats, elapsed, clients, login_errors = asyncio.run(
+                run_load(host, port, fixtures['users'], fixtures['products'], args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    rows = stats.summary(elapsed)
+    print_summary(rows, elapsed, clients)
+    if login_errors:
+        print(f"登录失败请求: {login_errors}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'server': args.url or args.server,
+                'profile': args.profile,
+                'clients': clients,
+                'duration': elapsed,
+                'login_errors': login_errors,
+                'total_rps': sum(row['requests'] for row in rows.values()) / elapsed,
+                'urls': rows,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
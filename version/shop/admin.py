@@ -1,10 +1,24 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
+from . import catalog, export
 from .models import (
     User, Family, FamilyProfile, Category, Product,
-    Cart, CartItem, Order, OrderItem, UserBehavior
+    Cart, CartItem, Order, OrderItem, UserBehavior, BehaviorAggregate, BehaviorArchive
 )
+from .pagination import EstimatedCountPaginator, KeysetChangeList
+from .routers import analytical_reads
 
 # 自定义Admin站点标题
 admin.site.site_header = '家用商品推荐系统 - 管理后台'
@@ -12,8 +26,70 @@ admin.site.site_title = '管理后台'
 admin.site.index_title = '欢迎使用家用商品推荐系统管理后台'
 
 
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(label='CSV文件', help_text='UTF-8编码，字段: ' + ', '.join(['id', *catalog.FIELDS]))
+    create_categories = forms.BooleanField(label='自动新建不存在的分类', required=False, initial=True)
+    dry_run = forms.BooleanField(label='试运行（只显示差异，不写入）', required=False, initial=True)
+    batch_size = forms.IntegerField(label='每批行数', min_value=1, max_value=10000, initial=1000)
+
+
+class StockAdjustmentForm(forms.Form):
+    operation = forms.ChoiceField(
+        label='操作', choices=[(key, label) for key, (label, _) in catalog.STOCK_OPERATIONS.items()])
+    quantity = forms.IntegerField(label='数量', min_value=0)
+    batch_size = forms.IntegerField(label='每批行数', min_value=1, max_value=10000, initial=1000)
+
+
+class ReadReplicaAdminMixin:
+    """列表页的只读浏览走只读副本，提交（批量操作、列表编辑）仍在主库"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with analytical_reads():
+            response = super().changelist_view(request, extra_context)
+            # 结果集在模板渲染时才查询，需在副本范围内渲染
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class LargeTableAdminMixin:
+    """只追加的大表：估算总数、按 keyset_ordering 键集分页，不统计未筛选的总行数"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset_ordering = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class ExportAdminMixin:
+    """流式导出选中（或筛选出的全部）记录为CSV/JSONL，可与时间筛选配合按时间范围导出"""
+    actions = ['export_csv', 'export_jsonl']
+    export_name = None
+    export_fields = ()
+    export_rows = None
+
+    def export_response(self, queryset, fmt):
+        rows = self.export_rows(queryset)
+        response = StreamingHttpResponse(
+            export.stream(rows, self.export_fields, fmt), content_type=export.FORMATS[fmt])
+        filename = f'{self.export_name}-{timezone.localtime():%Y%m%d-%H%M%S}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='导出为CSV')
+    def export_csv(self, request, queryset):
+        return self.export_response(queryset, 'csv')
+
+    @admin.action(description='导出为JSONL')
+    def export_jsonl(self, request, queryset):
+        return self.export_response(queryset, 'jsonl')
+
+
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ReadReplicaAdminMixin, BaseUserAdmin):
     list_display = ['username', 'email', 'family', 'is_staff', 'is_superuser', 'date_joined']
     list_filter = ['is_staff', 'is_superuser', 'family', 'date_joined']
     search_fields = ['username', 'email', 'family__name']
@@ -30,68 +106,93 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(Family)
-class FamilyAdmin(admin.ModelAdmin):
+class FamilyAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'created_at', 'member_count', 'has_profile', 'has_cart']
     search_fields = ['name']
     ordering = ['-created_at']
     list_per_page = 20
     readonly_fields = ['created_at']
     
+    def get_queryset(self, request):
+        # 列表列在一条查询中算出，避免每行再查成员、画像和购物车
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            _member_count=Count('members'),
+            _has_profile=Exists(FamilyProfile.objects.filter(family=OuterRef('pk'))),
+            _has_cart=Exists(Cart.objects.filter(family=OuterRef('pk'))),
+        )
+    
     def member_count(self, obj):
-        count = obj.members.count()
+        count = obj._member_count
         return format_html('<span style="color: #667eea; font-weight: bold;">{}</span>', count)
     member_count.short_description = '成员数量'
+    member_count.admin_order_field = '_member_count'
     
     def has_profile(self, obj):
-        has = hasattr(obj, 'profile')
+        has = obj._has_profile
         color = 'green' if has else 'red'
         text = '✓' if has else '✗'
         return format_html('<span style="color: {}; font-size: 16px;">{}</span>', color, text)
     has_profile.short_description = '有画像'
+    has_profile.admin_order_field = '_has_profile'
     
     def has_cart(self, obj):
-        has = hasattr(obj, 'cart')
+        has = obj._has_cart
         color = 'green' if has else 'red'
         text = '✓' if has else '✗'
         return format_html('<span style="color: {}; font-size: 16px;">{}</span>', color, text)
     has_cart.short_description = '有购物车'
+    has_cart.admin_order_field = '_has_cart'
 
 
 @admin.register(FamilyProfile)
-class FamilyProfileAdmin(admin.ModelAdmin):
+class FamilyProfileAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['family', 'get_categories', 'category_count']
     filter_horizontal = ['preferred_categories']
     search_fields = ['family__name']
     list_per_page = 20
     
+    def get_queryset(self, request):
+        # 偏好分类整页一次预取，名称和数量都从预取结果中取
+        qs = super().get_queryset(request)
+        return qs.select_related('family').prefetch_related('preferred_categories').annotate(
+            _category_count=Count('preferred_categories'),
+        )
+    
     def get_categories(self, obj):
-        categories = obj.preferred_categories.all()[:5]
+        categories = obj.preferred_categories.all()
         if categories:
-            return ', '.join([c.name for c in categories]) + ('...' if obj.preferred_categories.count() > 5 else '')
+            return ', '.join([c.name for c in categories[:5]]) + ('...' if obj._category_count > 5 else '')
         return '未设置'
     get_categories.short_description = '偏好分类'
     
     def category_count(self, obj):
-        count = obj.preferred_categories.count()
+        count = obj._category_count
         return format_html('<span style="color: #667eea; font-weight: bold;">{}</span>', count)
     category_count.short_description = '分类数量'
+    category_count.admin_order_field = '_category_count'
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'description', 'product_count']
     search_fields = ['name', 'description']
     ordering = ['name']
     list_per_page = 20
     
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(_product_count=Count('products'))
+    
     def product_count(self, obj):
-        count = obj.products.count()
+        count = obj._product_count
         return format_html('<span style="color: #667eea; font-weight: bold;">{}</span>', count)
     product_count.short_description = '商品数量'
+    product_count.admin_order_field = '_product_count'
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'category', 'price_display', 'stock', 'lifecycle', 'created_at']
     list_filter = ['category', 'created_at']
     search_fields = ['name', 'description']
@@ -99,6 +200,7 @@ class ProductAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
     list_per_page = 50
     readonly_fields = ['created_at']
+    actions = ['adjust_stock']
     
     fieldsets = (
         ('基本信息', {
@@ -120,6 +222,88 @@ class ProductAdmin(admin.ModelAdmin):
     def price_display(self, obj):
         return format_html('<span style="color: #667eea; font-weight: bold;">¥{}</span>', obj.price)
     price_display.short_description = '价格'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('category')
+    
+    # ---- 批量导入和库存调整 ----
+    
+    # 试运行报告最多展示的变更行数
+    report_limit = 200
+    
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='shop_product_import'),
+        ]
+        return urls + super().get_urls()
+    
+    def timing_message(self, timings):
+        total = sum(t.seconds for t in timings)
+        batches = '，'.join(f'{t.operation} {t.rows} 行 {t.seconds * 1000:.1f}ms' for t in timings[:20])
+        more = f' 等 {len(timings)} 批' if len(timings) > 20 else ''
+        return f'共 {len(timings)} 批，用时 {total * 1000:.1f}ms（{batches}{more}）'
+    
+    def import_view(self, request):
+        """CSV批量导入商品（新建或更新），可先试运行查看差异"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        plan = None
+        if request.method == 'POST' and form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig')
+            try:
+                plan = catalog.plan_import(
+                    catalog.read_csv(stream), create_categories=form.cleaned_data['create_categories'])
+            except (catalog.CatalogError, UnicodeDecodeError) as e:
+                form.add_error('file', str(e))
+            if plan is not None and not form.cleaned_data['dry_run']:
+                timings = catalog.apply_import(plan, form.cleaned_data['batch_size'])
+                self.message_user(request, (
+                    f'已新建 {len(plan.creates)} 个商品、更新 {len(plan.updates)} 个商品、'
+                    f'新建 {len(plan.new_categories)} 个分类；{self.timing_message(timings)}'
+                ), messages.SUCCESS)
+                if plan.errors:
+                    self.message_user(request, f'{len(plan.errors)} 行无效已跳过：' + '；'.join(
+                        f'第{line}行 {error}' for line, error in plan.errors[:20]), messages.WARNING)
+                return HttpResponseRedirect(reverse('admin:shop_product_changelist'))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': '批量导入商品',
+            'form': form,
+            'plan': plan,
+            'fields': catalog.FIELDS,
+            'report_limit': self.report_limit,
+        }
+        return TemplateResponse(request, 'admin/shop/product/import_catalog.html', context)
+    
+    @admin.action(description='批量调整库存', permissions=['change'])
+    def adjust_stock(self, request, queryset):
+        """先试运行展示库存差异，确认后按批写入"""
+        form = StockAdjustmentForm(request.POST if 'operation' in request.POST else None)
+        changes = None
+        if form.is_valid():
+            operation, quantity = form.cleaned_data['operation'], form.cleaned_data['quantity']
+            changes = catalog.plan_stock_adjustment(queryset, operation, quantity)
+            if 'apply' in request.POST:
+                timings = catalog.apply_stock_adjustment(changes, form.cleaned_data['batch_size'])
+                self.message_user(request, (
+                    f'已调整 {len(changes)} 个商品的库存（{catalog.STOCK_OPERATIONS[operation][0]} {quantity}）；'
+                    f'{self.timing_message(timings)}'
+                ), messages.SUCCESS)
+                return None
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': '批量调整库存',
+            'form': form,
+            'changes': changes,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'product_count': queryset.count(),
+            'report_limit': self.report_limit,
+        }
+        return TemplateResponse(request, 'admin/shop/product/adjust_stock.html', context)
 
 
 class CartItemInline(admin.TabularInline):
@@ -128,13 +312,16 @@ class CartItemInline(admin.TabularInline):
     readonly_fields = ['product', 'quantity', 'added_at', 'get_total_price']
     can_delete = True
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
     def get_total_price(self, obj):
         return f'¥{obj.get_total_price()}'
     get_total_price.short_description = '小计'
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['family', 'get_items_count', 'get_total_price', 'updated_at']
     search_fields = ['family__name']
     ordering = ['-updated_at']
@@ -142,15 +329,30 @@ class CartAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        # 商品数量和总价在数据库中汇总，与 Cart.get_items_count/get_total_price 结果一致
+        qs = super().get_queryset(request)
+        return qs.select_related('family').annotate(
+            _items_count=Coalesce(Sum('items__quantity'), 0),
+            _total_price=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(0), output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+    
     def get_items_count(self, obj):
-        count = obj.get_items_count()
+        count = obj._items_count
         return format_html('<span style="color: #667eea; font-weight: bold;">{}</span>', count)
     get_items_count.short_description = '商品数量'
+    get_items_count.admin_order_field = '_items_count'
     
     def get_total_price(self, obj):
-        price = obj.get_total_price()
+        # SQLite 上的乘积汇总为浮点数，统一保留两位小数
+        price = f'{obj._total_price:.2f}'
         return format_html('<span style="color: #667eea; font-weight: bold;">¥{}</span>', price)
     get_total_price.short_description = '总价'
+    get_total_price.admin_order_field = '_total_price'
 
 
 class OrderItemInline(admin.TabularInline):
@@ -159,14 +361,20 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ['product', 'quantity', 'price', 'purchase_date', 'get_total_price']
     can_delete = False
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
     def get_total_price(self, obj):
         return f'¥{obj.get_total_price()}'
     get_total_price.short_description = '小计'
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ExportAdminMixin, ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['id', 'family', 'user', 'status_display', 'total_price_display', 'created_at']
+    export_name = 'orders'
+    export_fields = export.ORDER_FIELDS
+    export_rows = staticmethod(export.order_rows)
     list_filter = ['status', 'created_at']
     search_fields = ['family__name', 'user__username', 'id']
     ordering = ['-created_at']
@@ -187,6 +395,10 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # user 可为空，不会被列表页自动 select_related
+        return super().get_queryset(request).select_related('family', 'user')
+    
     def status_display(self, obj):
         status_colors = {
             'pending': '#ffa500',
@@ -208,11 +420,16 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserBehavior)
-class UserBehaviorAdmin(admin.ModelAdmin):
+class UserBehaviorAdmin(ExportAdminMixin, LargeTableAdminMixin, ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'product', 'behavior_type_display', 'get_score_display', 'timestamp']
+    export_name = 'behaviors'
+    export_fields = export.BEHAVIOR_FIELDS
+    export_rows = staticmethod(export.behavior_rows)
     list_filter = ['behavior_type', 'timestamp']
     search_fields = ['user__username', 'product__name']
     ordering = ['-timestamp']
+    # 对应索引 behavior_time_idx
+    keyset_ordering = ('-timestamp', '-id')
     list_per_page = 100
     readonly_fields = ['timestamp']
     
@@ -225,6 +442,9 @@ class UserBehaviorAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'product')
+    
     def behavior_type_display(self, obj):
         behavior_colors = {
             'view': '#17a2b8',
@@ -244,9 +464,44 @@ class UserBehaviorAdmin(admin.ModelAdmin):
     get_score_display.short_description = '评分'
 
 
+@admin.register(BehaviorAggregate)
+class BehaviorAggregateAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
+    """已压缩分区的行为汇总（只读，由 compact_behaviors 命令写入）"""
+    list_display = ['user', 'product', 'view_count', 'add_to_cart_count', 'purchase_count',
+                    'get_score', 'last_timestamp']
+    search_fields = ['user__username', 'product__name']
+    list_per_page = 100
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'product')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_score(self, obj):
+        return obj.get_score()
+    get_score.short_description = '评分'
+
+
+@admin.register(BehaviorArchive)
+class BehaviorArchiveAdmin(admin.ModelAdmin):
+    """压缩时写出的归档文件（只读）"""
+    list_display = ['period', 'rows', 'first_id', 'last_id', 'path', 'created_at']
+    ordering = ['-period', '-id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # 自定义CartItem的Admin（如果需要单独管理）
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'added_at', 'get_total_price']
     list_filter = ['added_at']
     search_fields = ['cart__family__name', 'product__name']
@@ -254,6 +509,10 @@ class CartItemAdmin(admin.ModelAdmin):
     list_per_page = 50
     readonly_fields = ['added_at']
     
+    def get_queryset(self, request):
+        # 购物车名称包含家庭名称
+        return super().get_queryset(request).select_related('cart__family', 'product')
+    
     def get_total_price(self, obj):
         return format_html('<span style="color: #667eea; font-weight: bold;">¥{}</span>', obj.get_total_price())
     get_total_price.short_description = '小计'
@@ -261,7 +520,7 @@ class CartItemAdmin(admin.ModelAdmin):
 
 # 自定义OrderItem的Admin（如果需要单独管理）
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ReadReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price', 'purchase_date', 'get_total_price']
     list_filter = ['purchase_date']
     search_fields = ['order__id', 'product__name']
@@ -269,6 +528,10 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_per_page = 50
     readonly_fields = ['purchase_date']
     
+    def get_queryset(self, request):
+        # 订单名称包含家庭名称
+        return super().get_queryset(request).select_related('order__family', 'product')
+    
     def get_total_price(self, obj):
         return format_html('<span style="color: #667eea; font-weight: bold;">¥{}</span>', obj.get_total_price())
     get_total_price.short_description = '小计'
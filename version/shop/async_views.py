@@ -0,0 +1,205 @@
+"""
+首页、商品列表和商品详情的异步版本 - ASGI部署时替换 shop.views 中的同步版本（见 shop/urls.py）
+
+页面输出与同步版本相同。互不依赖的数据（推荐、热门商品、购物车数量、相似商品、片段缓存版本号）
+用 asyncio.gather 同时发起；片段缓存已命中的部分（推荐块、商品网格）不加载。
+浏览行为交给后台写入线程，不等待写入完成就返回响应；在条件GET之前记录，返回304时也记录。
+
+Django 4.2 的异步ORM和缓存接口内部通过 sync_to_async 调用同步实现，同一请求内的数据库访问
+仍在该请求的同步线程中依次执行；收益来自等待期间不占用工作线程，以及行为写入移出了请求路径。
+后台写入依赖常驻的事件循环，只应在ASGI服务器下使用。
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.http import Http404
+from django.shortcuts import render
+from django.utils.functional import SimpleLazyObject
+
+from . import catalog_cache, fragments
+from .behaviors import record_behavior
+from .conditional import catalog_page
+from .models import CartItem, Category, Product
+from .recommender import get_popular_products, get_user_recommendations
+from .search import search_products
+
+logger = logging.getLogger(__name__)
+
+# 后台写入使用单独的线程（一个数据库连接），写入按提交顺序执行
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shop-writer')
+# 保存未完成的后台任务的引用，避免任务在完成前被回收
+_background_tasks = set()
+
+
+def login_required(view):
+    """异步视图的登录检查（Django 4.2 的 login_required 不支持异步视图）"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # 在同步线程中加载 request.user（会话和用户缓存），之后的属性访问不再查询
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _write(func, *args):
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def fire_and_forget(func, *args):
+    """在后台写入线程执行 func(*args)，不等待结果；失败只记录日志"""
+    task = asyncio.create_task(sync_to_async(_write, thread_sensitive=False, executor=_writer)(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('后台写入失败', exc_info=task.exception())
+
+
+async def drain():
+    """等待所有未完成的后台写入（测试和进程退出前使用）"""
+    while _background_tasks:
+        await asyncio.gather(*list(_background_tasks), return_exceptions=True)
+
+
+async def get_cart_count(family_id):
+    """购物车商品数量（一次聚合查询，没有家庭或购物车时为0）"""
+    if not family_id:
+        return 0
+    result = await CartItem.objects.filter(cart__family_id=family_id).aaggregate(total=Sum('quantity'))
+    return result['total'] or 0
+
+
+def records_product_view(view):
+    """异步版的 behaviors.records_product_view：浏览行为交给后台写入线程"""
+    @wraps(view)
+    async def wrapper(request, product_id, *args, **kwargs):
+        product = await sync_to_async(catalog_cache.get_product)(product_id)
+        if product is not None:
+            fire_and_forget(record_behavior, request.user, product, 'view')
+        return await view(request, product_id, *args, **kwargs)
+    return wrapper
+
+
+async def _none():
+    return None
+
+
+@login_required
+async def home(request):
+    """首页"""
+    user = request.user
+    catalog_version, profile_version, recommendation_version = await asyncio.gather(
+        sync_to_async(catalog_cache.get_version)(),
+        sync_to_async(fragments.get_version)(fragments.FAMILY_PROFILE, user.family_id),
+        sync_to_async(fragments.get_version)(fragments.RECOMMENDATIONS, user.family_id),
+    )
+    # 与 home.html 中推荐块的 {% cache %} 参数一致
+    recommendations_cached = await cache.ahas_key(make_template_fragment_key(
+        'home_recommendations', [user.id, recommendation_version, catalog_version]))
+
+    recommendations, popular_products, cart_count = await asyncio.gather(
+        _none() if recommendations_cached else sync_to_async(get_user_recommendations)(user, top_n=10),
+        sync_to_async(get_popular_products)(top_n=8),
+        get_cart_count(user.family_id),
+    )
+    if recommendations is None:
+        # 片段可能在检查之后过期，渲染时再计算
+        recommendations = SimpleLazyObject(lambda: get_user_recommendations(user, top_n=10))
+
+    context = {
+        'user': user,
+        # 家庭画像块的片段缓存未命中时才在渲染中查询
+        'profile_categories': (Category.objects.filter(families__family_id=user.family_id)
+                               if user.family_id else Category.objects.none()),
+        'recommendations': recommendations,
+        'popular_products': popular_products,
+        'cart_count': cart_count,
+        'catalog_version': catalog_version,
+        'profile_version': profile_version,
+        'recommendation_version': recommendation_version,
+    }
+    return await sync_to_async(render)(request, 'home.html', context)
+
+
+@login_required
+@catalog_page
+async def products(request):
+    """商品浏览页面"""
+    category_id = request.GET.get('category')
+    search_query = request.GET.get('search', '')
+
+    categories, catalog_version, stock_version = await asyncio.gather(
+        sync_to_async(catalog_cache.get_categories)(),
+        sync_to_async(catalog_cache.get_version)(),
+        sync_to_async(fragments.get_version)(fragments.STOCK, 'all'),
+    )
+    # 与 products.html 中商品网格的 {% cache %} 参数一致
+    grid_cached = await cache.ahas_key(make_template_fragment_key(
+        'product_grid', [category_id, search_query, catalog_version, stock_version]))
+
+    products_list = Product.objects.select_related('category')
+    if category_id:
+        products_list = products_list.filter(category_id=category_id)
+    if search_query:
+        # 全文检索（原生SQL）在同步线程中执行，结果按相关度排序
+        products_list = await sync_to_async(search_products)(products_list, search_query)
+    else:
+        products_list = products_list.order_by('-created_at')
+
+    async def load_products():
+        return [product async for product in products_list]
+
+    loaded, cart_count = await asyncio.gather(
+        _none() if grid_cached else load_products(),
+        get_cart_count(request.user.family_id),
+    )
+
+    context = {
+        # 网格已缓存时传入未求值的查询集，片段过期时在渲染中查询
+        'products': products_list if loaded is None else loaded,
+        'categories': categories,
+        'selected_category': category_id,
+        'search_query': search_query,
+        'cart_count': cart_count,
+        'catalog_version': catalog_version,
+        'stock_version': stock_version,
+    }
+    return await sync_to_async(render)(request, 'products.html', context)
+
+
+@login_required
+@records_product_view
+@catalog_page
+async def product_detail(request, product_id):
+    """商品详情"""
+    product = await sync_to_async(catalog_cache.get_product)(product_id)
+    if product is None:
+        raise Http404('商品不存在')
+
+    similar_products, cart_count = await asyncio.gather(
+        sync_to_async(catalog_cache.get_similar_products)(product, limit=4),
+        get_cart_count(request.user.family_id),
+    )
+
+    context = {
+        'product': product,
+        'similar_products': similar_products,
+        'cart_count': cart_count,
+    }
+    return await sync_to_async(render)(request, 'product_detail.html', context)
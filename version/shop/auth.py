@@ -0,0 +1,36 @@
+"""
+认证后端 - 带缓存的用户查询
+
+默认的 ModelBackend 每个请求都会按会话中的用户ID查询一次用户表，访问
+user.family 时再查一次家庭表。这里把用户连同家庭一起缓存，用户或家庭
+保存、删除时失效（见 shop.signals）。
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+UserModel = get_user_model()
+
+
+def user_cache_key(user_id):
+    return f'shop:auth:user:{user_id}'
+
+
+def invalidate_user(*user_ids):
+    """删除用户缓存"""
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """按用户ID读取时优先使用缓存，并预先关联家庭"""
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = UserModel._default_manager.select_related('family').filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, 'SHOP_USER_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,14 @@
+"""
+SQLite数据库后端 - 事务以 BEGIN IMMEDIATE 开始
+
+默认的 BEGIN（DEFERRED）事务先读后写时需要升级锁，WAL模式下若其他连接已提交写入，
+升级会立即失败（database is locked），busy_timeout 无法生效。结算等读后写的事务
+在开始时即获取写锁，并发写入改为排队等待。
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
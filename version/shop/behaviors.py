@@ -0,0 +1,61 @@
+"""
+用户行为记录 - 网页产生的行为统一经 record_behavior() 写入
+
+同一用户对同一商品的同类行为在去重窗口内只写入一次：刷新、后退和爬虫产生的重复浏览不会放大
+UserBehavior 表和评分矩阵。最近的事件记在共享缓存中（cache.add 带过期时间，多进程间原子），
+窗口按行为类型配置（settings.SHOP_BEHAVIOR_DEDUP），0 表示不去重；被去重的写入计入
+shop_behaviors_suppressed_total 指标。
+
+商品详情页带条件GET（shop.conditional），浏览行为由 records_product_view 在条件判断之前记录，
+返回304时同样记录，重复浏览仍由去重窗口过滤。
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import catalog_cache, metrics
+from .models import UserBehavior
+
+DEFAULT_WINDOWS = {
+    'view': 1800,        # 30分钟内的重复浏览只记一次
+    'add_to_cart': 0,    # 每次加购都增加数量，不去重
+    'purchase': 0,
+}
+RECENT_KEY = 'shop:behavior:recent:{}:{}:{}'
+
+
+def get_dedup_windows():
+    return {**DEFAULT_WINDOWS, **getattr(settings, 'SHOP_BEHAVIOR_DEDUP', {})}
+
+
+def record_behavior(user, product, behavior_type, source='web'):
+    """
+    记录一条用户行为
+    :return: 写入的 UserBehavior；在去重窗口内重复时返回None
+    """
+    window = get_dedup_windows().get(behavior_type, 0)
+    key = RECENT_KEY.format(behavior_type, user.pk, product.pk)
+    if window and not cache.add(key, 1, window):
+        metrics.BEHAVIORS_SUPPRESSED.inc(behavior_type=behavior_type, source=source)
+        return None
+    try:
+        behavior = UserBehavior.objects.create(user=user, product=product, behavior_type=behavior_type)
+    except Exception:
+        # 写入失败时不占用窗口，下次仍可写入
+        if window:
+            cache.delete(key)
+        raise
+    metrics.BEHAVIORS_INSERTED.inc(behavior_type=behavior_type, source=source)
+    return behavior
+
+
+def records_product_view(view):
+    """记录商品详情的浏览行为（放在 catalog_page 之外，304响应也记录）"""
+    @wraps(view)
+    def wrapper(request, product_id, *args, **kwargs):
+        product = catalog_cache.get_product(product_id)
+        if product is not None:
+            record_behavior(request.user, product, 'view')
+        return view(request, product_id, *args, **kwargs)
+    return wrapper
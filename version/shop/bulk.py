@@ -0,0 +1,35 @@
+"""
+批量写入工具 - 供数据生成、导入等大批量操作使用
+"""
+from contextlib import contextmanager
+from itertools import islice
+
+
+def batched(iterable, size):
+    """把可迭代对象切分为长度不超过size的列表"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    临时关闭模型上的 auto_now / auto_now_add
+    bulk_create 默认会把这些字段覆盖为当前时间，导入历史数据时需要保留原始时间
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
@@ -0,0 +1,215 @@
+"""
+商品目录批量维护 - CSV导入商品、批量调整库存
+
+两者都先生成变更计划（可作为试运行的差异报告展示），确认后按批 bulk_create / bulk_update 写入，
+并记录每批耗时。批量写入不会触发模型信号，写入后由这里负责更新检索索引和目录缓存版本号。
+
+CSV字段: id（可选，更新指定商品）, name, category（分类名称）, price, stock, lifecycle, description, image
+没有 id 的行按（分类, 名称）匹配已有商品，匹配不到则新建；更新时空单元格表示不修改该字段。
+"""
+import csv
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import catalog_cache, search
+from .bulk import batched
+from .models import Category, Product
+
+FIELDS = ['name', 'category', 'price', 'stock', 'lifecycle', 'description', 'image']
+REQUIRED_FOR_CREATE = ['name', 'category', 'price']
+STOCK_OPERATIONS = {
+    'set': ('设为', lambda stock, quantity: quantity),
+    'add': ('增加', lambda stock, quantity: stock + quantity),
+    'subtract': ('减少', lambda stock, quantity: max(stock - quantity, 0)),
+}
+# IN 查询每次最多带的参数个数
+LOOKUP_CHUNK = 500
+
+BatchTiming = namedtuple('BatchTiming', ['operation', 'rows', 'seconds'])
+
+
+class CatalogError(ValueError):
+    """无效的导入行"""
+
+
+class ImportPlan:
+    """导入计划：新建/更新的商品、需新建的分类和无效行"""
+
+    def __init__(self):
+        self.creates = []        # [Product]
+        self.updates = []        # [(Product, {字段: (原值, 新值)})]
+        self.unchanged = 0
+        self.new_categories = []
+        self.errors = []         # [(行号, 错误)]
+
+    @property
+    def update_fields(self):
+        return sorted({field for _, changes in self.updates for field in changes})
+
+
+def read_csv(stream):
+    """逐行产出 (行号, 字典)，行号与文件行号一致（表头为第1行）"""
+    reader = csv.DictReader(stream)
+    fieldnames = reader.fieldnames or []
+    if 'id' not in fieldnames and 'name' not in fieldnames:
+        raise CatalogError('CSV需要 id 或 name 列')
+    for line_no, row in enumerate(reader, start=2):
+        yield line_no, {k.strip(): (v or '').strip() for k, v in row.items() if k}
+
+
+def parse_value(field, value):
+    try:
+        if field == 'price':
+            price = Decimal(value)
+            if price < 0:
+                raise CatalogError(f'价格不能为负: {value}')
+            return price.quantize(Decimal('0.01'))
+        if field in ('stock', 'lifecycle'):
+            number = int(value)
+            if number < 0:
+                raise CatalogError(f'{field} 不能为负: {value}')
+            return number
+    except (InvalidOperation, ValueError):
+        raise CatalogError(f'无效的 {field}: {value!r}')
+    return value
+
+
+def _lookup(queryset, field, values):
+    """按 field__in 分块查询"""
+    result = []
+    for chunk in batched(sorted(set(values)), LOOKUP_CHUNK):
+        result.extend(queryset.filter(**{f'{field}__in': chunk}))
+    return result
+
+
+def plan_import(rows, create_categories=True):
+    """
+    根据CSV行生成导入计划（只读）
+    :param rows: (行号, 字典) 的可迭代对象
+    :param create_categories: 分类不存在时是否新建，否则记为无效行
+    """
+    plan = ImportPlan()
+    rows = list(rows)
+
+    # 一次查出涉及的全部分类和商品
+    categories = {c.name: c for c in _lookup(
+        Category.objects.only('id', 'name'), 'name', [r['category'] for _, r in rows if r.get('category')])}
+    products = Product.objects.select_related('category')
+    by_id = {p.id: p for p in _lookup(
+        products, 'id', [int(r['id']) for _, r in rows if r.get('id', '').isdigit()])}
+    by_name = {}
+    for product in _lookup(products, 'name', [r['name'] for _, r in rows if r.get('name') and not r.get('id')]):
+        by_name.setdefault((product.category.name, product.name), product)
+
+    for line_no, row in rows:
+        try:
+            values = {f: parse_value(f, row[f]) for f in FIELDS if f != 'category' and row.get(f)}
+            category_name = row.get('category')
+            if category_name:
+                if category_name not in categories:
+                    if not create_categories:
+                        raise CatalogError(f'分类不存在: {category_name}')
+                    categories[category_name] = Category(name=category_name)
+                    plan.new_categories.append(categories[category_name])
+                values['category'] = categories[category_name]
+
+            if row.get('id'):
+                if not row['id'].isdigit() or int(row['id']) not in by_id:
+                    raise CatalogError(f"商品不存在: {row['id']}")
+                product = by_id[int(row['id'])]
+            else:
+                product = by_name.get((category_name, values.get('name')))
+
+            if product is None:
+                missing = [f for f in REQUIRED_FOR_CREATE if f not in values]
+                if missing:
+                    raise CatalogError(f"新建商品缺少字段: {', '.join(missing)}")
+                product = Product(**values)
+                plan.creates.append(product)
+                # 同一文件中重复的行更新这个新商品，而不是再新建一个
+                by_name[(category_name, product.name)] = product
+                continue
+            if product.pk is None:
+                for field, value in values.items():
+                    setattr(product, field, value)
+                continue
+
+            changes = {}
+            for field, value in values.items():
+                old = getattr(product, field)
+                if old != value:
+                    changes[field] = (old, value)
+                    setattr(product, field, value)
+            if changes:
+                plan.updates.append((product, changes))
+            else:
+                plan.unchanged += 1
+        except CatalogError as e:
+            plan.errors.append((line_no, str(e)))
+    return plan
+
+
+def reindex(product_ids, batch_size=2000):
+    """批量写入跳过了 post_save 信号，提交后手动更新检索索引"""
+    product_ids = list(product_ids)
+
+    def run():
+        for chunk in batched(product_ids, batch_size):
+            search.index_products(chunk)
+    transaction.on_commit(run)
+
+
+def apply_import(plan, batch_size=1000):
+    """执行导入计划，返回每批耗时 [BatchTiming]"""
+    timings = []
+    with transaction.atomic():
+        for chunk in batched(plan.new_categories, batch_size):
+            started = time.perf_counter()
+            Category.objects.bulk_create(chunk)
+            timings.append(BatchTiming('新建分类', len(chunk), time.perf_counter() - started))
+        for chunk in batched(plan.creates, batch_size):
+            started = time.perf_counter()
+            Product.objects.bulk_create(chunk)
+            timings.append(BatchTiming('新建商品', len(chunk), time.perf_counter() - started))
+        # 新分类的主键由 bulk_create 回填，写入商品时自动关联
+        fields = plan.update_fields
+        for chunk in batched([product for product, _ in plan.updates], batch_size):
+            started = time.perf_counter()
+            Product.objects.bulk_update(chunk, fields)
+            timings.append(BatchTiming('更新商品', len(chunk), time.perf_counter() - started))
+
+        reindex([p.pk for p in plan.creates] + [p.pk for p, _ in plan.updates])
+        catalog_cache.bump_version()
+    return timings
+
+
+def plan_stock_adjustment(queryset, operation, quantity):
+    """库存调整计划：[(商品, 原库存, 新库存)]，只包含有变化的商品"""
+    adjust = STOCK_OPERATIONS[operation][1]
+    changes = []
+    queryset = queryset.select_related(None).only('id', 'name', 'stock').order_by('id')
+    for product in queryset.iterator(chunk_size=2000):
+        new_stock = adjust(product.stock, quantity)
+        if new_stock != product.stock:
+            changes.append((product, product.stock, new_stock))
+    return changes
+
+
+def apply_stock_adjustment(changes, batch_size=1000):
+    """按批写入库存，返回每批耗时 [BatchTiming]（库存不在检索索引中，无需重建索引）"""
+    timings = []
+    with transaction.atomic():
+        for chunk in batched(changes, batch_size):
+            started = time.perf_counter()
+            products = []
+            for product, _, new_stock in chunk:
+                product.stock = new_stock
+                products.append(product)
+            Product.objects.bulk_update(products, ['stock'])
+            timings.append(BatchTiming('更新库存', len(chunk), time.perf_counter() - started))
+        if changes:
+            catalog_cache.bump_version()
+    return timings
@@ -0,0 +1,190 @@
+"""
+商品目录缓存 - 分类列表和商品卡片的两级读穿缓存
+
+目录数据只在管理员编辑时变化，却在几乎每个页面被重复查询。这里的读取先查进程内缓存，
+再查共享缓存（settings.CACHES），都未命中才查数据库。缓存键包含目录版本号：
+商品、分类保存或删除（见 shop.signals）以及批量导入、批量调整库存后版本号加一，
+所有进程下次读取时即使用新数据。
+
+结算只修改库存（save(update_fields=['stock'])），不提升版本号，而是删除对应商品的共享缓存；
+其他进程的进程内缓存在 LOCAL_TIMEOUT 秒内过期。
+
+返回的模型实例在进程内共享，只能读取，不要修改后保存。
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import Category, Product
+
+DEFAULT_SETTINGS = {
+    'TIMEOUT': 3600,             # 共享缓存过期时间（秒）
+    'LOCAL_TIMEOUT': 5,          # 进程内缓存过期时间（秒）
+    'LOCAL_MAX_ENTRIES': 20000,  # 进程内缓存条目上限，超过后清空
+}
+VERSION_KEY = 'shop:catalog:version'
+MODIFIED_KEY = 'shop:catalog:modified'
+
+
+def get_catalog_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_CATALOG_CACHE', {})}
+
+
+class LocalCache:
+    """进程内缓存：{键: (过期时间, 版本号, 值)}"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] != version or entry[0] < time.monotonic():
+            return None
+        return entry[2]
+
+    def set(self, key, version, value):
+        config = get_catalog_cache_settings()
+        with self.lock:
+            if len(self.entries) >= config['LOCAL_MAX_ENTRIES']:
+                self.entries = {}
+            self.entries[key] = (time.monotonic() + config['LOCAL_TIMEOUT'], version, value)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+
+local = LocalCache()
+
+
+@receiver(setting_changed)
+def _clear_local(setting, **kwargs):
+    if setting in ('SHOP_CATALOG_CACHE', 'CACHES'):
+        local.clear()
+
+
+# ---- 版本号 ----
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 共享缓存被清空后从当前时间开始，不会与之前的版本号重复
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """目录变更后调用：立即提升一次，事务提交后再提升一次
+    （避免其他进程在提交前按新版本号缓存了旧数据）"""
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+        cache.incr(VERSION_KEY)
+    cache.set(MODIFIED_KEY, time.time(), None)
+    local.clear()
+
+
+def get_modified():
+    """目录最后一次变更的时间戳（用于 Last-Modified；缓存被清空后从当前时间开始）"""
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        cache.add(MODIFIED_KEY, time.time(), None)
+        modified = cache.get(MODIFIED_KEY)
+    return modified
+
+
+def _key(version, name):
+    return f'shop:catalog:{version}:{name}'
+
+
+def product_key(version, product_id):
+    return _key(version, f'product:{product_id}')
+
+
+def invalidate_products(product_ids):
+    """只删除指定商品的卡片缓存（结算扣减库存时使用，不影响其他目录缓存）"""
+    version = get_version()
+    keys = [product_key(version, pk) for pk in product_ids]
+    cache.delete_many(keys)
+    local.delete(*keys)
+
+
+# ---- 读取 ----
+
+def get_or_load(name, loader):
+    """读穿缓存：进程内 -> 共享 -> loader()"""
+    version = get_version()
+    key = _key(version, name)
+    value = local.get(key, version)
+    if value is None:
+        value = cache.get(key)
+        if value is None:
+            value = loader()
+            cache.set(key, value, get_catalog_cache_settings()['TIMEOUT'])
+        local.set(key, version, value)
+    return value
+
+
+def get_categories():
+    """全部分类（列表）"""
+    return get_or_load('categories', lambda: list(Category.objects.all()))
+
+
+def get_products(product_ids):
+    """按ID批量读取商品卡片（含分类），返回 {ID: 商品}，不存在的ID不在结果中"""
+    version = get_version()
+    keys = {pk: product_key(version, pk) for pk in product_ids}
+    found = {}
+    for pk, key in keys.items():
+        product = local.get(key, version)
+        if product is not None:
+            found[pk] = product
+
+    missing = {keys[pk]: pk for pk in keys if pk not in found}
+    if missing:
+        for key, product in cache.get_many(list(missing)).items():
+            found[missing.pop(key)] = product
+            local.set(key, version, product)
+    if missing:
+        loaded = Product.objects.select_related('category').in_bulk(list(missing.values()))
+        cache.set_many({keys[pk]: product for pk, product in loaded.items()},
+                       get_catalog_cache_settings()['TIMEOUT'])
+        for pk, product in loaded.items():
+            found[pk] = product
+            local.set(keys[pk], version, product)
+    return found
+
+
+def get_product(product_id):
+    """单个商品卡片，不存在时返回None"""
+    return get_products([product_id]).get(product_id)
+
+
+def get_similar_products(product, limit=4):
+    """同分类的其他商品"""
+    ids = get_or_load(
+        f'category:{product.category_id}:products:{limit + 1}',
+        lambda: list(Product.objects.filter(category_id=product.category_id)
+                     .order_by('id').values_list('id', flat=True)[:limit + 1]),
+    )
+    ids = [pk for pk in ids if pk != product.id][:limit]
+    products = get_products(ids)
+    return [products[pk] for pk in ids if pk in products]
@@ -0,0 +1,72 @@
+"""
+商品页的条件GET - 按目录版本号生成 ETag 和 Last-Modified，页面未变化时返回 304
+
+页面内容取决于目录版本号（商品、分类）、库存版本号（结算扣减库存）、当前用户（导航栏）、
+购物车数量（导航栏角标）和完整URL（筛选、搜索条件），ETag 由这些值计算。
+Last-Modified 取目录和库存最后变更时间中较晚的一个；浏览器同时发送 If-None-Match 时以 ETag 为准。
+有待显示的消息（如“已加入购物车”）时不做条件响应，避免消息随 304 丢失。
+响应带 Cache-Control: private, no-cache，浏览器每次重新验证，共享缓存不保存。
+
+Django 4.2 的 @condition 不支持异步视图，这里的装饰器同时支持同步和异步视图（放在登录检查之后）。
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.db.models import Sum
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import catalog_cache, fragments
+from .models import CartItem
+
+
+def catalog_validators(request):
+    """返回 (ETag, Last-Modified时间戳)；有待显示的消息时返回 (None, None)"""
+    if len(get_messages(request)):
+        return None, None
+    user = request.user
+    cart_count = 0
+    if user.family_id:
+        cart_count = CartItem.objects.filter(cart__family_id=user.family_id).aggregate(
+            total=Sum('quantity'))['total'] or 0
+    parts = [
+        request.get_full_path(), user.pk, cart_count,
+        catalog_cache.get_version(), fragments.get_version(fragments.STOCK, 'all'),
+    ]
+    etag = '"%s"' % hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    last_modified = max(catalog_cache.get_modified(), fragments.get_modified(fragments.STOCK, 'all'))
+    return etag, int(last_modified)
+
+
+def _check(request, etag, last_modified):
+    if request.method not in ('GET', 'HEAD') or etag is None:
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _finish(response, etag, last_modified):
+    if etag is not None and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def catalog_page(view):
+    """商品列表、商品详情等只随目录变化的页面"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            etag, last_modified = await sync_to_async(catalog_validators)(request)
+            response = _check(request, etag, last_modified) or await view(request, *args, **kwargs)
+            return _finish(response, etag, last_modified)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        etag, last_modified = catalog_validators(request)
+        response = _check(request, etag, last_modified) or view(request, *args, **kwargs)
+        return _finish(response, etag, last_modified)
+    return wrapper
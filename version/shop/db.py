@@ -0,0 +1,22 @@
+"""
+数据库连接调优 - 在连接建立时应用 settings.SQLITE_PRAGMAS
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    为新建的SQLite连接设置PRAGMA（WAL、synchronous、busy_timeout等）
+    数据库配置中的 PRAGMAS 优先于全局 SQLITE_PRAGMAS（如只读副本）
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS', getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
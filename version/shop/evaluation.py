@@ -0,0 +1,410 @@
+"""
+推荐系统离线评估引擎
+按 UserBehavior.timestamp 划分训练集/测试集，只在训练集上训练一次，
+批量为所有测试用户打分，并用 NumPy 计算 precision@k、recall@k、NDCG@k、覆盖率和耗时
+
+划分方式:
+    temporal        时间切分：截止时间之前的行为为训练集，之后的为测试集
+    leave-last-out  留一法：每个用户最后一次相关行为（默认购买）为测试集，
+                    该用户在此之后的行为不参与训练
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product as grid
+
+import numpy as np
+
+from .models import OrderItem, User, UserBehavior
+from .recommender import RecommenderSystem
+from .routers import analytical_reads
+
+SPLITS = ('temporal', 'leave-last-out')
+RANK_METRICS = ('ndcg', 'precision', 'recall', 'f1', 'hit_rate', 'coverage')
+# 与 get_lifecycle_recommendations 一致：只统计已支付的订单
+LIFECYCLE_ORDER_STATUSES = ('paid', 'shipped', 'completed')
+DAY_SECONDS = 86400
+
+
+class Interactions:
+    """按 (timestamp, id) 排序的行为记录数组"""
+
+    def __init__(self, user_ids, product_ids, behavior_types, timestamps):
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.behavior_types = behavior_types
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def rows(self, mask):
+        """以 (用户ID, 商品ID, 行为类型) 形式产出子集，供 build_matrices 使用"""
+        return zip(self.user_ids[mask].tolist(), self.product_ids[mask].tolist(),
+                   self.behavior_types[mask].tolist())
+
+
+class Split:
+    """
+    训练/测试划分
+    :param train: 训练行的布尔掩码
+    :param test: 测试行的布尔掩码（只含相关行为）
+    :param as_of: {用户ID: 测试开始时间戳}，用于计算当时的生命周期推荐
+    """
+
+    def __init__(self, name, train, test, as_of, cutoff=None):
+        self.name = name
+        self.train = train
+        self.test = test
+        self.as_of = as_of
+        self.cutoff = cutoff
+
+
+@analytical_reads()
+def load_interactions():
+    """一次性读取全部行为记录（走 behavior_time_idx 索引顺序；已压缩的分区没有逐条时间，不参与评估）"""
+    rows = list(UserBehavior.objects.order_by('timestamp', 'id').values_list(
+        'user_id', 'product_id', 'behavior_type', 'timestamp'
+    ).iterator(chunk_size=10000))
+    if not rows:
+        return Interactions(np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                            np.array([], dtype=object), np.array([], dtype=float))
+    user_ids, product_ids, behavior_types, timestamps = zip(*rows)
+    return Interactions(
+        np.array(user_ids, dtype=np.int64),
+        np.array(product_ids, dtype=np.int64),
+        np.array(behavior_types, dtype=object),
+        np.array([ts.timestamp() for ts in timestamps], dtype=float),
+    )
+
+
+def temporal_split(interactions, test_ratio=0.2, cutoff=None, relevant_types=('purchase',)):
+    """
+    时间切分
+    :param test_ratio: 未指定截止时间时，按行为数的该比例取最近的行为作为测试集
+    :param cutoff: 截止时间（datetime），优先于 test_ratio
+    """
+    timestamps = interactions.timestamps
+    if cutoff is not None:
+        cutoff = cutoff.timestamp()
+    elif len(timestamps):
+        cutoff = float(np.quantile(timestamps, 1 - test_ratio))
+    else:
+        cutoff = 0.0
+    train = timestamps < cutoff
+    test = ~train & np.isin(interactions.behavior_types, relevant_types)
+    as_of = {user_id: cutoff for user_id in np.unique(interactions.user_ids[test]).tolist()}
+    return Split('temporal', train, test, as_of, cutoff=cutoff)
+
+
+def leave_last_out(interactions, relevant_types=('purchase',)):
+    """留一法：每个用户最后一次相关行为作为测试集"""
+    n = len(interactions)
+    positions = np.flatnonzero(np.isin(interactions.behavior_types, relevant_types))
+    # 行已按时间排序，倒序后第一次出现的位置即每个用户最后一次相关行为
+    users, first = np.unique(interactions.user_ids[positions][::-1], return_index=True)
+    held_out = positions[::-1][first]
+
+    # 每个用户从留出的行开始（含）的行为都不参与训练，避免泄漏
+    all_users, inverse = np.unique(interactions.user_ids, return_inverse=True)
+    limits = np.full(len(all_users), n)
+    limits[np.searchsorted(all_users, users)] = held_out
+    train = np.arange(n) < limits[inverse]
+    test = np.zeros(n, dtype=bool)
+    test[held_out] = True
+    as_of = dict(zip(users.tolist(), interactions.timestamps[held_out].tolist()))
+    return Split('leave-last-out', train, test, as_of)
+
+
+@analytical_reads()
+def lifecycle_masks(users, as_of, products):
+    """
+    计算每个测试用户在测试开始时的生命周期推荐（向量化版的 OrderItem.should_recommend）
+    :param users: 测试用户ID列表
+    :param as_of: {用户ID: 时间戳}
+    :param products: 推荐系统的商品ID列表（矩阵列顺序）
+    :return: 布尔矩阵 (用户数 x 商品数)
+    """
+    product_idx = {product_id: idx for idx, product_id in enumerate(products)}
+    family_of = dict(User.objects.filter(id__in=users).values_list('id', 'family_id'))
+    items = list(OrderItem.objects.filter(
+        order__status__in=LIFECYCLE_ORDER_STATUSES,
+        order__family_id__in={f for f in family_of.values() if f is not None},
+        product__lifecycle__isnull=False,
+    ).order_by().values_list('order__family_id', 'product_id', 'purchase_date', 'product__lifecycle'))
+
+    by_family = {}
+    for family_id, product_id, purchase_date, lifecycle in items:
+        if lifecycle and product_id in product_idx:
+            by_family.setdefault(family_id, []).append(
+                (product_idx[product_id], purchase_date.timestamp(), lifecycle))
+    by_family = {
+        family_id: tuple(np.array(column) for column in zip(*rows))
+        for family_id, rows in by_family.items()
+    }
+
+    masks = np.zeros((len(users), len(products)), dtype=bool)
+    for row, user_id in enumerate(users):
+        family_items = by_family.get(family_of.get(user_id))
+        if family_items is None:
+            continue
+        columns, purchased, lifecycle = family_items
+        # 只使用测试开始前的订单；天数与 timedelta.days 一样向下取整
+        before = purchased < as_of[user_id]
+        days = np.floor((as_of[user_id] - purchased) / DAY_SECONDS)
+        masks[row, columns[before & (days / lifecycle >= 0.7)]] = True
+    return masks
+
+
+def top_k(scores, k):
+    """每行取评分最高的k个列索引（按评分降序）"""
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def ranking_metrics(hits, n_relevant, k):
+    """
+    计算每个用户的排序指标
+    :param hits: 布尔矩阵 (用户数 x k)，第j位推荐是否命中
+    :param n_relevant: 每个用户的相关商品数
+    :return: {指标名: 每个用户的取值数组}
+    """
+    n_hits = hits.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts[:hits.shape[1]]).sum(axis=1)
+    idcg = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    precision = n_hits / k
+    recall = n_hits / n_relevant
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f1 = np.where(n_hits > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'ndcg': dcg / idcg,
+        'hit_rate': (n_hits > 0).astype(float),
+    }
+
+
+def summarize(values):
+    return {
+        'mean': float(np.mean(values)),
+        'min': float(np.min(values)),
+        'median': float(np.median(values)),
+        'max': float(np.max(values)),
+    }
+
+
+class EvaluationData:
+    """训练完成后的评估数据：测试用户、相关商品和生命周期掩码，可供多组参数复用"""
+
+    def __init__(self, recommender, split, k, eval_rows, n_relevant, keys, masks, cold_users, timings):
+        self.recommender = recommender
+        self.split = split
+        self.k = k
+        self.eval_rows = eval_rows
+        self.n_relevant = n_relevant
+        self.keys = keys
+        self.masks = masks
+        self.cold_users = cold_users
+        self.timings = timings
+
+    def metrics(self, batches):
+        """
+        根据分批评分计算指标
+        :param batches: 产出 (起始行, 评分矩阵) 的可迭代对象
+        """
+        n_products = len(self.recommender.products)
+        all_hits, recommended = [], []
+        for start, scores in batches:
+            rows = self.eval_rows[start:start + len(scores)]
+            top = top_k(scores, self.k)
+            # 与 get_recommendations 一样只保留评分大于0的推荐
+            valid = np.take_along_axis(scores, top, axis=1) > 0
+            all_hits.append(np.isin(rows[:, None] * n_products + top, self.keys) & valid)
+            recommended.append(top[valid])
+        metrics = ranking_metrics(np.vstack(all_hits), self.n_relevant, self.k)
+        coverage = len(np.unique(np.concatenate(recommended))) / n_products
+        return metrics, coverage
+
+    def report(self, metrics, coverage, **params):
+        return {
+            'split': self.split.name,
+            'cutoff': self.split.cutoff,
+            'k': self.k,
+            **params,
+            'train_interactions': int(self.split.train.sum()),
+            'test_interactions': int(self.split.test.sum()),
+            'users': len(self.eval_rows),
+            'cold_users': self.cold_users,
+            'metrics': {name: summarize(values) for name, values in metrics.items()},
+            'coverage': coverage,
+            'timings': dict(self.timings),
+        }
+
+
+def prepare(recommender, split='temporal', k=10, test_ratio=0.2, cutoff=None,
+            relevant_types=('purchase',), interactions=None):
+    """
+    划分数据并在训练集上训练一次
+    :return: EvaluationData，无可评估用户时返回 None
+    """
+    if split not in SPLITS:
+        raise ValueError(f'未知的划分方式: {split}')
+    timings = {}
+
+    started = time.perf_counter()
+    if interactions is None:
+        interactions = load_interactions()
+    if split == 'temporal':
+        data_split = temporal_split(interactions, test_ratio, cutoff, relevant_types)
+    else:
+        data_split = leave_last_out(interactions, relevant_types)
+    timings['load_seconds'] = time.perf_counter() - started
+
+    # 只在训练集上训练一次
+    started = time.perf_counter()
+    result = recommender.build_matrices(interactions.rows(data_split.train))
+    if result is None:
+        return None
+    user_idx, product_idx = result
+    recommender.get_user_similarity()
+    recommender.get_item_similarity()
+    timings['train_seconds'] = time.perf_counter() - started
+
+    # 测试集中每个用户尚未在训练集中交互过的相关商品
+    test_users = interactions.user_ids[data_split.test]
+    test_products = interactions.product_ids[data_split.test]
+    known = np.array([u in user_idx for u in test_users.tolist()], dtype=bool)
+    known &= np.array([p in product_idx for p in test_products.tolist()], dtype=bool)
+    rows = np.array([user_idx[u] for u in test_users[known].tolist()], dtype=np.int64)
+    cols = np.array([product_idx[p] for p in test_products[known].tolist()], dtype=np.int64)
+    n_products = len(recommender.products)
+    keys = np.unique(rows * n_products + cols)
+    keys = keys[recommender.user_item_matrix.ravel()[keys] == 0]
+    eval_rows, n_relevant = np.unique(keys // n_products, return_counts=True)
+    if not len(eval_rows):
+        return None
+    eval_users = [recommender.users[row] for row in eval_rows.tolist()]
+    cold_users = int((recommender.user_item_matrix[eval_rows].sum(axis=1) == 0).sum())
+
+    started = time.perf_counter()
+    masks = lifecycle_masks(eval_users, data_split.as_of, recommender.products)
+    timings['lifecycle_seconds'] = time.perf_counter() - started
+
+    return EvaluationData(recommender, data_split, k, eval_rows, n_relevant, keys, masks,
+                          cold_users, timings)
+
+
+def evaluate(recommender=None, split='temporal', k=10, test_ratio=0.2, cutoff=None,
+             relevant_types=('purchase',), batch_size=256, interactions=None):
+    """
+    离线评估推荐系统
+    :param recommender: RecommenderSystem 实例（默认 alpha=0.5）
+    :param split: 'temporal' 或 'leave-last-out'
+    :param k: 推荐列表长度
+    :param relevant_types: 测试集中算作命中的行为类型
+    :param batch_size: 每批打分的用户数
+    :return: 可序列化为JSON的评估报告，无可评估用户时返回 None
+    """
+    recommender = recommender or RecommenderSystem(alpha=0.5)
+    data = prepare(recommender, split, k, test_ratio, cutoff, relevant_types, interactions)
+    if data is None:
+        return None
+
+    started = time.perf_counter()
+    metrics, coverage = data.metrics(
+        (start, recommender.score_users(data.eval_rows[start:start + batch_size],
+                                        data.masks[start:start + batch_size]))
+        for start in range(0, len(data.eval_rows), batch_size)
+    )
+    score_seconds = time.perf_counter() - started
+    data.timings['score_seconds'] = score_seconds
+    data.timings['ms_per_user'] = score_seconds * 1000 / len(data.eval_rows)
+    data.timings['users_per_second'] = len(data.eval_rows) / max(score_seconds, 1e-9)
+
+    return data.report(metrics, coverage, alpha=recommender.alpha,
+                       lifecycle_boost=recommender.lifecycle_boost,
+                       k_neighbors=recommender.k_neighbors,
+                       relevant_types=list(relevant_types))
+
+
+# ---- 参数搜索 ----
+
+# 工作进程共享的评分矩阵（fork 时直接继承，不经过序列化）
+_sweep_state = {}
+
+
+def _init_sweep_worker(state):
+    _sweep_state.update(state)
+
+
+def _score_config(config):
+    """在工作进程中评估一组参数：只做线性融合、取top k和计算指标"""
+    alpha, boost, k_neighbors = config
+    data = _sweep_state['data']
+    scores = data.recommender.blend_scores(
+        _sweep_state['user_scores'][k_neighbors], _sweep_state['item_scores'],
+        data.masks, alpha=alpha, lifecycle_boost=boost,
+    )
+    metrics, coverage = data.metrics([(0, scores)])
+    result = {name: float(np.mean(values)) for name, values in metrics.items()}
+    result.update(alpha=alpha, lifecycle_boost=boost, k_neighbors=k_neighbors, coverage=coverage)
+    return result
+
+
+def sweep(alphas, boosts, neighbors=(None,), split='temporal', k=10, test_ratio=0.2, cutoff=None,
+          relevant_types=('purchase',), processes=None, rank_by='ndcg', interactions=None):
+    """
+    超参数网格搜索
+    只训练一次并计算一次商品协同过滤评分，每个邻居数K计算一次用户协同过滤评分；
+    alpha 和生命周期提升只是评分矩阵的线性组合，在进程池中并行评估
+    注意评分矩阵按 (测试用户数 x 商品数) 常驻内存
+    :param neighbors: 邻居数K列表，None表示使用全部用户
+    :param processes: 进程数（默认CPU核数，1表示在当前进程内计算）
+    :param rank_by: 排序依据的指标
+    :return: (按 rank_by 降序排列的结果列表, 评估数据)，无可评估用户时结果为空
+    """
+    if rank_by not in RANK_METRICS:
+        raise ValueError(f'未知的排序指标: {rank_by}')
+    recommender = RecommenderSystem()
+    data = prepare(recommender, split, k, test_ratio, cutoff, relevant_types, interactions)
+    if data is None:
+        return [], None
+
+    started = time.perf_counter()
+    normalize = recommender.normalize_rows
+    state = {
+        'data': data,
+        'item_scores': normalize(recommender.item_cf_scores(data.eval_rows)),
+        'user_scores': {
+            k_neighbors: normalize(recommender.user_cf_scores(data.eval_rows, k_neighbors))
+            for k_neighbors in neighbors
+        },
+    }
+    data.timings['cf_seconds'] = time.perf_counter() - started
+
+    configs = list(grid(alphas, boosts, neighbors))
+    processes = min(processes or os.cpu_count() or 1, len(configs))
+    started = time.perf_counter()
+    if processes > 1:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_sweep_worker,
+                                 initargs=(state,)) as executor:
+            results = list(executor.map(_score_config, configs,
+                                        chunksize=max(1, len(configs) // (processes * 4))))
+    else:
+        _init_sweep_worker(state)
+        try:
+            results = [_score_config(config) for config in configs]
+        finally:
+            _sweep_state.clear()
+    data.timings['sweep_seconds'] = time.perf_counter() - started
+    data.timings['configs_per_second'] = len(configs) / max(data.timings['sweep_seconds'], 1e-9)
+
+    results.sort(key=lambda r: r[rank_by], reverse=True)
+    return results, data
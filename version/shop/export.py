@@ -0,0 +1,108 @@
+"""
+数据导出 - 把订单（含订单项）和用户行为流式导出为CSV/JSONL
+
+按主键分批读取（WHERE id > 游标 ORDER BY id LIMIT n），每批用 .iterator() 逐行生成，
+内存占用与导出总量无关；生成器产出 (游标, 行)，游标不为None时表示到此为止的数据已完整，
+中断后可从最后一个游标继续。
+导出的字段与 import_behaviors 命令的输入格式一致，可直接重新导入。
+"""
+import csv
+import json
+
+from .models import OrderItem
+
+BEHAVIOR_FIELDS = ['id', 'user', 'user_id', 'product_id', 'behavior_type', 'timestamp']
+ORDER_FIELDS = [
+    'order', 'family_id', 'user', 'user_id', 'status', 'total_price', 'created_at',
+    'product_id', 'product', 'quantity', 'price', 'purchase_date',
+]
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def filter_range(queryset, field, start=None, end=None):
+    """时间范围筛选：start <= field < end"""
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+
+def behavior_rows(queryset, after=0, batch_size=5000):
+    """产出 (游标, 行)，游标为行为ID"""
+    queryset = queryset.select_related('user').order_by('pk')
+    while True:
+        count = 0
+        batch = queryset.filter(pk__gt=after)[:batch_size]
+        for behavior in batch.iterator(chunk_size=batch_size):
+            count += 1
+            after = behavior.id
+            yield behavior.id, {
+                'id': behavior.id,
+                'user': behavior.user.username,
+                'user_id': behavior.user_id,
+                'product_id': behavior.product_id,
+                'behavior_type': behavior.behavior_type,
+                'timestamp': behavior.timestamp.isoformat(),
+            }
+        if count < batch_size:
+            return
+
+
+def order_rows(queryset, after=0, batch_size=1000):
+    """每个订单项一行，同一订单的行相邻；游标为订单ID（只在订单边界上推进）"""
+    queryset = queryset.order_by('pk')
+    while True:
+        order_ids = list(queryset.filter(pk__gt=after).values_list('pk', flat=True)[:batch_size])
+        if not order_ids:
+            return
+        items = OrderItem.objects.using(queryset.db).filter(
+            order_id__in=order_ids,
+        ).select_related('order', 'order__user', 'product').order_by('order_id', 'id')
+        for item in items.iterator(chunk_size=batch_size * 4):
+            order = item.order
+            yield None, {
+                'order': order.id,
+                'family_id': order.family_id,
+                'user': order.user.username if order.user else '',
+                'user_id': order.user_id or '',
+                'status': order.status,
+                'total_price': str(order.total_price),
+                'created_at': order.created_at.isoformat(),
+                'product_id': item.product_id,
+                'product': item.product.name,
+                'quantity': item.quantity,
+                'price': str(item.price),
+                'purchase_date': item.purchase_date.isoformat(),
+            }
+        after = order_ids[-1]
+        # 整批订单写完后才推进游标，没有订单项的订单也会被跳过
+        yield after, None
+
+
+class _Echo:
+    """csv.writer 的写入目标，直接返回写入的字符串"""
+
+    def write(self, value):
+        return value
+
+
+def row_encoder(fields, fmt):
+    """返回 (表头文本, 行编码函数)；JSONL没有表头"""
+    if fmt == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=fields)
+        return writer.writeheader(), writer.writerow
+    return '', lambda row: json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def stream(rows, fields, fmt):
+    """只产出文本，供 StreamingHttpResponse 使用"""
+    header, encode = row_encoder(fields, fmt)
+    if header:
+        yield header
+    for _, row in rows:
+        if row is not None:
+            yield encode(row)
@@ -0,0 +1,80 @@
+"""
+模板片段缓存 - {% cache %} 片段键使用的版本号和过期时间
+
+- 商品卡片: (商品ID, 目录版本号[, 库存])，目录版本号见 shop.catalog_cache；
+  结算扣减库存不提升目录版本号，显示库存的卡片需把库存也放进键里
+- 商品列表网格: (分类, 搜索词, 目录版本号, 库存版本号)，命中时不查询商品；
+  逐个缓存卡片时每张卡片都要访问一次缓存，几百张卡片反而比直接渲染慢
+- 家庭画像块: (家庭ID, 家庭画像版本号, 目录版本号)，偏好分类修改后版本号加一
+- 首页推荐块: (用户ID, 家庭行为版本号, 目录版本号)，家庭成员产生新行为后版本号加一；
+  其他用户的行为也会影响协同过滤结果，由较短的过期时间兜底
+
+版本号由 shop.signals 在数据变化时提升（立即和事务提交后各一次），旧片段不删除，过期后自然淘汰。
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from . import catalog_cache
+
+DEFAULT_SETTINGS = {
+    'TIMEOUT': 3600,                  # 商品卡片、家庭画像块（秒）
+    'RECOMMENDATIONS_TIMEOUT': 300,   # 首页推荐块（秒）
+}
+FAMILY_PROFILE = 'family_profile'
+RECOMMENDATIONS = 'recommendations'
+STOCK = 'stock'
+VERSION_KEY = 'shop:fragments:{}:{}:version'
+MODIFIED_KEY = 'shop:fragments:{}:{}:modified'
+
+
+def get_fragment_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_FRAGMENT_CACHE', {})}
+
+
+def get_version(kind, object_id):
+    key = VERSION_KEY.format(kind, object_id)
+    version = cache.get(key)
+    if version is None:
+        # 与 catalog_cache 相同：缓存被清空后从当前时间开始，不会与之前的版本号重复
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(kind, object_id):
+    """数据变更后调用：与 catalog_cache.bump_version 相同，立即提升一次，事务提交后再提升一次
+    （避免其他请求在提交前读到旧数据，按新版本号缓存了旧片段）"""
+    _bump(kind, object_id)
+    transaction.on_commit(lambda: _bump(kind, object_id))
+
+
+def _bump(kind, object_id):
+    key = VERSION_KEY.format(kind, object_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(kind, object_id)
+        cache.incr(key)
+    cache.set(MODIFIED_KEY.format(kind, object_id), time.time(), None)
+
+
+def get_modified(kind, object_id):
+    """最后一次提升版本号的时间戳（用于 Last-Modified；缓存被清空后从当前时间开始）"""
+    key = MODIFIED_KEY.format(kind, object_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), None)
+        modified = cache.get(key)
+    return modified
+
+
+def context_processor(request):
+    """模板中的 catalog_version 和 fragment_cache.TIMEOUT 等（目录版本号在模板用到时才读取）"""
+    return {
+        'catalog_version': SimpleLazyObject(catalog_cache.get_version),
+        'fragment_cache': get_fragment_cache_settings(),
+    }
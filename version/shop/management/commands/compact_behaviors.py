@@ -0,0 +1,97 @@
+"""
+压缩旧的行为分区
+早于保留月数的月份分区：原始行为归档为gzip压缩的JSONL，按（用户, 商品）累加到行为汇总表后删除
+
+用法:
+    python manage.py compact_behaviors --dry-run
+    python manage.py compact_behaviors --hot-months 6
+    python manage.py compact_behaviors --period 202401 --archive-dir /data/archive/behaviors
+    python manage.py compact_behaviors --restore 202401
+
+建议每月初通过cron执行一次。归档的行为已计入汇总，恢复原始行为用 --restore（按原ID写回并从汇总中减去），
+不要用 import_behaviors 导入归档文件。
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.db.models import Count
+from django.utils import timezone
+
+from shop import partitions
+from shop.models import BehaviorArchive, UserBehavior, behavior_period
+from shop.pagination import refresh_statistics
+from shop.routers import analytical_reads
+
+
+class Command(BaseCommand):
+    help = '把旧的行为分区归档为压缩文件，并汇总为（用户, 商品）行为次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-months', type=int,
+                            help='保留原始行为的月数，含当月（默认 SHOP_BEHAVIOR_PARTITIONS.HOT_MONTHS）')
+        parser.add_argument('--period', type=int, action='append', default=[],
+                            help='只压缩指定分区（如 202401，可重复）')
+        parser.add_argument('--archive-dir', help='归档目录（默认 SHOP_BEHAVIOR_PARTITIONS.ARCHIVE_DIR）')
+        parser.add_argument('--batch-size', type=int, default=5000, help='归档时每批读取的行数')
+        parser.add_argument('--dry-run', action='store_true', help='只列出要压缩的分区和行数')
+        parser.add_argument('--restore', type=int, action='append', default=[],
+                            help='恢复指定分区的归档：原始行为写回行为表并从汇总中减去（可重复）')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            return self.restore(options['restore'], options['batch_size'])
+        hot_months = options['hot_months']
+        if hot_months is not None and hot_months < 1:
+            raise CommandError('--hot-months 至少为1（当月分区不能压缩）')
+        current = behavior_period(timezone.now())
+        for period in options['period']:
+            if not 1 <= period % 100 <= 12:
+                raise CommandError(f'无效的分区: {period}')
+            if period >= current:
+                raise CommandError(f'不能压缩当月或以后的分区: {period}')
+
+        periods = sorted(options['period']) or partitions.cold_periods(hot_months)
+        if not periods:
+            self.stdout.write('没有需要压缩的分区')
+            return
+
+        if options['dry_run']:
+            with analytical_reads():
+                counts = dict(UserBehavior.objects.in_periods(*periods).values_list('period').annotate(
+                    rows=Count('id')).order_by())
+            for period in periods:
+                self.stdout.write(f'  分区 {period}: {counts.get(period, 0)} 行')
+            return
+
+        started = time.perf_counter()
+        total = 0
+        for period in periods:
+            period_started = time.perf_counter()
+            archive = partitions.compact_period(period, options['archive_dir'], options['batch_size'])
+            if archive is None:
+                self.stdout.write(f'  分区 {period}: 没有原始行为')
+                continue
+            total += archive.rows
+            self.stdout.write(
+                f'  分区 {period}: 归档 {archive.rows} 行 -> {archive.path}'
+                f'（{time.perf_counter() - period_started:.1f} 秒）'
+            )
+        # 删除了大量行，更新统计信息（后台列表的估算总数依赖它）
+        refresh_statistics(UserBehavior, router.db_for_write(UserBehavior))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ 压缩完成：{len(periods)} 个分区，共 {total} 行，用时 {elapsed:.1f} 秒'))
+
+    def restore(self, periods, batch_size):
+        archives = list(BehaviorArchive.objects.filter(period__in=periods))
+        if not archives:
+            raise CommandError(f"没有这些分区的归档: {', '.join(map(str, periods))}")
+        started = time.perf_counter()
+        total = 0
+        for archive in archives:
+            rows = partitions.restore_archive(archive, batch_size)
+            total += rows
+            self.stdout.write(f'  分区 {archive.period}: 恢复 {rows} 行 <- {archive.path}')
+        refresh_statistics(UserBehavior, router.db_for_write(UserBehavior))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ 恢复完成：{len(archives)} 个归档，共 {total} 行，用时 {elapsed:.1f} 秒'))
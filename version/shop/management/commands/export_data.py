@@ -0,0 +1,173 @@
+"""
+订单和用户行为流式导出命令
+按主键分批读取并逐行写出CSV/JSONL（支持.gz），内存占用与导出量无关；
+每批写完后记录检查点（游标和输出文件位置），中断后可用 --resume 继续
+
+用法:
+    python manage.py export_data behaviors -o behaviors.csv.gz --start 2024-01-01 --end 2024-02-01
+    python manage.py export_data orders -o orders.jsonl --resume
+    python manage.py export_data behaviors --format jsonl > behaviors.jsonl
+
+导出格式与 import_behaviors 的输入格式一致。
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from shop import export
+from shop.models import Order, UserBehavior
+from shop.routers import analytical_reads
+
+EXPORTS = {
+    # 类型: (查询集, 时间字段, 字段列表, 行生成器)
+    'behaviors': (UserBehavior.objects.all, 'timestamp', export.BEHAVIOR_FIELDS, export.behavior_rows),
+    'orders': (Order.objects.all, 'created_at', export.ORDER_FIELDS, export.order_rows),
+}
+
+
+def parse_bound(value):
+    """日期（当天0点）或时间"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f'无效的时间: {value!r}')
+        parsed = datetime.combine(date, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Output:
+    """输出文件；.gz 文件在每个检查点结束一个gzip成员，续传时截断到检查点位置后追加新成员"""
+
+    def __init__(self, path, position=None):
+        self.path = path
+        self.compressed = path.endswith('.gz')
+        if position is None:
+            self.raw = open(path, 'wb')
+        else:
+            self.raw = open(path, 'r+b')
+            self.raw.truncate(position)
+            self.raw.seek(position)
+        self.member = self.open_member()
+
+    def open_member(self):
+        return gzip.GzipFile(fileobj=self.raw, mode='wb') if self.compressed else self.raw
+
+    def write(self, text):
+        self.member.write(text.encode('utf-8'))
+
+    def checkpoint(self):
+        """把已写内容落盘，返回可安全续写的位置"""
+        if self.compressed:
+            self.member.close()
+        self.raw.flush()
+        position = self.raw.tell()
+        if self.compressed:
+            self.member = self.open_member()
+        return position
+
+    def close(self):
+        if self.compressed:
+            self.member.close()
+        self.raw.close()
+
+
+class StdoutOutput:
+    """标准输出，不支持续传"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text, ending='')
+
+    def checkpoint(self):
+        self.stream.flush()
+        return None
+
+    def close(self):
+        self.stream.flush()
+
+
+class Command(BaseCommand):
+    help = '流式导出订单（含订单项）或用户行为（CSV/JSONL），支持时间范围和断点续传'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='导出订单或行为记录')
+        parser.add_argument('-o', '--output', default='-', help="输出文件（.gz 自动压缩），'-' 表示标准输出")
+        parser.add_argument('--format', choices=sorted(export.FORMATS), help='输出格式（默认按扩展名判断）')
+        parser.add_argument('--start', help='起始时间（含），如 2024-01-01 或 2024-01-01T08:00:00')
+        parser.add_argument('--end', help='结束时间（不含）')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批读取的行数（订单为订单数）')
+        parser.add_argument('--after', type=int, default=0, help='从该游标（行为ID/订单ID）之后开始')
+        parser.add_argument('--checkpoint', help='检查点文件（默认为 <输出文件>.checkpoint）')
+        parser.add_argument('--resume', action='store_true', help='从检查点记录的位置继续导出')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        fmt = options['format'] or ('csv' if '.csv' in os.path.basename(path) else 'jsonl')
+        self.checkpoint_path = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and path == '-':
+            raise CommandError('输出到标准输出时不能续传')
+        # 数据写到标准输出时，进度写到标准错误
+        self.progress = self.stderr if path == '-' else self.stdout
+
+        state = {'cursor': options['after'], 'position': None, 'exported': 0}
+        if options['resume'] and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                state.update(json.load(f))
+            self.progress.write(f"从游标 {state['cursor']} 继续导出...")
+
+        manager, time_field, fields, rows = EXPORTS[options['kind']]
+        queryset = export.filter_range(
+            manager(), time_field,
+            parse_bound(options['start']) if options['start'] else None,
+            parse_bound(options['end']) if options['end'] else None,
+        )
+
+        output = StdoutOutput(self.stdout) if path == '-' else Output(path, state['position'])
+        header, encode = export.row_encoder(fields, fmt)
+        if header and state['position'] is None:
+            output.write(header)
+        started = time.perf_counter()
+        pending, last_cursor = 0, None
+        try:
+            with analytical_reads():
+                for cursor, row in rows(queryset, state['cursor'], options['batch_size']):
+                    if row is not None:
+                        output.write(encode(row))
+                        pending += 1
+                    if cursor is None:
+                        continue
+                    last_cursor = cursor
+                    # 行为记录每写满一批记录一次检查点，订单在每批订单结束时（row为None）记录
+                    if row is None or pending >= options['batch_size']:
+                        self.commit(state, cursor, pending, output, started)
+                        pending = 0
+            if pending:
+                self.commit(state, last_cursor, pending, output, started)
+        finally:
+            output.close()
+
+        elapsed = time.perf_counter() - started
+        self.progress.write(self.style.SUCCESS(f"✓ 导出完成：共 {state['exported']} 行，用时 {elapsed:.1f} 秒"))
+
+    def commit(self, state, cursor, count, output, started):
+        state['cursor'] = cursor
+        state['exported'] += count
+        state['position'] = output.checkpoint()
+        if self.checkpoint_path and state['position'] is not None:
+            tmp = f'{self.checkpoint_path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.checkpoint_path)
+        rate = state['exported'] / max(time.perf_counter() - started, 1e-9)
+        self.progress.write(f"  已导出 {state['exported']} 行（游标 {cursor}，{rate:.0f} 行/秒）")
@@ -0,0 +1,292 @@
+"""
+测试数据生成命令
+按指定规模生成家庭、用户、商品、行为和订单数据，商品热度和用户活跃度服从Zipf分布
+
+用法:
+    python manage.py generate_test_data
+    python manage.py generate_test_data --families 50000 --users 100000 --products 100000 \\
+        --behaviors 5000000 --orders 500000 --seed 42
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from shop import catalog_cache, search
+from shop.bulk import explicit_timestamps
+from shop.models import (
+    User, Family, FamilyProfile, Category, Product,
+    Cart, Order, OrderItem, UserBehavior
+)
+
+# 商品分类列表
+CATEGORIES = [
+    '食品饮料', '生鲜果蔬', '美妆护肤', '个人护理', '家居清洁',
+    '厨房用品', '家居装饰', '床上用品', '母婴用品', '宠物用品',
+    '数码配件', '运动健身', '图书文具', '服装鞋帽', '箱包配饰'
+]
+
+# 商品名称模板
+PRODUCT_TEMPLATES = {
+    '食品饮料': ['牛奶', '酸奶', '果汁', '咖啡', '茶叶', '饼干', '薯片', '巧克力', '糖果', '方便面'],
+    '生鲜果蔬': ['苹果', '香蕉', '橙子', '葡萄', '西瓜', '白菜', '萝卜', '土豆', '西红柿', '黄瓜'],
+    '美妆护肤': ['面膜', '洗面奶', '爽肤水', '乳液', '精华液', '口红', '眼影', '粉底液', '防晒霜', '卸妆水'],
+    '个人护理': ['牙膏', '牙刷', '洗发水', '护发素', '沐浴露', '香皂', '毛巾', '剃须刀', '梳子', '指甲钳'],
+    '家居清洁': ['洗衣液', '洗洁精', '消毒液', '拖把', '扫把', '垃圾袋', '抹布', '清洁剂', '除菌液', '空气清新剂'],
+    '厨房用品': ['锅具', '碗碟', '筷子', '勺子', '刀具', '砧板', '保鲜盒', '保鲜膜', '厨房纸', '围裙'],
+    '家居装饰': ['相框', '花瓶', '装饰画', '抱枕', '地毯', '窗帘', '台灯', '挂钟', '摆件', '绿植'],
+    '床上用品': ['床单', '被套', '枕头', '被子', '毛毯', '床垫', '枕套', '床笠', '凉席', '蚊帐'],
+    '母婴用品': ['奶粉', '纸尿裤', '奶瓶', '婴儿车', '玩具', '婴儿服', '湿巾', '爬行垫', '安抚奶嘴', '儿童餐具'],
+    '宠物用品': ['猫粮', '狗粮', '宠物玩具', '猫砂', '宠物窝', '牵引绳', '宠物碗', '宠物零食', '宠物梳子', '宠物衣服'],
+    '数码配件': ['数据线', '充电器', '耳机', '手机壳', '屏幕保护膜', '移动电源', '鼠标', '键盘', 'U盘', '读卡器'],
+    '运动健身': ['瑜伽垫', '哑铃', '跳绳', '运动服', '运动鞋', '护腕', '运动水杯', '健身手套', '弹力带', '瑜伽球'],
+    '图书文具': ['笔记本', '钢笔', '铅笔', '橡皮', '尺子', '书签', '便签', '文件夹', '订书机', '胶带'],
+    '服装鞋帽': ['T恤', '衬衫', '裤子', '裙子', '外套', '运动鞋', '拖鞋', '帽子', '围巾', '手套'],
+    '箱包配饰': ['背包', '手提包', '钱包', '腰带', '手表', '太阳镜', '项链', '耳环', '手链', '戒指']
+}
+
+LIFECYCLES = [7, 15, 30, 60, 90, 180]
+ORDER_STATUSES = ['paid', 'shipped', 'completed']
+ORDER_STATUS_WEIGHTS = [0.5, 0.2, 0.3]
+DEFAULT_PASSWORD = '123456'
+
+
+def zipf_weights(n, exponent, rng):
+    """n个元素的Zipf概率分布，排名随机打乱到各元素"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+class Command(BaseCommand):
+    help = '按指定规模生成测试数据（bulk_create批量写入，Zipf分布热度）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--families', type=int, default=20, help='家庭数量')
+        parser.add_argument('--users', type=int, default=40, help='用户数量（平均分配到各家庭）')
+        parser.add_argument('--products', type=int, default=400, help='商品数量')
+        parser.add_argument('--behaviors', type=int, default=600, help='浏览/加购行为数量（不含购买）')
+        parser.add_argument('--orders', type=int, default=70, help='订单数量（每个订单项同时记录购买行为）')
+        parser.add_argument('--days', type=int, default=180, help='行为和订单的时间跨度(天)')
+        parser.add_argument('--zipf', type=float, default=1.1, help='商品热度和用户活跃度的Zipf指数')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子，相同参数和种子生成相同数据')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批写入的行数')
+
+    def handle(self, *args, **options):
+        if options['users'] < options['families'] or options['families'] < 1:
+            raise CommandError('用户数量不能少于家庭数量，且至少需要1个家庭')
+
+        self.batch_size = options['batch_size']
+        self.rng = np.random.default_rng(options['seed'])
+        random.seed(options['seed'])
+        self.now = timezone.now()
+        self.span = options['days'] * 86400
+        started = time.perf_counter()
+
+        self.stdout.write("开始生成测试数据...")
+        self.clear_data()
+
+        with explicit_timestamps(Family, Product, Order, OrderItem, UserBehavior):
+            categories = self.create_categories()
+            families = self.create_families(options['families'], categories)
+            user_ids = self.create_users(options['users'], families)
+            products = self.create_products(options['products'], categories)
+
+            product_ids = np.array([p[0] for p in products])
+            product_p = zipf_weights(len(product_ids), options['zipf'], self.rng)
+            user_ids = np.array(user_ids)
+            user_p = zipf_weights(len(user_ids), options['zipf'], self.rng)
+
+            self.create_behaviors(options['behaviors'], user_ids, user_p, product_ids, product_p)
+            self.create_orders(options['orders'], user_ids, user_p, product_ids, product_p, dict(products))
+
+        self.stdout.write("重建商品检索索引...")
+        if search.is_enabled(search.get_connection(for_write=True)):
+            search.rebuild_index(batch_size=self.batch_size)
+        # 批量写入不触发信号，手动使目录缓存失效
+        catalog_cache.bump_version()
+
+        self.create_superuser()
+        self.print_summary(time.perf_counter() - started)
+
+    def clear_data(self):
+        """清空现有数据（除了超级管理员）"""
+        self.stdout.write("清空现有数据...")
+        UserBehavior.objects.all().delete()
+        OrderItem.objects.all().delete()
+        Order.objects.all().delete()
+        Cart.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        FamilyProfile.objects.all().delete()
+        User.objects.filter(is_superuser=False).delete()
+        Family.objects.all().delete()
+
+    def random_times(self, n):
+        """最近 days 天内的n个随机时间"""
+        offsets = self.rng.integers(0, max(self.span, 1), size=n)
+        return [self.now - timedelta(seconds=int(s)) for s in offsets]
+
+    @transaction.atomic
+    def create_categories(self):
+        categories = Category.objects.bulk_create(
+            [Category(name=name, description=f'{name}相关商品') for name in CATEGORIES]
+        )
+        self.stdout.write(f"✓ 创建了 {len(categories)} 个商品分类")
+        return categories
+
+    @transaction.atomic
+    def create_families(self, count, categories):
+        families = Family.objects.bulk_create(
+            [Family(name=f'家庭{i}', created_at=self.now) for i in range(1, count + 1)],
+            batch_size=self.batch_size
+        )
+        profiles = FamilyProfile.objects.bulk_create(
+            [FamilyProfile(family=family) for family in families], batch_size=self.batch_size
+        )
+        # 每个家庭随机选择5-8个偏好分类
+        Through = FamilyProfile.preferred_categories.through
+        links = []
+        for profile in profiles:
+            for category in random.sample(categories, random.randint(5, 8)):
+                links.append(Through(familyprofile_id=profile.id, category_id=category.id))
+        Through.objects.bulk_create(links, batch_size=self.batch_size)
+        Cart.objects.bulk_create([Cart(family=family) for family in families], batch_size=self.batch_size)
+        self.stdout.write(f"✓ 创建了 {len(families)} 个家庭（含画像和购物车）")
+        return families
+
+    @transaction.atomic
+    def create_users(self, count, families):
+        # 所有用户共用默认密码，只计算一次哈希
+        password = make_password(DEFAULT_PASSWORD)
+        users = User.objects.bulk_create(
+            [User(username=f'user{i + 1}', password=password, family=families[i % len(families)])
+             for i in range(count)],
+            batch_size=self.batch_size
+        )
+        self.stdout.write(f"✓ 创建了 {len(users)} 个用户")
+        return [user.id for user in users]
+
+    @transaction.atomic
+    def create_products(self, count, categories):
+        per_category = count // len(categories)
+        extra = count % len(categories)
+        products = []
+        for idx, category in enumerate(categories):
+            templates = PRODUCT_TEMPLATES.get(category.name, ['商品'])
+            for i in range(per_category + (1 if idx < extra else 0)):
+                products.append(Product(
+                    name=f'{templates[i % len(templates)]}{i + 1}',
+                    category=category,
+                    price=Decimal(str(round(random.uniform(10, 500), 2))),
+                    stock=random.randint(50, 500),
+                    lifecycle=random.choice(LIFECYCLES),
+                    description=f'这是一款优质的{category.name}商品',
+                    created_at=self.now,
+                ))
+        products = Product.objects.bulk_create(products, batch_size=self.batch_size)
+        self.stdout.write(f"✓ 创建了 {len(products)} 个商品")
+        return [(p.id, p.price) for p in products]
+
+    def create_behaviors(self, count, user_ids, user_p, product_ids, product_p):
+        """生成浏览/加购行为，约30%为加购"""
+        self.stdout.write("生成用户行为数据...")
+        created = 0
+        chunk = self.batch_size * 10
+        while created < count:
+            n = min(chunk, count - created)
+            users = self.rng.choice(user_ids, size=n, p=user_p)
+            products = self.rng.choice(product_ids, size=n, p=product_p)
+            is_cart = self.rng.random(n) < 0.3
+            times = self.random_times(n)
+            with transaction.atomic():
+                UserBehavior.objects.bulk_create(
+                    [UserBehavior(user_id=int(u), product_id=int(p),
+                                  behavior_type='add_to_cart' if c else 'view', timestamp=t)
+                     for u, p, c, t in zip(users, products, is_cart, times)],
+                    batch_size=self.batch_size
+                )
+            created += n
+            self.stdout.write(f"  {created}/{count}")
+        self.stdout.write(f"✓ 生成了 {created} 个浏览/加购行为记录")
+
+    def create_orders(self, count, user_ids, user_p, product_ids, product_p, prices):
+        """生成订单，每个订单1-3个商品，订单项同时记录购买行为"""
+        self.stdout.write("创建订单...")
+        family_of = dict(User.objects.filter(id__in=user_ids.tolist()).values_list('id', 'family_id'))
+        created = items_created = 0
+        chunk = self.batch_size
+        while created < count:
+            n = min(chunk, count - created)
+            users = self.rng.choice(user_ids, size=n, p=user_p)
+            sizes = self.rng.integers(1, 4, size=n)
+            products = self.rng.choice(product_ids, size=int(sizes.sum()), p=product_p)
+            quantities = self.rng.integers(1, 4, size=len(products))
+            times = self.random_times(n)
+            statuses = random.choices(ORDER_STATUSES, weights=ORDER_STATUS_WEIGHTS, k=n)
+
+            orders, lines, pos = [], [], 0
+            for user_id, size, created_at, status in zip(users, sizes, times, statuses):
+                order_lines = [(int(p), int(q)) for p, q in
+                               zip(products[pos:pos + size], quantities[pos:pos + size])]
+                pos += size
+                lines.append(order_lines)
+                orders.append(Order(
+                    family_id=family_of[int(user_id)], user_id=int(user_id), status=status,
+                    total_price=sum(prices[p] * q for p, q in order_lines),
+                    created_at=created_at, updated_at=created_at,
+                ))
+
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(orders, batch_size=self.batch_size)
+                items, behaviors = [], []
+                for order, order_lines in zip(orders, lines):
+                    for product_id, quantity in order_lines:
+                        items.append(OrderItem(
+                            order_id=order.id, product_id=product_id, quantity=quantity,
+                            price=prices[product_id], purchase_date=order.created_at,
+                        ))
+                        behaviors.append(UserBehavior(
+                            user_id=order.user_id, product_id=product_id,
+                            behavior_type='purchase', timestamp=order.created_at,
+                        ))
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+                UserBehavior.objects.bulk_create(behaviors, batch_size=self.batch_size)
+            created += n
+            items_created += len(items)
+        self.stdout.write(f"✓ 创建了 {created} 个订单，{items_created} 个订单项（及对应购买行为）")
+
+    def create_superuser(self):
+        self.stdout.write("创建超级管理员...")
+        if not User.objects.filter(username='mallory').exists():
+            User.objects.create_superuser(
+                username='mallory',
+                password=DEFAULT_PASSWORD,
+                email='mallory@example.com'
+            )
+            self.stdout.write("✓ 创建超级管理员 mallory")
+        else:
+            self.stdout.write("✓ 超级管理员 mallory 已存在")
+
+    def print_summary(self, elapsed):
+        user_count = User.objects.filter(is_superuser=False).count()
+        self.stdout.write("\n" + "=" * 50)
+        self.stdout.write(self.style.SUCCESS(f"数据生成完成！用时 {elapsed:.1f} 秒"))
+        self.stdout.write("=" * 50)
+        self.stdout.write(f"商品分类: {Category.objects.count()} 个")
+        self.stdout.write(f"家庭: {Family.objects.count()} 个")
+        self.stdout.write(f"用户: {user_count} 个")
+        self.stdout.write(f"商品: {Product.objects.count()} 个")
+        self.stdout.write(f"用户行为: {UserBehavior.objects.count()} 个")
+        self.stdout.write(f"订单: {Order.objects.count()} 个")
+        self.stdout.write("=" * 50)
+        self.stdout.write("\n登录信息：")
+        self.stdout.write(f"管理员账号: mallory / {DEFAULT_PASSWORD}")
+        self.stdout.write(f"用户账号: user1-user{user_count} / {DEFAULT_PASSWORD}")
+        self.stdout.write("=" * 50)
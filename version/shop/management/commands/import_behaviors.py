@@ -0,0 +1,304 @@
+"""
+历史数据批量导入命令
+流式读取CSV/JSONL（支持.gz），用内存ID映射解析用户和商品，分块事务内 bulk_create 写入，
+每个分块提交后记录检查点，中断后可用 --resume 从断点继续
+
+用法:
+    python manage.py import_behaviors behaviors.csv
+    python manage.py import_behaviors behaviors.jsonl.gz --resume
+    python manage.py import_behaviors order_items.csv --kind orders --purchase-behaviors
+
+行为记录字段: user（用户名）或 user_id, product_id, behavior_type, timestamp
+订单项字段:   order（来源系统订单号，同一订单的行需相邻）, user 或 user_id, product_id,
+              quantity, price, purchase_date, status（可选，默认paid）
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from collections import Counter
+from itertools import groupby, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from shop import metrics, partitions
+from shop.bulk import batched, explicit_timestamps
+from shop.models import Order, OrderItem, Product, User, UserBehavior, behavior_period
+
+BEHAVIOR_TYPES = {choice for choice, _ in UserBehavior.BEHAVIOR_CHOICES}
+ORDER_STATUSES = {choice for choice, _ in Order.STATUS_CHOICES}
+
+
+class RowError(ValueError):
+    """无效的输入行"""
+
+
+def open_input(path):
+    """打开输入文件（'-' 为标准输入，.gz 自动解压）"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    """逐行产出字典（JSONL的空行跳过）"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            # 无法解析或不是对象的行保留原文，由校验步骤记为无效
+            yield row if isinstance(row, dict) else {'raw': line.rstrip('\n')}
+
+
+def parse_time(value):
+    parsed = parse_datetime(str(value or '').strip())
+    if parsed is None:
+        raise RowError(f'无效的时间: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = '流式批量导入用户行为或订单历史（CSV/JSONL），支持断点续传'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="输入文件路径，'-' 表示标准输入")
+        parser.add_argument('--kind', choices=['behaviors', 'orders'], default='behaviors',
+                            help='导入行为记录或订单项')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='输入格式（默认按扩展名判断）')
+        parser.add_argument('--batch-size', type=int, default=10000, help='每次 bulk_create 的行数')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='每个事务提交的行数')
+        parser.add_argument('--checkpoint', help='检查点文件（默认为 <输入文件>.checkpoint）')
+        parser.add_argument('--resume', action='store_true', help='从检查点记录的位置继续导入')
+        parser.add_argument('--rejects', help='把无效行写入该文件（JSONL）')
+        parser.add_argument('--purchase-behaviors', action='store_true',
+                            help='导入订单项时同时写入购买行为')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if '.csv' in os.path.basename(path) else 'jsonl')
+        self.options = options
+        self.checkpoint_path = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and not self.checkpoint_path:
+            raise CommandError('从标准输入导入时需要用 --checkpoint 指定检查点文件')
+
+        state = {'offset': 0, 'imported': 0, 'rejected': 0}
+        if options['resume'] and self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                state.update(json.load(f))
+            self.stdout.write(f"从第 {state['offset']} 行继续导入...")
+
+        self.stdout.write("加载用户和商品ID映射...")
+        self.load_id_maps()
+
+        self.rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        started = time.perf_counter()
+        try:
+            with open_input(path) as stream:
+                rows = enumerate(read_rows(stream, fmt), start=1)
+                rows = self.track_lines(islice(rows, state['offset'], None), state)
+                if options['kind'] == 'behaviors':
+                    self.import_behaviors(rows, state, started)
+                else:
+                    self.import_orders(rows, state, started)
+                # 最后一批之后的无效行也记入检查点，续传时不会再次计数和写入无效行文件
+                if self.last_line > state['offset']:
+                    self.commit_chunk(state, self.last_line, 0, started)
+        finally:
+            if self.rejects:
+                self.rejects.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ 导入完成：共 {state['imported']} 行，无效 {state['rejected']} 行，"
+            f"用时 {elapsed:.1f} 秒"
+        ))
+
+    def track_lines(self, rows, state):
+        """记录已读到的最后一行"""
+        self.last_line = state['offset']
+        for line_no, row in rows:
+            self.last_line = line_no
+            yield line_no, row
+
+    # ---- ID映射与校验 ----
+
+    def load_id_maps(self):
+        self.user_ids = {}
+        self.user_family = {}
+        users = User.objects.values_list('id', 'username', 'family_id').iterator(chunk_size=50000)
+        for user_id, username, family_id in users:
+            self.user_ids[username] = user_id
+            self.user_family[user_id] = family_id
+        self.product_ids = set(Product.objects.values_list('id', flat=True).iterator(chunk_size=50000))
+        self.archived = partitions.archived_ranges()
+
+    def resolve_user(self, row):
+        if row.get('user_id') not in (None, ''):
+            try:
+                user_id = int(row['user_id'])
+            except (TypeError, ValueError):
+                raise RowError(f"无效的用户ID: {row['user_id']!r}")
+            if user_id not in self.user_family:
+                raise RowError(f'用户不存在: {user_id}')
+            return user_id
+        user_id = self.user_ids.get(row.get('user'))
+        if user_id is None:
+            raise RowError(f"用户不存在: {row.get('user')!r}")
+        return user_id
+
+    def resolve_product(self, row):
+        try:
+            product_id = int(row.get('product_id'))
+        except (TypeError, ValueError):
+            raise RowError(f"无效的商品ID: {row.get('product_id')!r}")
+        if product_id not in self.product_ids:
+            raise RowError(f'商品不存在: {product_id}')
+        return product_id
+
+    def reject(self, line_no, row, error, state):
+        state['rejected'] += 1
+        if self.rejects:
+            self.rejects.write(json.dumps({'line': line_no, 'error': str(error), 'row': row},
+                                          ensure_ascii=False) + '\n')
+
+    # ---- 行为记录 ----
+
+    def parse_behavior(self, row):
+        behavior_type = row.get('behavior_type')
+        if behavior_type not in BEHAVIOR_TYPES:
+            raise RowError(f'无效的行为类型: {behavior_type!r}')
+        behavior = UserBehavior(
+            user_id=self.resolve_user(row),
+            product_id=self.resolve_product(row),
+            behavior_type=behavior_type,
+            timestamp=parse_time(row.get('timestamp')),
+        )
+        self.check_not_archived(row, behavior)
+        return behavior
+
+    def check_not_archived(self, row, behavior):
+        """compact_behaviors 归档过的行（按原ID和分区判断）已计入行为汇总，再导入会重复计分"""
+        ranges = self.archived.get(behavior_period(behavior.timestamp))
+        if not ranges or not str(row.get('id') or '').isdigit():
+            return
+        behavior_id = int(row['id'])
+        if any(first_id <= behavior_id <= last_id for first_id, last_id in ranges):
+            raise RowError(f'行为 {behavior_id} 已归档并计入行为汇总，请用 compact_behaviors --restore 恢复')
+
+    def valid_behaviors(self, rows, state):
+        for line_no, row in rows:
+            try:
+                yield line_no, self.parse_behavior(row)
+            except RowError as e:
+                self.reject(line_no, row, e, state)
+
+    def import_behaviors(self, rows, state, started):
+        for chunk in batched(self.valid_behaviors(rows, state), self.options['chunk_size']):
+            objs = [obj for _, obj in chunk]
+            with transaction.atomic(), explicit_timestamps(UserBehavior):
+                UserBehavior.objects.bulk_create(objs, batch_size=self.options['batch_size'])
+            for behavior_type, count in Counter(obj.behavior_type for obj in objs).items():
+                metrics.BEHAVIORS_INSERTED.inc(count, behavior_type=behavior_type, source='import')
+            self.commit_chunk(state, chunk[-1][0], len(objs), started)
+
+    # ---- 订单 ----
+
+    def parse_order(self, order_ref, lines):
+        """把同一订单号的连续行转为 (订单, [订单项])"""
+        items = []
+        user_id = status = None
+        for _, row in lines:
+            line_user_id = self.resolve_user(row)
+            if user_id is not None and line_user_id != user_id:
+                raise RowError(f'同一订单的用户不一致: {user_id} / {line_user_id}')
+            user_id = line_user_id
+            status = row.get('status') or 'paid'
+            if status not in ORDER_STATUSES:
+                raise RowError(f'无效的订单状态: {status!r}')
+            try:
+                quantity = int(row.get('quantity'))
+                price = Decimal(str(row.get('price')))
+            except (TypeError, ValueError, InvalidOperation):
+                raise RowError('无效的数量或价格')
+            if quantity <= 0:
+                raise RowError(f'无效的数量: {quantity}')
+            items.append(OrderItem(
+                product_id=self.resolve_product(row),
+                quantity=quantity,
+                price=price,
+                purchase_date=parse_time(row.get('purchase_date')),
+            ))
+        family_id = self.user_family[user_id]
+        if family_id is None:
+            raise RowError(f'用户未加入家庭: {user_id}')
+        created_at = min(item.purchase_date for item in items)
+        order = Order(
+            family_id=family_id, user_id=user_id, status=status,
+            total_price=sum(item.price * item.quantity for item in items),
+            created_at=created_at, updated_at=created_at,
+        )
+        return order, items
+
+    def valid_orders(self, rows, state):
+        for order_ref, lines in groupby(rows, key=lambda r: r[1].get('order')):
+            lines = list(lines)
+            try:
+                if not order_ref:
+                    raise RowError('缺少订单号')
+                yield lines[-1][0], self.parse_order(order_ref, lines)
+            except RowError as e:
+                for line_no, row in lines:
+                    self.reject(line_no, row, e, state)
+
+    def import_orders(self, rows, state, started):
+        batch_size = self.options['batch_size']
+        # 检查点只落在订单边界上，续传时不会拆开同一订单
+        for chunk in batched(self.valid_orders(rows, state), self.options['chunk_size']):
+            with transaction.atomic(), explicit_timestamps(Order, OrderItem, UserBehavior):
+                orders = Order.objects.bulk_create([order for _, (order, _) in chunk], batch_size=batch_size)
+                items, behaviors = [], []
+                for order, (_, (_, order_items)) in zip(orders, chunk):
+                    for item in order_items:
+                        item.order_id = order.id
+                        items.append(item)
+                        if self.options['purchase_behaviors']:
+                            behaviors.append(UserBehavior(
+                                user_id=order.user_id, product_id=item.product_id,
+                                behavior_type='purchase', timestamp=item.purchase_date,
+                            ))
+                OrderItem.objects.bulk_create(items, batch_size=batch_size)
+                UserBehavior.objects.bulk_create(behaviors, batch_size=batch_size)
+            metrics.ORDER_ITEMS.inc(len(items))
+            if behaviors:
+                metrics.BEHAVIORS_INSERTED.inc(len(behaviors), behavior_type='purchase', source='import')
+            self.commit_chunk(state, chunk[-1][0], len(items), started)
+
+    # ---- 检查点 ----
+
+    def commit_chunk(self, state, last_line, count, started):
+        state['offset'] = last_line
+        state['imported'] += count
+        if self.checkpoint_path:
+            tmp = f'{self.checkpoint_path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.checkpoint_path)
+        rate = state['imported'] / max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(f"  已导入 {state['imported']} 行（输入第 {last_line} 行，{rate:.0f} 行/秒）")
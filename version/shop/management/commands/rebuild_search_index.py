@@ -0,0 +1,25 @@
+"""
+重建商品全文检索索引
+用法: python manage.py rebuild_search_index
+修改 SHOP_SEARCH['TOKENIZER'] 后需要重新执行
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = '重建商品全文检索索引（SQLite FTS5）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='每批写入的商品数量')
+
+    def handle(self, *args, **options):
+        connection = search.get_connection(for_write=True)
+        if not search.is_enabled(connection):
+            raise CommandError(
+                f'当前数据库后端 ({connection.vendor}) 未启用FTS5索引，检索将回退到 icontains 查询'
+            )
+        count = search.rebuild_index(connection=connection, batch_size=options['batch_size'])
+        tokenizer = search.get_search_settings()['TOKENIZER']
+        self.stdout.write(self.style.SUCCESS(f'✓ 已为 {count} 个商品重建索引（分词方式: {tokenizer}）'))
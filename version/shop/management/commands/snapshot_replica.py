@@ -0,0 +1,55 @@
+"""
+生成SQLite只读副本快照
+用法: python manage.py snapshot_replica
+建议通过cron定期执行，如每5分钟：
+    */5 * * * * cd /path/to/version && python manage.py snapshot_replica
+"""
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.routers import PRIMARY_ALIAS, get_read_alias
+
+
+class Command(BaseCommand):
+    help = '用SQLite在线备份API把主库复制为只读副本快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='每步复制的页数，较小的值减少对主库写入的阻塞')
+
+    def handle(self, *args, **options):
+        alias = get_read_alias()
+        if alias == PRIMARY_ALIAS:
+            raise CommandError('未配置只读副本，请设置 DJANGO_SQLITE_REPLICA_PATH')
+
+        source = connections[PRIMARY_ALIAS]
+        if source.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('快照仅支持SQLite，其他数据库请使用数据库自身的复制机制')
+
+        target_path = str(settings.DATABASES[alias]['NAME'])
+        tmp_path = f'{target_path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        started = time.perf_counter()
+        source.ensure_connection()
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.connection.backup(target, pages=options['pages'])
+            # 快照文件使用普通日志模式，副本连接只读
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        # 原子替换，正在读取旧快照的连接不受影响
+        os.replace(tmp_path, target_path)
+
+        elapsed = time.perf_counter() - started
+        size_mb = os.path.getsize(target_path) / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 副本快照已更新: {target_path} ({size_mb:.1f}MB, 用时 {elapsed:.2f}秒)'
+        ))
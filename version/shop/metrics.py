@@ -0,0 +1,283 @@
+"""
+运行指标 - 进程内的计数器和直方图，以 Prometheus 文本格式在 /metrics 输出
+
+单进程部署时指标只保存在内存中。多进程部署（如 gunicorn 多个worker）时设置
+SHOP_METRICS['DIR']（环境变量 SHOP_METRICS_DIR）：每个进程定期把自己的指标快照写到该目录，
+/metrics 汇总目录下所有进程的数据。该目录应在每次部署启动前清空。
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_SETTINGS = {
+    'DIR': None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': None,
+}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def get_metrics_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_METRICS', {})}
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{n}="{escape_label(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类，按标签值分别保存"""
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    def merge_into(self, values, key, value):
+        values[key] = values.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def empty(self):
+        return {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = self.empty()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+        self.registry.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def merge_into(self, values, key, value):
+        state = values.get(key)
+        if state is None:
+            state = values[key] = self.empty()
+        for i, count in enumerate(value['buckets']):
+            state['buckets'][i] += count
+        state['sum'] += value['sum']
+        state['count'] += value['count']
+
+    def samples(self, values):
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                yield self.name + '_bucket', format_labels(
+                    self.labelnames, key, [('le', format_value(float(bound)))]), cumulative
+            labels = format_labels(self.labelnames, key)
+            yield self.name + '_sum', labels, state['sum']
+            yield self.name + '_count', labels, state['count']
+
+
+class Registry:
+    """指标注册表，多进程时负责把本进程快照写入共享目录并汇总"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.RLock()
+        self.last_flush = 0.0
+        self.dirty = False
+        self.timer = None
+        self.pid = None
+        self._file_name = None
+
+    @property
+    def file_name(self):
+        # 在fork出的worker中重新生成，避免多个进程写同一个文件
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self._file_name = f'{self.pid}-{int(time.time() * 1000)}.json'
+        return self._file_name
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'指标已存在: {metric.name}')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    # ---- 多进程 ----
+
+    def directory(self):
+        return get_metrics_settings()['DIR']
+
+    def changed(self):
+        """
+        指标更新后按间隔把快照写入共享目录
+        间隔内的更新先标记为未写入，由后台定时器在间隔到期时写入（或本进程下次汇总时写入），
+        避免worker空闲后其他进程一直读到旧数据
+        """
+        directory = self.directory()
+        if not directory:
+            return
+        remaining = get_metrics_settings()['FLUSH_INTERVAL'] - (time.monotonic() - self.last_flush)
+        if remaining <= 0:
+            self.flush(directory)
+            return
+        with self.lock:
+            self.dirty = True
+            # fork出的worker不继承父进程的定时器线程
+            if self.timer is None or not self.timer.is_alive():
+                self.timer = threading.Timer(remaining, self.flush_dirty)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush_dirty(self):
+        if self.dirty:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def flush(self, directory=None):
+        directory = directory or self.directory()
+        if not directory:
+            return
+        with self.lock:
+            self.last_flush = time.monotonic()
+            self.dirty = False
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.file_name)
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+
+    def collect(self):
+        """汇总所有进程的数据：{指标名: {标签值: 数值}}"""
+        merged = {name: {} for name in self.metrics}
+        self.flush_dirty()
+        snapshots = [self.snapshot()]
+        directory = self.directory()
+        if directory and os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                # 本进程使用内存中的最新数据
+                if not file_name.endswith('.json') or file_name == self.file_name:
+                    continue
+                try:
+                    with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in entries:
+                    metric.merge_into(merged[name], tuple(key), value)
+        return merged
+
+    def exposition(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample, labels, value in metric.samples(values):
+                lines.append(f'{sample}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush_dirty)
+
+# ---- 指标定义 ----
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'shop_http_requests_total', '按视图、方法和状态码统计的请求数', ['view', 'method', 'status'])
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'shop_http_request_duration_seconds', '按视图统计的请求耗时', ['view'])
+RECOMMENDER_STAGE_DURATION = REGISTRY.histogram(
+    'shop_recommender_stage_duration_seconds', '推荐系统各阶段耗时', ['stage'])
+RECOMMENDATIONS = REGISTRY.counter(
+    'shop_recommendations_total', '推荐请求数（cf: 协同过滤，popular: 热门商品回退）', ['source'])
+CHECKOUTS = REGISTRY.counter(
+    'shop_checkouts_total', '结算结果', ['result'])
+CHECKOUT_DURATION = REGISTRY.histogram(
+    'shop_checkout_duration_seconds', '结算耗时（含订单写入）')
+ORDER_ITEMS = REGISTRY.counter(
+    'shop_order_items_total', '结算写入的订单项数')
+BEHAVIORS_INSERTED = REGISTRY.counter(
+    'shop_behaviors_inserted_total', '写入的用户行为记录数', ['behavior_type', 'source'])
+BEHAVIORS_SUPPRESSED = REGISTRY.counter(
+    'shop_behaviors_suppressed_total', '去重窗口内被跳过的重复行为数', ['behavior_type', 'source'])
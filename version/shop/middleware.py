@@ -0,0 +1,136 @@
+"""
+shop应用中间件（同时支持WSGI和ASGI：下游为异步时 __call__ 返回协程）
+"""
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import metrics, profiling, routers
+
+
+class ReadYourWritesMiddleware:
+    """
+    读己所写：请求内写入主库后，通过Cookie把该客户端接下来
+    SHOP_READ_YOUR_WRITES_SECONDS 秒内的请求固定到主库，规避副本延迟
+    """
+    cookie_name = 'shop_pin_primary'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = routers.begin_request(pinned=self.cookie_name in request.COOKIES)
+        try:
+            return self.process_response(self.get_response(request))
+        finally:
+            routers.end_request(tokens)
+
+    async def __acall__(self, request):
+        tokens = routers.begin_request(pinned=self.cookie_name in request.COOKIES)
+        try:
+            return self.process_response(await self.get_response(request))
+        finally:
+            routers.end_request(tokens)
+
+    def process_response(self, response):
+        if routers.has_written() and routers.has_replica():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=getattr(settings, 'SHOP_READ_YOUR_WRITES_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    请求性能分析（默认关闭）：SHOP_PROFILING['ENABLED'] 为True时分析所有请求，
+    否则只分析带 X-Shop-Profile 请求头的工作人员请求（DEBUG下不限用户）
+    需放在 AuthenticationMiddleware 之后
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = profiling.get_profiling_settings()
+        self.header = 'HTTP_' + self.config['HEADER'].upper().replace('-', '_')
+        profiling.install_template_hook()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def requested_mode(self, request):
+        """返回 None（不分析）、'basic' 或 'cprofile'"""
+        value = request.META.get(self.header, '').strip().lower()
+        if value and value != '0':
+            user = getattr(request, 'user', None)
+            if settings.DEBUG or (user is not None and user.is_staff):
+                return 'cprofile' if value == 'cprofile' else 'basic'
+        if self.config['ENABLED']:
+            return 'cprofile' if self.config['CPROFILE'] else 'basic'
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return self.profile(self.get_response, request, mode)
+
+    async def __acall__(self, request):
+        if not request.META.get(self.header) and not self.config['ENABLED']:
+            return await self.get_response(request)
+        # 判断权限需要加载 request.user；被分析的请求整体在同步线程中处理，以便记录该线程上的查询
+        mode = await sync_to_async(self.requested_mode)(request)
+        if mode is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.profile)(async_to_sync(self.get_response), request, mode)
+
+    def profile(self, get_response, request, mode):
+        response, recorder = profiling.profile_request(
+            get_response, request,
+            use_cprofile=mode == 'cprofile', limit=self.config['CPROFILE_LIMIT'],
+        )
+        response['Server-Timing'] = recorder.server_timing()
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            profiling.record_summary(match.view_name, request.get_full_path(), recorder)
+        return response
+
+
+class MetricsMiddleware:
+    """按视图统计请求数和耗时（标签使用URL名称而不是路径，避免标签数量失控）"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        return self.observe(request, self.get_response(request), started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        return self.observe(request, await self.get_response(request), started)
+
+    def observe(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else '<unresolved>'
+        metrics.HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, view=view)
+        return response
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from shop import search
+    if not search.is_enabled(schema_editor.connection):
+        return
+    search.rebuild_index(apps.get_model('shop', 'Product'), schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from shop import search
+    if schema_editor.connection.vendor == 'sqlite':
+        search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
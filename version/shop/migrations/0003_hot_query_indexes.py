@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-19 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['family', 'status', 'created_at'], name='order_family_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['family', 'created_at'], name='order_family_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['purchase_date'], name='orderitem_purchase_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbehavior',
+            index=models.Index(fields=['user', 'behavior_type'], name='behavior_user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbehavior',
+            index=models.Index(fields=['product', 'timestamp'], name='behavior_product_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbehavior',
+            index=models.Index(fields=['timestamp', 'id'], name='behavior_time_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_missing_profiles_and_carts(apps, schema_editor):
+    """首页不再创建家庭画像和购物车，为已有家庭补齐"""
+    Family = apps.get_model('shop', 'Family')
+    FamilyProfile = apps.get_model('shop', 'FamilyProfile')
+    Cart = apps.get_model('shop', 'Cart')
+    db = schema_editor.connection.alias
+    FamilyProfile.objects.using(db).bulk_create([
+        FamilyProfile(family_id=family_id)
+        for family_id in Family.objects.using(db).filter(profile__isnull=True).values_list('id', flat=True)
+    ])
+    Cart.objects.using(db).bulk_create([
+        Cart(family_id=family_id)
+        for family_id in Family.objects.using(db).filter(cart__isnull=True).values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles_and_carts, migrations.RunPython.noop),
+    ]
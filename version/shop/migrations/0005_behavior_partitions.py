@@ -0,0 +1,97 @@
+# Generated by Django 4.2 on 2026-10-19 07:15
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.utils import timezone
+import django.db.models.deletion
+import shop.models
+
+
+def backfill_periods(apps, schema_editor):
+    """按月份逐段更新已有行为的分区键（每个月一条 UPDATE，走时间索引）"""
+    UserBehavior = apps.get_model('shop', 'UserBehavior')
+    behaviors = UserBehavior.objects.using(schema_editor.connection.alias)
+    bounds = behaviors.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+    if bounds['first'] is None:
+        return
+    first, last = (timezone.localtime(value) for value in (bounds['first'], bounds['last']))
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        start = timezone.make_aware(datetime(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        end = timezone.make_aware(datetime(year, month, 1))
+        behaviors.filter(timestamp__gte=start, timestamp__lt=end).update(period=start.year * 100 + start.month)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_backfill_family_profile_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BehaviorAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_count', models.PositiveIntegerField(default=0, verbose_name='浏览次数')),
+                ('add_to_cart_count', models.PositiveIntegerField(default=0, verbose_name='加购次数')),
+                ('purchase_count', models.PositiveIntegerField(default=0, verbose_name='购买次数')),
+                ('first_timestamp', models.DateTimeField(verbose_name='最早行为时间')),
+                ('last_timestamp', models.DateTimeField(verbose_name='最近行为时间')),
+            ],
+            options={
+                'verbose_name': '行为汇总',
+                'verbose_name_plural': '行为汇总',
+            },
+        ),
+        migrations.CreateModel(
+            name='BehaviorArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveIntegerField(verbose_name='月份分区')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='归档文件')),
+                ('rows', models.PositiveIntegerField(verbose_name='行数')),
+                ('first_id', models.PositiveBigIntegerField(verbose_name='起始行为ID')),
+                ('last_id', models.PositiveBigIntegerField(verbose_name='结束行为ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='归档时间')),
+            ],
+            options={
+                'verbose_name': '行为归档',
+                'verbose_name_plural': '行为归档',
+                'ordering': ['period', 'id'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='userbehavior',
+            options={'verbose_name': '用户行为', 'verbose_name_plural': '用户行为'},
+        ),
+        migrations.AddField(
+            model_name='userbehavior',
+            name='period',
+            field=shop.models.PeriodField(default=0, editable=False, verbose_name='月份分区'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_periods, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userbehavior',
+            index=models.Index(fields=['period', 'user', 'product', 'behavior_type'], name='behavior_period_idx'),
+        ),
+        migrations.AddField(
+            model_name='behavioraggregate',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='behavior_aggregates', to='shop.product', verbose_name='商品'),
+        ),
+        migrations.AddField(
+            model_name='behavioraggregate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='behavior_aggregates', to=settings.AUTH_USER_MODEL, verbose_name='用户'),
+        ),
+        migrations.AddConstraint(
+            model_name='behavioraggregate',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='behavior_aggregate_user_product'),
+        ),
+    ]
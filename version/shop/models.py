@@ -192,6 +192,12 @@ class Order(models.Model):
         verbose_name = '订单'
         verbose_name_plural = '订单'
         ordering = ['-created_at']
+        indexes = [
+            # 生命周期推荐：按家庭和订单状态筛选
+            models.Index(fields=['family', 'status', 'created_at'], name='order_family_status_idx'),
+            # 个人中心：家庭订单按时间倒序
+            models.Index(fields=['family', 'created_at'], name='order_family_created_idx'),
+        ]
     
     def __str__(self):
         return f'订单 #{self.id} - {self.family.name}'
@@ -217,6 +223,9 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = '订单项'
         verbose_name_plural = '订单项'
+        indexes = [
+            models.Index(fields=['purchase_date'], name='orderitem_purchase_date_idx'),
+        ]
     
     def __str__(self):
         return f'{self.product.name} x {self.quantity}'
@@ -234,8 +243,63 @@ class OrderItem(models.Model):
         return lifecycle_percentage >= 0.7
 
 
+def behavior_period(value):
+    """时间所在的月份分区，如 202401（按 TIME_ZONE 的本地时间划分）"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.year * 100 + value.month
+
+
+class PeriodField(models.PositiveIntegerField):
+    """月份分区键，保存时按 source 时间字段填写（save 和 bulk_create 都会经过 pre_save）"""
+
+    def __init__(self, *args, source='timestamp', **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.source != 'timestamp':
+            kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # 需声明在 source 字段之后，auto_now_add 已先填写了时间
+        value = getattr(model_instance, self.source)
+        if value is None:
+            return super().pre_save(model_instance, add)
+        period = behavior_period(value)
+        setattr(model_instance, self.attname, period)
+        return period
+
+
+class UserBehaviorQuerySet(models.QuerySet):
+    """按分区键路由的查询：时间范围条件同时换算成分区键范围，只扫描涉及的月份分区"""
+
+    def between(self, start=None, end=None):
+        """start <= timestamp < end"""
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(period__gte=behavior_period(start), timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(period__lte=behavior_period(end), timestamp__lt=end)
+        return queryset
+
+    def recent(self, days):
+        """最近 days 天的行为"""
+        return self.between(start=timezone.now() - timedelta(days=days))
+
+    def in_periods(self, *periods):
+        return self.filter(period__in=periods)
+
+    def periods(self):
+        """现有的分区（升序）"""
+        return list(self.order_by('period').values_list('period', flat=True).distinct())
+
+
 class UserBehavior(models.Model):
-    """用户行为记录"""
+    """用户行为记录（按月分区，旧分区由 compact_behaviors 命令归档并汇总到 BehaviorAggregate）"""
     BEHAVIOR_CHOICES = [
         ('view', '浏览'),
         ('add_to_cart', '加入购物车'),
@@ -260,6 +324,9 @@ class UserBehavior(models.Model):
         verbose_name='行为类型'
     )
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name='时间戳')
+    period = PeriodField(verbose_name='月份分区')
+    
+    objects = UserBehaviorQuerySet.as_manager()
     
     # 用于协同过滤的评分（浏览=1, 加入购物车=3, 购买=5）
     BEHAVIOR_SCORES = {
@@ -271,7 +338,17 @@ class UserBehavior(models.Model):
     class Meta:
         verbose_name = '用户行为'
         verbose_name_plural = '用户行为'
-        ordering = ['-timestamp']
+        # 不设默认排序：未切片的查询（训练、导出、聚合）不必对整张表排序，需要顺序时显式 order_by
+        indexes = [
+            # 按用户和行为类型筛选（如用户的购买记录）
+            models.Index(fields=['user', 'behavior_type'], name='behavior_user_type_idx'),
+            # 商品的行为记录按时间排序、热门统计
+            models.Index(fields=['product', 'timestamp'], name='behavior_product_time_idx'),
+            # 后台列表等按时间倒序的全表浏览
+            models.Index(fields=['timestamp', 'id'], name='behavior_time_idx'),
+            # 按分区筛选、压缩时按（用户, 商品, 行为类型）汇总一个分区（覆盖索引）
+            models.Index(fields=['period', 'user', 'product', 'behavior_type'], name='behavior_period_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} - {self.get_behavior_type_display()} - {self.product.name}'
@@ -279,3 +356,65 @@ class UserBehavior(models.Model):
     def get_score(self):
         """获取行为评分"""
         return self.BEHAVIOR_SCORES.get(self.behavior_type, 0)
+
+
+class BehaviorAggregate(models.Model):
+    """已压缩分区的行为汇总：每个（用户, 商品）一行，训练时与未压缩的行为一起计分"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='behavior_aggregates',
+        verbose_name='用户'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='behavior_aggregates',
+        verbose_name='商品'
+    )
+    view_count = models.PositiveIntegerField(default=0, verbose_name='浏览次数')
+    add_to_cart_count = models.PositiveIntegerField(default=0, verbose_name='加购次数')
+    purchase_count = models.PositiveIntegerField(default=0, verbose_name='购买次数')
+    first_timestamp = models.DateTimeField(verbose_name='最早行为时间')
+    last_timestamp = models.DateTimeField(verbose_name='最近行为时间')
+    
+    # 行为类型对应的计数字段
+    COUNT_FIELDS = {
+        'view': 'view_count',
+        'add_to_cart': 'add_to_cart_count',
+        'purchase': 'purchase_count',
+    }
+    
+    class Meta:
+        verbose_name = '行为汇总'
+        verbose_name_plural = '行为汇总'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='behavior_aggregate_user_product'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user.username} - {self.product.name}'
+    
+    def get_score(self):
+        """与逐条行为评分之和相同"""
+        return sum(getattr(self, field) * UserBehavior.BEHAVIOR_SCORES[behavior_type]
+                   for behavior_type, field in self.COUNT_FIELDS.items())
+
+
+class BehaviorArchive(models.Model):
+    """压缩时写出的原始行为归档文件（gzip压缩的JSONL）；其中的行为已计入汇总，
+    恢复需用 compact_behaviors --restore，用 import_behaviors 导入会被拒绝"""
+    period = models.PositiveIntegerField(verbose_name='月份分区')
+    path = models.CharField(max_length=500, unique=True, verbose_name='归档文件')
+    rows = models.PositiveIntegerField(verbose_name='行数')
+    first_id = models.PositiveBigIntegerField(verbose_name='起始行为ID')
+    last_id = models.PositiveBigIntegerField(verbose_name='结束行为ID')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='归档时间')
+    
+    class Meta:
+        verbose_name = '行为归档'
+        verbose_name_plural = '行为归档'
+        ordering = ['period', 'id']
+    
+    def __str__(self):
+        return f'{self.period} - {self.path}'
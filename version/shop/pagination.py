@@ -0,0 +1,171 @@
+"""
+大表分页 - 供只追加的大表（如用户行为）在后台列表中使用
+
+- EstimatedCountPaginator: 不做全表 COUNT(*)。未筛选时使用数据库统计信息估算行数
+  （PostgreSQL 的 reltuples，SQLite 的 sqlite_stat1，需执行过 ANALYZE）；没有统计信息或
+  筛选后最多数到 count_limit 行，结果缓存一段时间
+- KeysetChangeList: 按默认排序浏览时用键集分页（WHERE (timestamp, id) < 游标 LIMIT n），
+  翻到多深都只扫描一页的索引；按其他列排序时回退到普通的页码分页
+"""
+import hashlib
+from datetime import datetime
+
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'after'
+COUNT_CACHE_KEY = 'shop:admin:count:{}'
+
+
+def table_row_estimate(model, using):
+    """根据数据库统计信息估算表行数，无法估算时返回None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # 从未 ANALYZE 的表 reltuples 为 -1
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # ANALYZE 写入的统计信息，stat 的第一个数为行数；表有删除（行为压缩、后台批量删除）时
+            # 不能用主键首尾之差估算。从未 ANALYZE 时没有 sqlite_stat1 表
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+            return max(counts) if counts else None
+    return None
+
+
+def refresh_statistics(model, using):
+    """大量删除后更新表的统计信息（估算总数和查询计划都依赖它）"""
+    connection = connections[using]
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+
+
+class EstimatedCountPaginator(Paginator):
+    """总数为估算值的分页器（count_is_estimate 表示是否为估算）"""
+    count_limit = 10000
+    count_cache_timeout = 300
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = table_row_estimate(queryset.model, queryset.db)
+            if estimate is not None:
+                self.count_is_estimate = True
+                return estimate
+
+        # 筛选后的结果最多数到 count_limit+1 行，超过即视为估算
+        sql, params = queryset.query.sql_with_params()
+        key = COUNT_CACHE_KEY.format(hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by()[:self.count_limit + 1].count()
+            cache.set(key, count, self.count_cache_timeout)
+        self.count_is_estimate = count > self.count_limit
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    按 model_admin.keyset_ordering（如 ('-timestamp', '-id')）键集分页的后台列表
+
+    游标为上一页最后一行的排序字段值，以 ?after=值1,值2 传递；只提供“第一页/下一页”导航。
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    def get_queryset(self, request):
+        # 游标不是筛选条件，也不应出现在筛选、排序和搜索的链接中（修改条件后回到第一页）
+        self.params.pop(CURSOR_VAR, None)
+        return super().get_queryset(request)
+
+    @property
+    def keyset_fields(self):
+        """[(字段名, 是否降序)]"""
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.model_admin.keyset_ordering]
+
+    def normalize_ordering(self, ordering):
+        """pk 换成主键字段名，去掉重复的排序字段（后出现的不影响结果）"""
+        pk = self.lookup_opts.pk.name
+        normalized = []
+        for name in ordering:
+            if not isinstance(name, str):
+                return None
+            if name.lstrip('-') == 'pk':
+                name = name.replace('pk', pk)
+            if name.lstrip('-') not in [n.lstrip('-') for n in normalized]:
+                normalized.append(name)
+        return normalized
+
+    def uses_keyset(self):
+        """只在默认排序下使用键集分页"""
+        return not self.show_all and (
+            self.normalize_ordering(self.queryset.query.order_by) == list(self.model_admin.keyset_ordering))
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self.keyset_fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if isinstance(value, datetime) else str(value))
+        return ','.join(values)
+
+    def cursor_filter(self, cursor):
+        """(a, b) < (x, y) 展开为 a < x OR (a = x AND b < y)，降序字段方向相反"""
+        values = cursor.split(',')
+        fields = self.keyset_fields
+        if len(values) != len(fields):
+            raise ValueError(cursor)
+        values = [self.lookup_opts.get_field(name).to_python(v) for (name, _), v in zip(fields, values)]
+        condition = Q()
+        for i, (name, descending) in enumerate(fields):
+            step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for (prev_name, _), value in zip(fields[:i], values[:i]):
+                step &= Q(**{prev_name: value})
+            condition |= step
+        return condition
+
+    def get_results(self, request):
+        if not self.uses_keyset():
+            self.keyset = False
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                queryset = queryset.filter(self.cursor_filter(self.cursor))
+            except (ValueError, ValidationError):
+                # 无法解析的游标回到第一页
+                self.cursor = None
+        rows = list(queryset[:self.list_per_page + 1])
+        has_next = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+
+        self.keyset = True
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = has_next or bool(self.cursor)
+        self.next_page_url = self.get_query_string({CURSOR_VAR: self.encode_cursor(rows[-1])}) if has_next else None
+        self.first_page_url = self.get_query_string() if self.cursor else None
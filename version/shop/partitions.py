@@ -0,0 +1,214 @@
+"""
+行为表按月分区 - 分区键、旧分区的压缩和归档
+
+UserBehavior.period 是行为时间（TIME_ZONE 本地时间）所在的月份，如 202401，保存和 bulk_create 时自动填写；
+UserBehavior.objects.between() / recent() 把时间范围同时换算成分区键条件。
+
+最近 HOT_MONTHS 个月（含当月）是热分区，保留原始行为；更早的分区由 compact_behaviors 命令压缩：
+1. 原始行为按 export 的行为格式写到归档目录下的 behaviors-<分区>-<起始ID>-<结束ID>.jsonl.gz
+2. 按（用户, 商品）汇总各类行为次数，累加到 BehaviorAggregate
+3. 删除已归档的原始行为，记录 BehaviorArchive
+归档文件写完（临时文件改名）后才在一个事务里汇总和删除。压缩期间写入同一分区的行为（如导入历史数据）
+ID 大于本次的结束ID，不会被删除，留待下次压缩。
+
+归档的行为已计入汇总，用 import_behaviors 重新导入会重复计分（该命令会拒绝这些行）；
+需要恢复原始行为时用 compact_behaviors --restore（restore_archive），按原ID写回并从汇总中减去。
+
+汇总的评分与逐条计分相同，训练（build_matrices）把两者相加；热门商品和离线评估只使用热分区的原始行为。
+"""
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import export
+from .bulk import batched, explicit_timestamps
+from .models import BehaviorAggregate, BehaviorArchive, Product, User, UserBehavior, behavior_period
+
+DEFAULT_SETTINGS = {
+    'HOT_MONTHS': 3,       # 保留原始行为的月数（含当月）
+    'ARCHIVE_DIR': None,   # 归档目录，默认 BASE_DIR/archive/behaviors
+}
+
+
+def get_partition_settings():
+    options = {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_BEHAVIOR_PARTITIONS', {})}
+    if not options['ARCHIVE_DIR']:
+        options['ARCHIVE_DIR'] = os.path.join(settings.BASE_DIR, 'archive', 'behaviors')
+    return options
+
+
+def shift_period(period, months):
+    """202401 前后移动若干个月"""
+    index = period // 100 * 12 + period % 100 - 1 + months
+    return index // 12 * 100 + index % 12 + 1
+
+
+def period_start(period):
+    """分区的起始时间（本地时间当月1日0点）"""
+    return timezone.make_aware(datetime(period // 100, period % 100, 1))
+
+
+def cold_periods(hot_months=None, now=None):
+    """需要压缩的分区：早于最近 hot_months 个月、且仍有原始行为的分区（升序）"""
+    if hot_months is None:
+        hot_months = get_partition_settings()['HOT_MONTHS']
+    first_hot = shift_period(behavior_period(now or timezone.now()), 1 - hot_months)
+    return UserBehavior.objects.filter(period__lt=first_hot).periods()
+
+
+def compacted_scores():
+    """已压缩行为的 (用户ID, 商品ID, 评分)，评分在数据库中计算"""
+    scores = UserBehavior.BEHAVIOR_SCORES
+    score = sum(F(field) * scores[behavior_type] for behavior_type, field in BehaviorAggregate.COUNT_FIELDS.items())
+    return BehaviorAggregate.objects.annotate(score=score).values_list(
+        'user_id', 'product_id', 'score'
+    ).iterator(chunk_size=10000)
+
+
+def write_archive(queryset, period, archive_dir, batch_size=5000):
+    """
+    把一个分区的原始行为写成gzip压缩的JSONL
+    :return: (文件路径, 行数, 起始ID, 结束ID)；分区没有行为时返回None
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    tmp = os.path.join(archive_dir, f'behaviors-{period}.jsonl.gz.tmp')
+    _, encode = export.row_encoder(export.BEHAVIOR_FIELDS, 'jsonl')
+    rows, first_id, last_id = 0, None, None
+    try:
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            for behavior_id, row in export.behavior_rows(queryset, batch_size=batch_size):
+                f.write(encode(row))
+                rows += 1
+                first_id = behavior_id if first_id is None else first_id
+                last_id = behavior_id
+        if not rows:
+            os.remove(tmp)
+            return None
+        path = os.path.join(archive_dir, f'behaviors-{period}-{first_id}-{last_id}.jsonl.gz')
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path, rows, first_id, last_id
+
+
+def merge_aggregates(queryset, batch_size=1000):
+    """按（用户, 商品）汇总 queryset 中的行为，累加到 BehaviorAggregate，返回汇总行数"""
+    counts = {field: Count('id', filter=Q(behavior_type=behavior_type))
+              for behavior_type, field in BehaviorAggregate.COUNT_FIELDS.items()}
+    grouped = queryset.values('user_id', 'product_id').annotate(
+        **counts, first_timestamp=Min('timestamp'), last_timestamp=Max('timestamp'),
+    ).order_by().iterator(chunk_size=batch_size)
+
+    merged = 0
+    for chunk in batched(grouped, batch_size):
+        existing = {
+            (aggregate.user_id, aggregate.product_id): aggregate
+            for aggregate in BehaviorAggregate.objects.filter(
+                user_id__in={row['user_id'] for row in chunk},
+                product_id__in={row['product_id'] for row in chunk},
+            )
+        }
+        creates, updates = [], []
+        for row in chunk:
+            aggregate = existing.get((row['user_id'], row['product_id']))
+            if aggregate is None:
+                creates.append(BehaviorAggregate(**row))
+                continue
+            for field in BehaviorAggregate.COUNT_FIELDS.values():
+                setattr(aggregate, field, getattr(aggregate, field) + row[field])
+            aggregate.first_timestamp = min(aggregate.first_timestamp, row['first_timestamp'])
+            aggregate.last_timestamp = max(aggregate.last_timestamp, row['last_timestamp'])
+            updates.append(aggregate)
+        BehaviorAggregate.objects.bulk_create(creates)
+        BehaviorAggregate.objects.bulk_update(
+            updates, [*BehaviorAggregate.COUNT_FIELDS.values(), 'first_timestamp', 'last_timestamp'])
+        merged += len(chunk)
+    return merged
+
+
+def compact_period(period, archive_dir=None, batch_size=5000):
+    """
+    压缩一个分区：归档原始行为、累加汇总、删除原始行为
+    :return: BehaviorArchive；分区没有行为时返回None
+    """
+    archive_dir = archive_dir or get_partition_settings()['ARCHIVE_DIR']
+    queryset = UserBehavior.objects.in_periods(period)
+    archived = write_archive(queryset, period, archive_dir, batch_size)
+    if archived is None:
+        return None
+    path, rows, first_id, last_id = archived
+    with transaction.atomic():
+        archived_rows = queryset.filter(id__gte=first_id, id__lte=last_id)
+        merge_aggregates(archived_rows)
+        archived_rows.delete()
+        return BehaviorArchive.objects.create(
+            period=period, path=path, rows=rows, first_id=first_id, last_id=last_id)
+
+
+def archived_ranges():
+    """{分区: [(起始ID, 结束ID)]}，这些行为已计入汇总"""
+    ranges = {}
+    for period, first_id, last_id in BehaviorArchive.objects.values_list('period', 'first_id', 'last_id'):
+        ranges.setdefault(period, []).append((first_id, last_id))
+    return ranges
+
+
+def read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def restore_archive(archive, batch_size=5000):
+    """
+    把归档文件中的行为按原ID写回行为表，并从汇总中减去（汇总的最早/最近时间不收缩）
+    已删除的用户或商品的行为不恢复（其汇总已随之删除）
+    :return: 恢复的行数
+    """
+    user_ids = set(User.objects.values_list('id', flat=True).iterator(chunk_size=50000))
+    product_ids = set(Product.objects.values_list('id', flat=True).iterator(chunk_size=50000))
+    counts = Counter()
+    restored = 0
+    with transaction.atomic():
+        rows = (row for row in read_archive(archive.path)
+                if row['user_id'] in user_ids and row['product_id'] in product_ids)
+        for chunk in batched(rows, batch_size):
+            behaviors = [UserBehavior(id=row['id'], user_id=row['user_id'], product_id=row['product_id'],
+                                      behavior_type=row['behavior_type'], timestamp=parse_datetime(row['timestamp']))
+                         for row in chunk]
+            with explicit_timestamps(UserBehavior):
+                UserBehavior.objects.bulk_create(behaviors)
+            counts.update((b.user_id, b.product_id, b.behavior_type) for b in behaviors)
+            restored += len(behaviors)
+
+        pairs = {(user_id, product_id) for user_id, product_id, _ in counts}
+        for chunk in batched(pairs, 1000):
+            aggregates = BehaviorAggregate.objects.filter(
+                user_id__in={user_id for user_id, _ in chunk},
+                product_id__in={product_id for _, product_id in chunk},
+            )
+            updates, empty = [], []
+            for aggregate in aggregates:
+                if (aggregate.user_id, aggregate.product_id) not in pairs:
+                    continue
+                for behavior_type, field in BehaviorAggregate.COUNT_FIELDS.items():
+                    count = counts[aggregate.user_id, aggregate.product_id, behavior_type]
+                    setattr(aggregate, field, max(getattr(aggregate, field) - count, 0))
+                if any(getattr(aggregate, field) for field in BehaviorAggregate.COUNT_FIELDS.values()):
+                    updates.append(aggregate)
+                else:
+                    empty.append(aggregate.pk)
+            BehaviorAggregate.objects.bulk_update(updates, list(BehaviorAggregate.COUNT_FIELDS.values()))
+            BehaviorAggregate.objects.filter(pk__in=empty).delete()
+        archive.delete()
+    return restored
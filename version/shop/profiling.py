@@ -0,0 +1,207 @@
+"""
+请求性能分析 - 记录每个请求的耗时、SQL查询（含重复查询检测）、模板渲染耗时和可选的cProfile
+
+通过 settings.SHOP_PROFILING['ENABLED'] 对所有请求开启，或由工作人员（DEBUG下任何人）
+在请求头中携带 X-Shop-Profile: 1（或 cprofile 同时开启cProfile）对单个请求开启。
+结果写入响应头 Server-Timing，并按视图汇总到缓存中，供工作人员在 /profiling/ 查看。
+"""
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'HEADER': 'X-Shop-Profile',
+    'CPROFILE': False,
+    'CPROFILE_LIMIT': 30,
+    'SUMMARY_TIMEOUT': 24 * 3600,
+    'MAX_DUPLICATES': 5,
+}
+SUMMARY_INDEX_KEY = 'shop:profiling:views'
+SUMMARY_KEY = 'shop:profiling:view:{}'
+# 把SQL中的字面量替换为占位符，用于识别只有参数不同的相似查询（典型的N+1）
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+
+# 当前请求的记录器，未开启分析时为None
+_current = ContextVar('shop_profiling_recorder', default=None)
+_install_lock = threading.Lock()
+_template_hook_installed = False
+
+
+def get_profiling_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_PROFILING', {})}
+
+
+def normalize_sql(sql):
+    """SQL模板：字面量和 IN 列表统一为占位符"""
+    return IN_LIST_RE.sub('IN (...)', LITERAL_RE.sub('%s', sql))
+
+
+class RequestRecorder:
+    """单个请求的分析数据"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = []
+        self.template_time = 0.0
+        self.templates = []
+        self.profile_text = None
+
+    def execute_wrapper(self, alias):
+        """django.db 的 execute_wrapper，记录每条SQL的耗时"""
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append((alias, sql, repr(params), time.perf_counter() - started))
+        return wrapper
+
+    def record_template(self, name, duration):
+        self.template_time += duration
+        self.templates.append(name)
+
+    @property
+    def query_time(self):
+        return sum(q[3] for q in self.queries)
+
+    def duplicates(self):
+        """完全相同（SQL和参数都相同）的查询：[(次数, SQL)]"""
+        counts = Counter((sql, params) for _, sql, params, _ in self.queries)
+        return [(n, sql) for (sql, _), n in counts.most_common() if n > 1]
+
+    def similar(self):
+        """只有参数不同的相似查询：[(次数, SQL模板)]"""
+        counts = Counter(normalize_sql(sql) for _, sql, _, _ in self.queries)
+        return [(n, sql) for sql, n in counts.most_common() if n > 1]
+
+    def server_timing(self):
+        """Server-Timing 响应头"""
+        return ', '.join([
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.query_time * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'dup;desc="{sum(n - 1 for n, _ in self.duplicates())} duplicate queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ])
+
+
+def install_template_hook():
+    """给Django模板后端的 Template.render 加计时（只统计顶层模板，未开启分析时只多一次ContextVar读取）"""
+    global _template_hook_installed
+    with _install_lock:
+        if _template_hook_installed:
+            return
+        from django.template.backends.django import Template
+
+        original = Template.render
+
+        def render(self, context=None, request=None):
+            recorder = _current.get()
+            if recorder is None:
+                return original(self, context, request)
+            started = time.perf_counter()
+            try:
+                return original(self, context, request)
+            finally:
+                recorder.record_template(self.origin.template_name, time.perf_counter() - started)
+
+        Template.render = render
+        _template_hook_installed = True
+
+
+def profile_request(get_response, request, use_cprofile=False, limit=30):
+    """在分析范围内处理请求，返回 (响应, 记录器)"""
+    recorder = RequestRecorder()
+    token = _current.set(recorder)
+    wrappers = []
+    for conn in connections.all():
+        cm = conn.execute_wrapper(recorder.execute_wrapper(conn.alias))
+        cm.__enter__()
+        wrappers.append(cm)
+    profiler = cProfile.Profile() if use_cprofile else None
+    try:
+        if profiler:
+            profiler.enable()
+        response = get_response(request)
+        # TemplateResponse 在中间件之外才渲染，这里提前渲染以便计入模板耗时
+        if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+            response.render()
+    finally:
+        if profiler:
+            profiler.disable()
+        for cm in reversed(wrappers):
+            cm.__exit__(None, None, None)
+        _current.reset(token)
+    recorder.total = time.perf_counter() - recorder.started
+    if profiler:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+        recorder.profile_text = stream.getvalue()
+    return response, recorder
+
+
+# ---- 按视图汇总 ----
+
+def record_summary(view_name, path, recorder):
+    """把一次请求合并到该视图的汇总中（缓存读改写，并发时可能丢失少量样本）"""
+    config = get_profiling_settings()
+    key = SUMMARY_KEY.format(view_name)
+    summary = cache.get(key) or {
+        'view': view_name, 'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+        'queries': 0, 'max_queries': 0, 'query_ms': 0.0, 'duplicates': 0,
+        'template_ms': 0.0, 'slowest': None, 'profile': None,
+    }
+    duplicates = recorder.duplicates()
+    total_ms = recorder.total * 1000
+    summary['requests'] += 1
+    summary['total_ms'] += total_ms
+    summary['queries'] += len(recorder.queries)
+    summary['max_queries'] = max(summary['max_queries'], len(recorder.queries))
+    summary['query_ms'] += recorder.query_time * 1000
+    summary['duplicates'] += sum(n - 1 for n, _ in duplicates)
+    summary['template_ms'] += recorder.template_time * 1000
+    if total_ms >= summary['max_ms']:
+        summary['max_ms'] = total_ms
+        summary['slowest'] = {
+            'path': path,
+            'total_ms': total_ms,
+            'queries': len(recorder.queries),
+            'templates': recorder.templates,
+            'duplicates': duplicates[:config['MAX_DUPLICATES']],
+            'similar': recorder.similar()[:config['MAX_DUPLICATES']],
+        }
+    if recorder.profile_text:
+        summary['profile'] = recorder.profile_text
+    cache.set(key, summary, config['SUMMARY_TIMEOUT'])
+
+    views = cache.get(SUMMARY_INDEX_KEY) or []
+    if view_name not in views:
+        cache.set(SUMMARY_INDEX_KEY, views + [view_name], config['SUMMARY_TIMEOUT'])
+
+
+def get_summaries():
+    """所有视图的汇总，按平均耗时降序"""
+    views = cache.get(SUMMARY_INDEX_KEY) or []
+    summaries = [s for s in cache.get_many([SUMMARY_KEY.format(v) for v in views]).values()]
+    for s in summaries:
+        s['avg_ms'] = s['total_ms'] / s['requests']
+        s['avg_queries'] = s['queries'] / s['requests']
+        s['avg_query_ms'] = s['query_ms'] / s['requests']
+        s['avg_template_ms'] = s['template_ms'] / s['requests']
+    return sorted(summaries, key=lambda s: s['avg_ms'], reverse=True)
+
+
+def reset_summaries():
+    views = cache.get(SUMMARY_INDEX_KEY) or []
+    cache.delete_many([SUMMARY_KEY.format(v) for v in views] + [SUMMARY_INDEX_KEY])
@@ -3,27 +3,51 @@
 """
 import numpy as np
 from collections import defaultdict
+from itertools import chain
+from django.core.cache import cache
 from django.db.models import Count, Q
+from . import catalog_cache, metrics, partitions, tracing
 from .models import UserBehavior, Product, User, OrderItem
+from .routers import analytical_reads
 from django.utils import timezone
 
 
 class RecommenderSystem:
     """推荐系统类"""
     
-    def __init__(self, alpha=0.5):
+    def __init__(self, alpha=0.5, lifecycle_boost=2.0, k_neighbors=None):
         """
         初始化推荐系统
         :param alpha: 用户协同过滤和商品协同过滤的权重 (0-1之间)
+        :param lifecycle_boost: 生命周期商品的评分提升
+        :param k_neighbors: 基于用户的协同过滤只使用最相似的K个用户（None表示全部用户）
         """
         self.alpha = alpha
+        self.lifecycle_boost = lifecycle_boost
+        self.k_neighbors = k_neighbors
         self.user_item_matrix = None
         self.item_user_matrix = None
         self.users = []
         self.products = []
+        self._user_similarity = None
+        self._item_similarity = None
         
-    def build_matrices(self):
-        """构建用户-商品评分矩阵"""
+    def build_matrices(self, behaviors=None):
+        """
+        构建用户-商品评分矩阵
+        :param behaviors: 可选的 (用户ID, 商品ID, 行为类型) 序列，用于在训练集上构建；
+                          默认使用热分区的全部行为加上已压缩分区的汇总评分
+        :return: (用户索引映射, 商品索引映射)
+        """
+        with tracing.span('build_matrices') as sp:
+            result = self._build_matrices(behaviors)
+            if sp and result is not None:
+                sp.set(shape=self.user_item_matrix.shape,
+                       nnz=int(np.count_nonzero(self.user_item_matrix)))
+            return result
+    
+    @analytical_reads()
+    def _build_matrices(self, behaviors):
         # 获取所有用户和商品
         self.users = list(User.objects.filter(is_superuser=False).values_list('id', flat=True))
         self.products = list(Product.objects.values_list('id', flat=True))
@@ -39,20 +63,50 @@ class RecommenderSystem:
         n_users = len(self.users)
         n_products = len(self.products)
         self.user_item_matrix = np.zeros((n_users, n_products))
-        
-        # 填充评分矩阵
-        behaviors = UserBehavior.objects.all()
-        for behavior in behaviors:
-            if behavior.user_id in user_idx and behavior.product_id in product_idx:
-                u_idx = user_idx[behavior.user_id]
-                p_idx = product_idx[behavior.product_id]
-                self.user_item_matrix[u_idx, p_idx] += behavior.get_score()
+        self._user_similarity = None
+        self._item_similarity = None
+        
+        # 填充评分矩阵（只取需要的列，不排序）
+        scores = UserBehavior.BEHAVIOR_SCORES
+        compacted = ()
+        if behaviors is None:
+            behaviors = UserBehavior.objects.values_list(
+                'user_id', 'product_id', 'behavior_type'
+            ).iterator(chunk_size=10000)
+            compacted = partitions.compacted_scores()
+        weighted = chain(
+            ((user_id, product_id, scores.get(behavior_type, 0)) for user_id, product_id, behavior_type in behaviors),
+            compacted,
+        )
+        rows, cols, values = [], [], []
+        for user_id, product_id, score in weighted:
+            u_idx = user_idx.get(user_id)
+            p_idx = product_idx.get(product_id)
+            if u_idx is not None and p_idx is not None:
+                rows.append(u_idx)
+                cols.append(p_idx)
+                values.append(score)
+        np.add.at(self.user_item_matrix, (rows, cols), values)
         
         # 转置得到商品-用户矩阵
         self.item_user_matrix = self.user_item_matrix.T
         
         return user_idx, product_idx
     
+    def get_user_similarity(self):
+        """用户相似度矩阵（每次构建矩阵后只计算一次）"""
+        if self._user_similarity is None:
+            with tracing.span('user_similarity', shape=self.user_item_matrix.shape):
+                self._user_similarity = self.cosine_similarity(self.user_item_matrix)
+        return self._user_similarity
+    
+    def get_item_similarity(self):
+        """商品相似度矩阵（每次构建矩阵后只计算一次）"""
+        if self._item_similarity is None:
+            with tracing.span('item_similarity', shape=self.item_user_matrix.shape):
+                self._item_similarity = self.cosine_similarity(self.item_user_matrix)
+        return self._item_similarity
+    
     def cosine_similarity(self, matrix):
         """
         计算余弦相似度
@@ -88,6 +142,19 @@ class RecommenderSystem:
         
         return (scores - min_score) / (max_score - min_score)
     
+    def normalize_rows(self, scores):
+        """
+        按行归一化评分到0-1之间（normalize_scores 的批量版本）
+        :param scores: 二维评分矩阵，每行对应一个用户
+        :return: 归一化后的矩阵
+        """
+        min_scores = scores.min(axis=1, keepdims=True)
+        max_scores = scores.max(axis=1, keepdims=True)
+        ranges = max_scores - min_scores
+        constant = ranges == 0
+        normalized = (scores - min_scores) / np.where(constant, 1, ranges)
+        return np.where(constant, 0.5, normalized)
+    
     def user_based_cf(self, user_id, user_idx, product_idx, top_n=10):
         """
         基于用户的协同过滤
@@ -99,24 +166,7 @@ class RecommenderSystem:
         """
         if user_id not in user_idx:
             return []
-        
-        u_idx = user_idx[user_id]
-        
-        # 计算用户相似度
-        user_similarity = self.cosine_similarity(self.user_item_matrix)
-        
-        # 获取目标用户的相似用户（排除自己）
-        similarities = user_similarity[u_idx].copy()
-        similarities[u_idx] = 0  # 排除自己
-        
-        # 预测评分
-        predictions = np.dot(similarities, self.user_item_matrix)
-        
-        # 排除用户已经交互过的商品
-        user_interacted = self.user_item_matrix[u_idx] > 0
-        predictions[user_interacted] = -1
-        
-        return predictions
+        return self.user_cf_scores([user_idx[user_id]])[0]
     
     def item_based_cf(self, user_id, user_idx, product_idx, top_n=10):
         """
@@ -129,30 +179,87 @@ class RecommenderSystem:
         """
         if user_id not in user_idx:
             return []
+        return self.item_cf_scores([user_idx[user_id]])[0]
+    
+    def user_cf_scores(self, u_indices, k_neighbors=None):
+        """
+        批量计算基于用户的协同过滤评分
+        :param u_indices: 用户在矩阵中的行索引列表
+        :param k_neighbors: 只使用最相似的K个用户，默认取 self.k_neighbors
+        :return: 评分矩阵 (用户数 x 商品数)，已交互商品为-1
+        """
+        u_indices = np.asarray(u_indices)
+        k_neighbors = k_neighbors or self.k_neighbors
         
-        u_idx = user_idx[user_id]
+        # 获取目标用户的相似用户（排除自己）
+        similarities = self.get_user_similarity()[u_indices].copy()
+        similarities[np.arange(len(u_indices)), u_indices] = 0
+        if k_neighbors and k_neighbors < similarities.shape[1]:
+            # 只保留最相似的K个邻居
+            others = np.argpartition(-similarities, k_neighbors - 1, axis=1)[:, k_neighbors:]
+            np.put_along_axis(similarities, others, 0, axis=1)
         
-        # 计算商品相似度
-        item_similarity = self.cosine_similarity(self.item_user_matrix)
+        # 预测评分
+        predictions = similarities @ self.user_item_matrix
         
-        # 获取用户评分
-        user_ratings = self.user_item_matrix[u_idx]
+        # 排除用户已经交互过的商品
+        predictions[self.user_item_matrix[u_indices] > 0] = -1
+        return predictions
+    
+    def item_cf_scores(self, u_indices):
+        """
+        批量计算基于商品的协同过滤评分
+        :param u_indices: 用户在矩阵中的行索引列表
+        :return: 评分矩阵 (用户数 x 商品数)，已交互商品为-1
+        """
+        user_ratings = self.user_item_matrix[np.asarray(u_indices)]
         
         # 预测评分
-        predictions = np.dot(user_ratings, item_similarity)
+        predictions = user_ratings @ self.get_item_similarity()
         
         # 排除用户已经交互过的商品
-        user_interacted = self.user_item_matrix[u_idx] > 0
-        predictions[user_interacted] = -1
-        
+        predictions[user_ratings > 0] = -1
         return predictions
     
+    def blend_scores(self, user_scores, item_scores, lifecycle_mask=None, alpha=None, lifecycle_boost=None):
+        """
+        归一化后加权融合两种协同过滤评分，并提升生命周期商品
+        融合是线性的，调参时可以复用同一组评分矩阵
+        """
+        alpha = self.alpha if alpha is None else alpha
+        lifecycle_boost = self.lifecycle_boost if lifecycle_boost is None else lifecycle_boost
+        final_scores = alpha * user_scores + (1 - alpha) * item_scores
+        if lifecycle_mask is not None:
+            final_scores[lifecycle_mask] += lifecycle_boost
+        return final_scores
+    
+    def score_users(self, u_indices, lifecycle_mask=None):
+        """
+        批量计算用户对所有商品的综合评分
+        :param u_indices: 用户在矩阵中的行索引列表
+        :param lifecycle_mask: 可选的布尔矩阵 (用户数 x 商品数)，True表示需要补充的生命周期商品
+        :return: 评分矩阵 (用户数 x 商品数)
+        """
+        return self.blend_scores(
+            self.normalize_rows(self.user_cf_scores(u_indices)),
+            self.normalize_rows(self.item_cf_scores(u_indices)),
+            lifecycle_mask,
+        )
+    
     def get_lifecycle_recommendations(self, user):
         """
         获取基于生命周期的推荐
         :param user: 用户对象
         :return: 需要补充的商品ID列表
         """
+        with tracing.span('lifecycle') as sp:
+            lifecycle_products = self._lifecycle_products(user)
+            if sp:
+                sp.set(candidates=len(lifecycle_products))
+            return lifecycle_products
+    
+    @analytical_reads()
+    def _lifecycle_products(self, user):
         if not user.family:
             return []
         
@@ -176,6 +283,13 @@ class RecommenderSystem:
         :param top_n: 返回top N个推荐
         :return: 推荐商品列表
         """
+        with tracing.span('total', user_id=user.id, top_n=top_n) as total:
+            recommendations = self._get_recommendations(user, top_n)
+            if total:
+                total.set(results=len(recommendations))
+            return recommendations
+    
+    def _get_recommendations(self, user, top_n):
         # 构建矩阵
         result = self.build_matrices()
         if result is None:
@@ -188,48 +302,40 @@ class RecommenderSystem:
         
         # 如果用户不在索引中，返回热门商品
         if user.id not in user_idx:
-            popular_products = Product.objects.annotate(
-                behavior_count=Count('behaviors')
-            ).order_by('-behavior_count')[:top_n]
-            return list(popular_products)
-        
-        # 基于用户的协同过滤
-        user_based_scores = self.user_based_cf(user.id, user_idx, product_idx, top_n)
-        
-        # 基于商品的协同过滤
-        item_based_scores = self.item_based_cf(user.id, user_idx, product_idx, top_n)
-        
-        # 加权融合
-        if len(user_based_scores) > 0 and len(item_based_scores) > 0:
-            # 归一化
-            user_based_scores = self.normalize_scores(user_based_scores)
-            item_based_scores = self.normalize_scores(item_based_scores)
+            metrics.RECOMMENDATIONS.inc(source='popular')
+            with tracing.span('popular_fallback') as sp, analytical_reads():
+                popular_products = list(Product.objects.annotate(
+                    behavior_count=Count('behaviors')
+                ).order_by('-behavior_count')[:top_n])
+                if sp:
+                    sp.set(results=len(popular_products))
+                return popular_products
+        
+        # 协同过滤评分融合，并大幅提升生命周期商品的评分（含相似度计算）
+        with tracing.span('scoring') as sp:
+            lifecycle_mask = np.zeros((1, len(self.products)), dtype=bool)
+            lifecycle_mask[0, [product_idx[pid] for pid in lifecycle_products if pid in product_idx]] = True
+            final_scores = self.score_users([user_idx[user.id]], lifecycle_mask)[0]
             
-            # 加权
-            final_scores = self.alpha * user_based_scores + (1 - self.alpha) * item_based_scores
-        else:
-            final_scores = user_based_scores if len(user_based_scores) > 0 else item_based_scores
-        
-        # 提升生命周期商品的评分
-        product_idx_reverse = {idx: product_id for product_id, idx in product_idx.items()}
-        for idx, product_id in product_idx_reverse.items():
-            if product_id in lifecycle_products:
-                final_scores[idx] += 2.0  # 大幅提升生命周期商品的评分
-        
-        # 获取top N推荐
-        top_indices = np.argsort(final_scores)[::-1][:top_n]
+            # 获取top N推荐
+            top_indices = np.argsort(final_scores)[::-1][:top_n]
+            if sp:
+                sp.set(candidates=int((final_scores > 0).sum()),
+                       lifecycle_boosted=int(lifecycle_mask.sum()))
         
         # 转换为商品ID
         product_idx_reverse = {idx: product_id for product_id, idx in product_idx.items()}
         recommended_product_ids = [product_idx_reverse[idx] for idx in top_indices if final_scores[idx] > 0]
         
         # 获取商品对象
-        recommended_products = Product.objects.filter(id__in=recommended_product_ids)
-        
-        # 按推荐顺序排序
-        product_dict = {p.id: p for p in recommended_products}
-        ordered_products = [product_dict[pid] for pid in recommended_product_ids if pid in product_dict]
-        
+        with tracing.span('fetch_products', requested=len(recommended_product_ids)) as sp:
+            # 按推荐顺序排序
+            product_dict = catalog_cache.get_products(recommended_product_ids)
+            ordered_products = [product_dict[pid] for pid in recommended_product_ids if pid in product_dict]
+            if sp:
+                sp.set(fetched=len(ordered_products))
+        
+        metrics.RECOMMENDATIONS.inc(source='cf')
         return ordered_products
 
 
@@ -243,3 +349,24 @@ def get_user_recommendations(user, top_n=10):
     recommender = RecommenderSystem(alpha=0.5)
     return recommender.get_recommendations(user, top_n)
 
+
+POPULAR_CACHE_KEY = 'shop:popular:{}'
+POPULAR_CACHE_TIMEOUT = 300
+
+
+def get_popular_products(top_n=8):
+    """
+    热门商品（按热分区的行为数排序）：聚合结果只缓存商品ID，商品从目录缓存读取
+    :param top_n: 返回top N个商品
+    :return: 商品列表
+    """
+    key = POPULAR_CACHE_KEY.format(top_n)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        with analytical_reads():
+            product_ids = list(Product.objects.annotate(
+                behavior_count=Count('behaviors')
+            ).order_by('-behavior_count').values_list('id', flat=True)[:top_n])
+        cache.set(key, product_ids, POPULAR_CACHE_TIMEOUT)
+    products = catalog_cache.get_products(product_ids)
+    return [products[pid] for pid in product_ids if pid in products]
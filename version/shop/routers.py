@@ -0,0 +1,109 @@
+"""
+数据库读写路由 - 分析型读取走只读副本，事务路径留在主库
+
+推荐训练、评估和后台列表等只读分析查询在 analytical_reads() 范围内执行时
+路由到 settings.SHOP_READ_DB_ALIAS；其余读取和所有写入都使用主库。
+请求内发生写入后自动固定到主库（读己所写），并通过Cookie把后续短时间内的
+请求也固定到主库，避免副本延迟导致刚写入的数据“消失”。
+"""
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_ALIAS = 'default'
+
+# 当前上下文是否为只读分析查询
+_analytical = ContextVar('shop_analytical_reads', default=False)
+# 当前上下文是否固定到主库（发生过写入或显式固定）
+_pinned = ContextVar('shop_pinned_to_primary', default=False)
+# 当前请求是否发生过写入
+_wrote = ContextVar('shop_wrote_primary', default=False)
+
+
+def get_read_alias():
+    """分析型读取使用的数据库别名（未配置副本时为主库）"""
+    alias = getattr(settings, 'SHOP_READ_DB_ALIAS', PRIMARY_ALIAS)
+    return alias if alias in settings.DATABASES else PRIMARY_ALIAS
+
+
+def has_replica():
+    """是否配置了独立的只读副本"""
+    return get_read_alias() != PRIMARY_ALIAS
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+class _ContextFlag(ContextDecorator):
+    """在代码块内把上下文变量置为True，可用作上下文管理器或装饰器"""
+
+    def __init__(self, var):
+        self.var = var
+        self.tokens = []
+
+    def _recreate_cm(self):
+        # 用作装饰器时每次调用使用独立实例，避免多线程共享token
+        return self.__class__(self.var)
+
+    def __enter__(self):
+        self.tokens.append(self.var.set(True))
+        return self
+
+    def __exit__(self, *exc):
+        self.var.reset(self.tokens.pop())
+        return False
+
+
+def analytical_reads():
+    """
+    只读分析查询范围：推荐训练、评估、后台列表等
+    注意查询集是惰性的，需在范围内求值（如 list(queryset)）
+    """
+    return _ContextFlag(_analytical)
+
+
+def pin_to_primary():
+    """强制范围内的读取使用主库"""
+    return _ContextFlag(_pinned)
+
+
+def has_written():
+    return _wrote.get()
+
+
+def begin_request(pinned=False):
+    """请求开始时重置路由状态，返回用于恢复的token"""
+    return _pinned.set(pinned), _wrote.set(False)
+
+
+def end_request(tokens):
+    pinned_token, wrote_token = tokens
+    _pinned.reset(pinned_token)
+    _wrote.reset(wrote_token)
+
+
+class ReadReplicaRouter:
+    """读写分离路由"""
+
+    def db_for_read(self, model, **hints):
+        if _analytical.get() and not _pinned.get():
+            return get_read_alias()
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # 写入后本上下文的读取都回到主库
+        _pinned.set(True)
+        _wrote.set(True)
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本是主库的拷贝，跨库关联视为同一数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本通过复制/快照同步结构，不单独迁移
+        if db != PRIMARY_ALIAS and db == get_read_alias():
+            return False
+        return None
@@ -0,0 +1,245 @@
+"""
+商品全文检索 - 基于SQLite FTS5的倒排索引
+索引字段：商品名称、分类名称、商品描述，按BM25相关度排序
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Q, Value, When
+
+# FTS5虚拟表名称
+FTS_TABLE = 'shop_product_fts'
+
+# BM25字段权重：名称 > 分类 > 描述（顺序与建表字段一致）
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+# CJK统一汉字（含扩展A区和兼容区）
+CJK_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+WORD_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[^\W_]+')
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'fts5',       # 'fts5' 或 'icontains'
+    'TOKENIZER': 'cjk',      # 'cjk': 中文按二元组切分；'unicode61': 按词切分
+    'MAX_RESULTS': 500,      # 单次检索返回的最大结果数
+}
+
+
+def get_search_settings():
+    """读取检索配置（settings.SHOP_SEARCH 覆盖默认值）"""
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'SHOP_SEARCH', {})}
+
+
+def get_connection(for_write=False):
+    """商品表所在的数据库连接"""
+    from .models import Product
+    alias = router.db_for_write(Product) if for_write else router.db_for_read(Product)
+    return connections[alias]
+
+
+def is_enabled(connection=None):
+    """当前数据库是否使用FTS5索引（非SQLite后端回退到 icontains）"""
+    connection = connection or get_connection()
+    return (
+        get_search_settings()['BACKEND'] == 'fts5'
+        and connection.vendor == 'sqlite'
+    )
+
+
+def tokenize(text, tokenizer=None):
+    """
+    把文本切分为索引词
+    :param text: 原始文本
+    :param tokenizer: 'cjk' 时连续汉字切为重叠二元组（牛奶 -> 牛奶，洗衣液 -> 洗衣 衣液），
+                      其他字符按词切分；'unicode61' 时只按词切分
+    :return: 小写的词列表
+    """
+    tokenizer = tokenizer or get_search_settings()['TOKENIZER']
+    tokens = []
+    for word in WORD_RE.findall(text or ''):
+        if tokenizer == 'cjk' and CJK_RE.fullmatch(word) and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def build_match_expression(query, tokenizer=None):
+    """
+    把用户输入转换为FTS5 MATCH表达式
+    每个空格分隔的关键词转为一个短语，关键词之间为AND关系
+    :return: MATCH表达式；无法用索引表达时返回None（如单个汉字）
+    """
+    tokenizer = tokenizer or get_search_settings()['TOKENIZER']
+    phrases = []
+    for term in query.split():
+        tokens = tokenize(term, tokenizer)
+        if not tokens:
+            continue
+        if tokenizer == 'cjk' and any(len(t) == 1 and CJK_RE.fullmatch(t) for t in tokens):
+            # 二元组索引无法匹配单个汉字
+            return None
+        phrase = '"' + ' '.join(tokens) + '"'
+        if tokenizer != 'cjk' or not CJK_RE.fullmatch(tokens[-1]):
+            phrase += '*'  # 最后一个词按前缀匹配（二元组本身已覆盖中文子串）
+        phrases.append(phrase)
+    return ' AND '.join(phrases) or None
+
+
+def _document(name, category_name, description, tokenizer):
+    return tuple(' '.join(tokenize(text, tokenizer)) for text in (name, category_name, description))
+
+
+def create_index(connection):
+    """创建FTS5虚拟表"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f"USING fts5(name, category, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_index(connection):
+    """删除FTS5虚拟表"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def index_rows(connection, rows, tokenizer=None):
+    """
+    写入/更新索引
+    :param rows: (商品ID, 名称, 分类名称, 描述) 的可迭代对象
+    :return: 写入的行数
+    """
+    tokenizer = tokenizer or get_search_settings()['TOKENIZER']
+    params = [(pk, *_document(name, category, description, tokenizer))
+              for pk, name, category, description in rows]
+    if not params:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(p[0],) for p in params])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE}(rowid, name, category, description) VALUES (%s, %s, %s, %s)',
+            params
+        )
+    return len(params)
+
+
+def index_products(product_ids):
+    """按商品ID重建对应的索引行（商品保存、分类改名、批量更新后调用）"""
+    from .models import Product
+    connection = get_connection(for_write=True)
+    if not is_enabled(connection):
+        return 0
+    rows = Product.objects.filter(id__in=product_ids).values_list(
+        'id', 'name', 'category__name', 'description'
+    )
+    return index_rows(connection, rows)
+
+
+def remove_products(product_ids):
+    """从索引中删除商品"""
+    connection = get_connection(for_write=True)
+    if not is_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(product_model=None, connection=None, batch_size=2000):
+    """
+    全量重建索引
+    :param product_model: 商品模型（迁移中传入历史模型）
+    :return: 索引的商品数量
+    """
+    if product_model is None:
+        from .models import Product as product_model
+    connection = connection or get_connection(for_write=True)
+    drop_index(connection)
+    create_index(connection)
+
+    total = 0
+    batch = []
+    rows = product_model.objects.using(connection.alias).order_by('id').values_list(
+        'id', 'name', 'category__name', 'description'
+    )
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += index_rows(connection, batch)
+            batch = []
+    total += index_rows(connection, batch)
+    return total
+
+
+def match_ids(query, limit=None, within=None):
+    """
+    在FTS5索引中检索
+    :param within: 可选的商品查询集（如按分类过滤），条件放进检索SQL，结果数上限在过滤之后计算
+    :return: 按相关度排序的商品ID列表；查询无法使用索引时返回None
+    """
+    config = get_search_settings()
+    expression = build_match_expression(query, config['TOKENIZER'])
+    if expression is None:
+        return None
+    weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+    connection = get_connection()
+    condition, params = '', [expression]
+    if within is not None:
+        subquery, subquery_params = within.order_by().values('pk').query.get_compiler(
+            connection=connection).as_sql()
+        condition = f' AND rowid IN ({subquery})'
+        params.extend(subquery_params)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{condition} '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+            [*params, limit or config['MAX_RESULTS']]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback_search(queryset, query):
+    """非SQLite后端的回退检索：icontains匹配，名称命中优先"""
+    condition = Q()
+    for term in query.split():
+        condition &= (
+            Q(name__icontains=term) |
+            Q(category__name__icontains=term) |
+            Q(description__icontains=term)
+        )
+    return queryset.filter(condition).annotate(
+        search_rank=Case(
+            When(name__icontains=query, then=Value(0)),
+            When(category__name__icontains=query, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank', '-created_at')
+
+
+def search_products(queryset, query):
+    """
+    检索商品，结果按相关度排序
+    :param queryset: 待检索的商品查询集（可已按分类等条件过滤）
+    :param query: 用户输入的检索词
+    :return: 排序后的查询集
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    # 查询集带过滤条件（如分类）时把条件放进检索，避免全库前 MAX_RESULTS 条里没有该分类的商品
+    within = queryset if queryset.query.has_filters() else None
+    ids = match_ids(query, within=within) if is_enabled() else None
+    if ids is None:
+        return fallback_search(queryset, query)
+    if not ids:
+        return queryset.none()
+
+    return queryset.filter(id__in=ids).annotate(
+        search_rank=Case(
+            *[When(id=pk, then=Value(rank)) for rank, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank')
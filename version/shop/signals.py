@@ -0,0 +1,91 @@
+"""
+模型信号处理 - 保持派生数据（检索索引、目录缓存、模板片段等）与商品数据同步
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache, fragments, search
+from .auth import invalidate_user
+from .models import Category, Family, FamilyProfile, Product, User, UserBehavior
+
+
+def is_stock_update(update_fields):
+    """结算扣减库存：save(update_fields=['stock'])"""
+    return update_fields is not None and set(update_fields) == {'stock'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    """商品保存后更新检索索引（库存不在索引中）"""
+    if raw or is_stock_update(update_fields):
+        return
+    transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """商品删除后移出检索索引"""
+    pk = instance.pk
+    transaction.on_commit(lambda: search.remove_products([pk]))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created=False, raw=False, **kwargs):
+    """分类改名后重建该分类下商品的索引"""
+    if raw or created:
+        return
+    product_ids = list(instance.products.values_list('id', flat=True))
+    transaction.on_commit(lambda: search.index_products(product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, instance, raw=False, update_fields=None, **kwargs):
+    """商品或分类变更后提升目录版本号；只改库存时只删除该商品的缓存"""
+    if raw:
+        return
+    if is_stock_update(update_fields):
+        pk = instance.pk
+        catalog_cache.invalidate_products([pk])
+        transaction.on_commit(lambda: catalog_cache.invalidate_products([pk]))
+        fragments.bump(fragments.STOCK, 'all')
+        return
+    catalog_cache.bump_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """用户变更（含密码、登录时间、所属家庭）后删除缓存"""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Family)
+def invalidate_family_members(sender, instance, **kwargs):
+    """缓存的用户包含家庭信息，家庭变更后删除其成员的缓存"""
+    invalidate_user(*instance.members.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=FamilyProfile.preferred_categories.through)
+def invalidate_family_profile_fragment(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    """偏好分类修改后，首页的家庭画像块重新渲染"""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # 从分类一侧修改（instance 为分类）
+        family_ids = FamilyProfile.objects.filter(pk__in=pk_set or ()).values_list('family_id', flat=True)
+    else:
+        family_ids = [instance.family_id]
+    for family_id in family_ids:
+        fragments.bump(fragments.FAMILY_PROFILE, family_id)
+
+
+@receiver(post_save, sender=UserBehavior)
+def invalidate_recommendation_fragment(sender, instance, created=False, raw=False, **kwargs):
+    """家庭成员产生新行为（浏览、加购、购买）后，该家庭成员的首页推荐块重新渲染"""
+    if raw or not created:
+        return
+    fragments.bump(fragments.RECOMMENDATIONS, instance.user.family_id)
@@ -0,0 +1,42 @@
+"""
+静态文件存储 - 文件名带内容哈希（ManifestStaticFilesStorage），并为文本资源生成 .gz 预压缩文件
+
+collectstatic 之后由Web服务器直接提供静态文件：哈希文件名内容不变，可设置永久缓存；
+预压缩文件供 nginx 的 gzip_static 等直接发送，不必每次请求压缩。
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    compress_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+    # 小于该字节数的文件压缩收益不大
+    compress_min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if not dry_run:
+            for hashed_name in sorted(hashed_names):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        """生成 name.gz（压缩后没有变小则不生成）"""
+        if not name.endswith(self.compress_extensions):
+            return
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < self.compress_min_size:
+            return
+        # mtime=0：内容相同的文件每次生成的压缩文件也相同
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        self._save(name + '.gz', ContentFile(compressed))
@@ -1,3 +1,1465 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+import re
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import numpy as np
+
+from . import (
+    async_views, behaviors, catalog, catalog_cache, db, evaluation, export, fragments, metrics, pagination,
+    partitions, profiling, routers, search, tracing,
+)
+from .middleware import ReadYourWritesMiddleware
+from .auth import user_cache_key
+from .bulk import explicit_timestamps
+from .models import (
+    BehaviorAggregate, BehaviorArchive, Cart, CartItem, Category, Family, FamilyProfile, Order, OrderItem,
+    Product, User, UserBehavior,
+)
+from .recommender import RecommenderSystem
+
+
+def scrape_metrics(client):
+    """按 Prometheus 的方式带令牌抓取 /metrics"""
+    with override_settings(SHOP_METRICS={'TOKEN': 'scrape-token'}):
+        return client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+
+
+class ProductSearchTests(TestCase):
+    """商品全文检索"""
+
+    def setUp(self):
+        self.food = Category.objects.create(name='食品饮料')
+        self.clean = Category.objects.create(name='家居清洁')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk = Product.objects.create(
+                name='纯牛奶', category=self.food, price=10, description='早餐必备')
+            self.yogurt = Product.objects.create(
+                name='酸奶', category=self.food, price=8, description='含牛奶成分')
+            self.detergent = Product.objects.create(
+                name='洗衣液2', category=self.clean, price=30, description='Lavender scent')
+
+    def ids(self, query):
+        return [p.id for p in search.search_products(Product.objects.all(), query)]
+
+    def test_tokenize_cjk_bigrams(self):
+        self.assertEqual(search.tokenize('洗衣液2'), ['洗衣', '衣液', '2'])
+        self.assertEqual(search.tokenize('洗衣液2', 'unicode61'), ['洗衣液', '2'])
+
+    def test_ranks_name_above_description(self):
+        self.assertEqual(self.ids('牛奶'), [self.milk.id, self.yogurt.id])
+
+    def test_matches_category_and_prefix(self):
+        self.assertEqual(self.ids('家居清洁'), [self.detergent.id])
+        self.assertEqual(self.ids('laven'), [self.detergent.id])
+        self.assertEqual(self.ids('洗衣液'), [self.detergent.id])
+
+    def test_single_character_falls_back_to_icontains(self):
+        self.assertCountEqual(self.ids('奶'), [self.milk.id, self.yogurt.id])
+
+    def test_index_follows_save_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.name = '豆浆'
+            self.milk.save()
+        self.assertEqual(self.ids('豆浆'), [self.milk.id])
+        self.assertEqual(self.ids('牛奶'), [self.yogurt.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clean.name = '清洁用品'
+            self.clean.save()
+        self.assertEqual(self.ids('清洁用品'), [self.detergent.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.detergent.delete()
+        self.assertEqual(self.ids('洗衣液'), [])
+
+    def test_rebuild_index(self):
+        with search.get_connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(self.ids('牛奶'), [])
+        self.assertEqual(search.rebuild_index(), 3)
+        self.assertEqual(self.ids('牛奶'), [self.milk.id, self.yogurt.id])
+
+    def test_filter_applied_before_result_limit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            soap = Product.objects.create(name='香皂', category=self.clean, price=5, description='牛奶成分')
+        with self.settings(SHOP_SEARCH={'MAX_RESULTS': 1}):
+            self.assertEqual(self.ids('牛奶'), [self.milk.id])
+            filtered = search.search_products(Product.objects.filter(category=self.clean), '牛奶')
+            self.assertEqual([p.id for p in filtered], [soap.id])
+
+    def test_fallback_search(self):
+        with self.settings(SHOP_SEARCH={'BACKEND': 'icontains'}):
+            self.assertEqual(self.ids('牛奶'), [self.milk.id, self.yogurt.id])
+
+    def test_products_view_search(self):
+        user = User.objects.create_user('user1', password='123456', family=Family.objects.create(name='家庭1'))
+        self.client.force_login(user)
+        response = self.client.get(reverse('products'), {'search': '牛奶'})
+        self.assertEqual(list(response.context['products']), [self.milk, self.yogurt])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN 仅适用于SQLite')
+class QueryPlanTests(TestCase):
+    """热点查询的执行计划回归测试：禁止退化为全表扫描或临时排序"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.family = Family.objects.create(name='家庭1')
+        cls.user = User.objects.create_user('user1', password='123456', family=cls.family)
+        cls.product = Product.objects.create(
+            name='牛奶', category=Category.objects.create(name='食品饮料'), price=10)
+
+    def assertIndexed(self, queryset, tables, ordered=False):
+        plan = queryset.explain()
+        for table in tables:
+            for line in plan.splitlines():
+                if re.search(rf'\bSCAN {table}\b', line):
+                    self.assertIn('USING', line, f'{table} 全表扫描:\n{plan}')
+        if ordered:
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan, f'排序未使用索引:\n{plan}')
+
+    def test_user_behaviors_by_type(self):
+        qs = UserBehavior.objects.filter(user=self.user, behavior_type='purchase')
+        self.assertIndexed(qs.values_list('product_id'), ['shop_userbehavior'])
+        self.assertIn('behavior_user_type_idx', qs.explain())
+
+    def test_behavior_changelist_ordering(self):
+        self.assertIndexed(UserBehavior.objects.order_by('-timestamp')[:100],
+                           ['shop_userbehavior'], ordered=True)
+
+    def test_product_behaviors_by_time(self):
+        qs = UserBehavior.objects.filter(product=self.product).order_by('-timestamp')[:10]
+        self.assertIndexed(qs, ['shop_userbehavior'], ordered=True)
+
+    def test_popularity_aggregation(self):
+        from django.db.models import Count
+        qs = Product.objects.annotate(behavior_count=Count('behaviors')).order_by('-behavior_count')[:8]
+        self.assertIndexed(qs, ['shop_userbehavior'])
+
+    def test_lifecycle_order_items(self):
+        qs = OrderItem.objects.filter(
+            order__family=self.family,
+            order__status__in=['paid', 'shipped', 'completed'],
+        ).select_related('product')
+        self.assertIndexed(qs, ['shop_order', 'shop_orderitem', 'shop_product'])
+
+    def test_family_orders_by_time(self):
+        qs = Order.objects.filter(family=self.family).order_by('-created_at')[:10]
+        self.assertIndexed(qs, ['shop_order'], ordered=True)
+
+    def test_order_items_by_purchase_date(self):
+        self.assertIndexed(OrderItem.objects.order_by('-purchase_date')[:50],
+                           ['shop_orderitem'], ordered=True)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'PRAGMA 仅适用于SQLite')
+class SQLitePragmaTests(TestCase):
+    """连接建立时应用 SQLITE_PRAGMAS"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -4321, 'busy_timeout': 1234})
+    def test_configure_sqlite(self):
+        db.configure_sqlite(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), -4321)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+
+REPLICA_DATABASES = {
+    **settings.DATABASES,
+    'replica': {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}},
+}
+
+
+@override_settings(DATABASES=REPLICA_DATABASES, SHOP_READ_DB_ALIAS='replica')
+class ReadReplicaRouterTests(TestCase):
+    """读写分离路由"""
+
+    def setUp(self):
+        self.router = routers.ReadReplicaRouter()
+        self.tokens = routers.begin_request()
+
+    def tearDown(self):
+        routers.end_request(self.tokens)
+
+    def test_regular_reads_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_analytical_reads_use_replica(self):
+        with routers.analytical_reads():
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+            with routers.pin_to_primary():
+                self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_write_pins_context_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertTrue(routers.has_written())
+        with routers.analytical_reads():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'shop'))
+        self.assertIsNone(self.router.allow_migrate('default', 'shop'))
+
+    def test_write_sets_read_your_writes_cookie(self):
+        user = User.objects.create_user('user1', password='123456', family=Family.objects.create(name='家庭1'))
+        self.client.force_login(user)
+        response = self.client.get(reverse('products'))
+        self.assertNotIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+        response = self.client.post(reverse('update_family_profile'), {'categories': []})
+        self.assertIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+
+
+class CatalogCacheTests(TestCase):
+    """目录读穿缓存和版本号失效"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        self.client.force_login(self.user)
+        self.food = Category.objects.create(name='食品饮料')
+        self.milk = Product.objects.create(name='牛奶', category=self.food, price=10, stock=5)
+        self.bread = Product.objects.create(name='面包', category=self.food, price=5, stock=8)
+
+    def test_reads_are_served_from_cache(self):
+        catalog_cache.get_categories()
+        catalog_cache.get_products([self.milk.id, self.bread.id])
+        with self.assertNumQueries(0):
+            self.assertEqual([c.name for c in catalog_cache.get_categories()], ['食品饮料'])
+            products = catalog_cache.get_products([self.milk.id, self.bread.id])
+            self.assertEqual(products[self.milk.id].category.name, '食品饮料')
+        self.assertNotIn(999999, catalog_cache.get_products([self.milk.id, 999999]))
+
+        # 进程内缓存清空后从共享缓存读取
+        catalog_cache.local.clear()
+        with self.assertNumQueries(0):
+            catalog_cache.get_products([self.milk.id])
+
+    def test_save_and_delete_bump_version(self):
+        version = catalog_cache.get_version()
+        self.assertEqual(catalog_cache.get_product(self.milk.id).price, 10)
+        self.milk.price = 12
+        self.milk.save()
+        self.assertGreater(catalog_cache.get_version(), version)
+        self.assertEqual(catalog_cache.get_product(self.milk.id).price, 12)
+
+        catalog_cache.get_categories()
+        Category.objects.create(name='日用品')
+        self.assertEqual(len(catalog_cache.get_categories()), 2)
+        self.bread.delete()
+        self.assertIsNone(catalog_cache.get_product(self.bread.id))
+
+    def test_bulk_stock_adjustment_bumps_version(self):
+        catalog_cache.get_product(self.milk.id)
+        changes = catalog.plan_stock_adjustment(Product.objects.all(), 'set', 20)
+        catalog.apply_stock_adjustment(changes)
+        self.assertEqual(catalog_cache.get_product(self.milk.id).stock, 20)
+
+    def test_checkout_invalidates_only_purchased_products(self):
+        cart = Cart.objects.create(family=self.family)
+        CartItem.objects.create(cart=cart, product=self.milk, quantity=2)
+        catalog_cache.get_categories()
+        catalog_cache.get_products([self.milk.id, self.bread.id])
+        version = catalog_cache.get_version()
+
+        self.client.post(reverse('checkout'))
+        self.assertEqual(catalog_cache.get_version(), version)
+        with self.assertNumQueries(1):
+            self.assertEqual(catalog_cache.get_product(self.milk.id).stock, 3)
+        with self.assertNumQueries(0):
+            catalog_cache.get_categories()
+            catalog_cache.get_product(self.bread.id)
+
+    def test_product_detail_uses_cache(self):
+        url = reverse('product_detail', args=[self.milk.id])
+        self.client.get(url)  # 预热
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, '面包')
+        self.assertFalse([q for q in ctx.captured_queries
+                          if q['sql'].startswith('SELECT') and '"shop_product"' in q['sql']])
+        self.assertEqual(self.client.get(reverse('product_detail', args=[999999])).status_code, 404)
+
+
+class FragmentCacheTests(TestCase):
+    """商品卡片、家庭画像块和首页推荐块的模板片段缓存"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.family = Family.objects.create(name='家庭1')
+        self.profile = FamilyProfile.objects.create(family=self.family)
+        Cart.objects.create(family=self.family)
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        self.client.force_login(self.user)
+        self.food = Category.objects.create(name='食品饮料')
+        self.milk = Product.objects.create(name='牛奶', category=self.food, price=10, stock=5)
+
+    def test_home_blocks_cached_until_invalidated(self):
+        self.client.get(reverse('home'))  # 预热
+        with mock.patch('shop.views.get_user_recommendations') as recommend, \
+                CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        recommend.assert_not_called()
+        self.assertFalse([q for q in ctx.captured_queries if 'preferred_categories' in q['sql']])
+
+        self.client.post(reverse('update_family_profile'), {'categories': [self.food.id]})
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '<span class="category-tag">食品饮料</span>', html=True)
+
+        version = fragments.get_version(fragments.RECOMMENDATIONS, self.family.id)
+        self.client.get(reverse('product_detail', args=[self.milk.id]))
+        self.assertGreater(fragments.get_version(fragments.RECOMMENDATIONS, self.family.id), version)
+        with mock.patch('shop.views.get_user_recommendations', return_value=[self.milk]) as recommend:
+            response = self.client.get(reverse('home'))
+        recommend.assert_called_once()
+
+    def test_product_cards_follow_stock_and_catalog_changes(self):
+        self.client.get(reverse('products'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertContains(self.client.get(reverse('products')), '库存: 5')
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "shop_product"' in q['sql']])
+        cart = Cart.objects.get(family=self.family)
+        CartItem.objects.create(cart=cart, product=self.milk, quantity=2)
+        self.client.post(reverse('checkout'))
+        self.assertContains(self.client.get(reverse('products')), '库存: 3')
+
+        self.milk.name = '纯牛奶'
+        self.milk.save()
+        self.assertContains(self.client.get(reverse('products')), '纯牛奶')
+        self.assertContains(self.client.get(reverse('product_detail', args=[self.milk.id])), '纯牛奶')
+
+    def test_versions_bumped_again_after_commit(self):
+        # 提交前其他请求可能按新版本号缓存了旧库存，提交后需再提升一次
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.stock = 4
+            self.milk.save(update_fields=['stock'])
+            stock_version = fragments.get_version(fragments.STOCK, 'all')
+            UserBehavior.objects.create(user=self.user, product=self.milk, behavior_type='purchase')
+            recommendation_version = fragments.get_version(fragments.RECOMMENDATIONS, self.family.id)
+        self.assertGreater(fragments.get_version(fragments.STOCK, 'all'), stock_version)
+        self.assertGreater(fragments.get_version(fragments.RECOMMENDATIONS, self.family.id), recommendation_version)
+
+
+class HomePageTests(TestCase):
+    """首页只读，查询次数固定"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        food = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'商品{i}', category=food, price=10, stock=5)
+                         for i in range(10)]
+
+    def register(self, username, family_name):
+        return self.client.post(reverse('register'), {
+            'username': username, 'password': '123456', 'family_name': family_name})
+
+    def test_register_creates_profile_and_cart(self):
+        Family.objects.create(name='旧家庭')
+        self.register('user1', '旧家庭')
+        self.register('user2', '新家庭')
+        for name in ('旧家庭', '新家庭'):
+            family = Family.objects.get(name=name)
+            self.assertTrue(FamilyProfile.objects.filter(family=family).exists())
+            self.assertTrue(Cart.objects.filter(family=family).exists())
+
+    def test_get_never_writes(self):
+        # 没有家庭画像和购物车的旧数据也能只读展示
+        user = User.objects.create_user('user1', password='123456', family=Family.objects.create(name='家庭1'))
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in ctx.captured_queries
+                  if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_query_budget(self):
+        self.register('user1', '家庭1')
+        user = User.objects.get(username='user1')
+        cart = Cart.objects.get(family=user.family)
+        for product in self.products[:3]:
+            UserBehavior.objects.create(user=user, product=product, behavior_type='view')
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        self.client.force_login(user)
+        self.client.get(reverse('home'))  # 预热会话、目录和片段缓存
+
+        # 缓存命中时只剩购物车数量一次查询
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['cart_count'], 6)
+        self.assertContains(response, '商品0')
+
+
+class AsyncViewTests(TransactionTestCase):
+    """ASGI下使用的异步视图"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.family = Family.objects.create(name='家庭1')
+        FamilyProfile.objects.create(family=self.family)
+        cart = Cart.objects.create(family=self.family)
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        food = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'商品{i}', category=food, price=10, stock=5)
+                         for i in range(6)]
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=3)
+        self.factory = AsyncRequestFactory()
+
+    def request(self, path, user=None):
+        request = self.factory.get(path)
+        request.user = user or self.user
+        return request
+
+    async def test_product_detail_writes_behavior_in_background(self):
+        product = self.products[1]
+        response = await async_views.product_detail(self.request('/'), product.id)
+        self.assertContains(response, '商品2')  # 同分类的相似商品
+        await async_views.drain()
+        self.assertEqual(await UserBehavior.objects.filter(
+            user=self.user, product=product, behavior_type='view').acount(), 1)
+
+    async def test_home_skips_recommender_when_fragment_cached(self):
+        with mock.patch('shop.async_views.get_user_recommendations', return_value=[self.products[2]]) as recommend:
+            response = await async_views.home(self.request('/'))
+            self.assertContains(response, '商品2')
+            response = await async_views.home(self.request('/'))
+        self.assertEqual(recommend.call_count, 1)
+        self.assertContains(response, '商品2')
+
+    async def test_products_and_login_redirect(self):
+        response = await async_views.products(self.request('/products/'))
+        self.assertContains(response, '库存: 5')
+        self.assertContains(response, '<span class="badge">3</span>', html=True)
+        response = await async_views.products(self.request('/products/', AnonymousUser()))
+        self.assertEqual(response.status_code, 302)
+
+
+class ConditionalGetTests(TestCase):
+    """商品页的 ETag/Last-Modified、响应压缩和静态文件"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.family = Family.objects.create(name='家庭1')
+        Cart.objects.create(family=self.family)
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        self.client.force_login(self.user)
+        food = Category.objects.create(name='食品饮料')
+        self.milk = Product.objects.create(name='牛奶', category=food, price=10, stock=5)
+
+    def revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified_until_catalog_or_cart_changes(self):
+        for url in (reverse('products'), reverse('product_detail', args=[self.milk.id])):
+            response = self.revalidate(url)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+        url = reverse('products')
+        etag = self.client.get(url)['ETag']
+        self.milk.price = 12
+        self.milk.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # 加购后有待显示的消息，不返回304；购物车数量变化后ETag也变化
+        etag = self.client.get(url)['ETag']
+        self.client.get(reverse('add_to_cart', args=[self.milk.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(SHOP_BEHAVIOR_DEDUP={'view': 0})
+    def test_not_modified_detail_still_records_view(self):
+        response = self.revalidate(reverse('product_detail', args=[self.milk.id]))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(UserBehavior.objects.filter(user=self.user, behavior_type='view').count(), 2)
+
+    def test_last_modified(self):
+        url = reverse('products')
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_html_is_gzipped(self):
+        response = self.client.get(reverse('products'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('牛奶', gzip.decompress(response.content).decode())
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'shop.storage.CompressedManifestStaticFilesStorage'},
+        }):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(root, 'staticfiles.json'), encoding='utf-8') as f:
+                hashed = json.load(f)['paths']['css/base.css']
+            self.assertRegex(hashed, r'^css/base\.[0-9a-f]{12}\.css$')
+            with open(os.path.join(root, hashed), 'rb') as f, gzip.open(os.path.join(root, hashed + '.gz')) as gz:
+                self.assertEqual(gz.read(), f.read())
+
+
+class BehaviorDedupTests(TestCase):
+    """去重窗口内的重复行为不写入"""
+
+    def setUp(self):
+        cache.clear()
+        metrics.REGISTRY.reset()
+        self.family = Family.objects.create(name='家庭1')
+        Cart.objects.create(family=self.family)
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        self.client.force_login(self.user)
+        food = Category.objects.create(name='食品饮料')
+        self.milk = Product.objects.create(name='牛奶', category=food, price=10, stock=5)
+
+    def count(self, behavior_type):
+        return UserBehavior.objects.filter(user=self.user, product=self.milk, behavior_type=behavior_type).count()
+
+    def test_repeated_views_are_suppressed(self):
+        for _ in range(3):
+            self.client.get(reverse('product_detail', args=[self.milk.id]))
+            self.client.get(reverse('add_to_cart', args=[self.milk.id]))
+        self.assertEqual(self.count('view'), 1)
+        self.assertEqual(self.count('add_to_cart'), 3)
+        text = scrape_metrics(self.client)
+        self.assertIn('shop_behaviors_suppressed_total{behavior_type="view",source="web"} 2', text)
+        self.assertIn('shop_behaviors_inserted_total{behavior_type="view",source="web"} 1', text)
+
+    @override_settings(SHOP_BEHAVIOR_DEDUP={'view': 0})
+    def test_zero_window_disables_dedup(self):
+        for _ in range(2):
+            behaviors.record_behavior(self.user, self.milk, 'view')
+        self.assertEqual(self.count('view'), 2)
+
+    def test_failed_write_releases_window(self):
+        with mock.patch.object(UserBehavior.objects, 'create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                behaviors.record_behavior(self.user, self.milk, 'view')
+        self.assertIsNotNone(behaviors.record_behavior(self.user, self.milk, 'view'))
+        self.assertIsNone(behaviors.record_behavior(self.user, self.milk, 'view'))
+
+
+class BehaviorPartitionTests(TestCase):
+    """行为表按月分区、旧分区的压缩和归档"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{i}', password='123456') for i in range(2)]
+        category = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'牛奶{i}', category=category, price=10)
+                         for i in range(3)]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(SHOP_BEHAVIOR_PARTITIONS={'HOT_MONTHS': 2, 'ARCHIVE_DIR': self.tmpdir.name})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def add_behaviors(self, rows):
+        with explicit_timestamps(UserBehavior):
+            return UserBehavior.objects.bulk_create([
+                UserBehavior(user=self.users[u], product=self.products[p], behavior_type=behavior_type,
+                             timestamp=timezone.make_aware(datetime(*day, 12)))
+                for u, p, behavior_type, day in rows
+            ])
+
+    def matrix(self):
+        recommender = RecommenderSystem()
+        recommender.build_matrices()
+        return recommender.user_item_matrix
+
+    def test_period_follows_local_time(self):
+        behavior = UserBehavior.objects.create(user=self.users[0], product=self.products[0], behavior_type='view')
+        self.assertEqual(behavior.period, int(timezone.localtime(behavior.timestamp).strftime('%Y%m')))
+        with explicit_timestamps(UserBehavior):
+            # UTC 12月31日17点是上海时间1月1日
+            late = UserBehavior.objects.bulk_create([UserBehavior(
+                user=self.users[0], product=self.products[0], behavior_type='view',
+                timestamp=datetime(2024, 12, 31, 17, tzinfo=timezone.utc))])[0]
+        self.assertEqual(late.period, 202501)
+        self.assertEqual(partitions.shift_period(202501, -1), 202412)
+        self.assertEqual(partitions.shift_period(202412, 13), 202601)
+
+    def test_between_routes_by_period(self):
+        self.add_behaviors([(0, 0, 'view', (2024, 1, 31)), (0, 1, 'view', (2024, 2, 1)), (0, 2, 'view', (2024, 3, 1))])
+        start, end = partitions.period_start(202402), partitions.period_start(202403)
+        queryset = UserBehavior.objects.between(start, end)
+        self.assertEqual(list(queryset.values_list('product', flat=True)), [self.products[1].id])
+        self.assertIn('"period" >=', str(queryset.query))
+        self.assertEqual(UserBehavior.objects.periods(), [202401, 202402, 202403])
+
+    def test_compaction_archives_and_keeps_scores(self):
+        now = timezone.localtime()
+        hot = (now.year, now.month, 1)
+        self.add_behaviors([
+            (0, 0, 'view', (2024, 1, 3)), (0, 0, 'view', (2024, 1, 5)), (0, 0, 'purchase', (2024, 1, 9)),
+            (1, 0, 'add_to_cart', (2024, 1, 9)), (1, 1, 'view', (2024, 2, 1)),
+            (0, 0, 'view', hot), (1, 2, 'purchase', hot),
+        ])
+        before = self.matrix()
+
+        self.assertEqual(partitions.cold_periods(), [202401, 202402])
+        archive = partitions.compact_period(202401)
+        self.assertEqual((archive.rows, archive.period), (4, 202401))
+        with gzip.open(archive.path, 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([r['behavior_type'] for r in rows], ['view', 'view', 'purchase', 'add_to_cart'])
+        self.assertEqual(UserBehavior.objects.periods(), [202402, now.year * 100 + now.month])
+
+        aggregate = BehaviorAggregate.objects.get(user=self.users[0], product=self.products[0])
+        self.assertEqual((aggregate.view_count, aggregate.purchase_count, aggregate.get_score()), (2, 1, 7))
+        np.testing.assert_array_equal(self.matrix(), before)
+
+        # 压缩后导入到旧分区的行为在下次压缩时累加
+        self.add_behaviors([(0, 0, 'view', (2024, 1, 20))])
+        self.assertEqual(partitions.compact_period(202401).rows, 1)
+        aggregate.refresh_from_db()
+        self.assertEqual(aggregate.view_count, 3)
+        self.assertEqual(timezone.localtime(aggregate.last_timestamp).day, 20)
+        self.assertEqual(BehaviorArchive.objects.count(), 2)
+        self.assertIsNone(partitions.compact_period(202401))
+
+    def test_restore_instead_of_reimport(self):
+        self.add_behaviors([(0, 0, 'view', (2024, 1, 3)), (0, 0, 'purchase', (2024, 1, 4)),
+                            (1, 1, 'view', (2024, 1, 5))])
+        before = self.matrix()
+        archive = partitions.compact_period(202401)
+
+        # 归档文件已计入汇总，重新导入会重复计分，被拒绝
+        call_command('import_behaviors', archive.path, format='jsonl', stdout=StringIO())
+        self.assertFalse(UserBehavior.objects.exists())
+
+        call_command('compact_behaviors', restore=[202401], stdout=StringIO())
+        self.assertEqual(UserBehavior.objects.count(), 3)
+        self.assertFalse(BehaviorAggregate.objects.exists())
+        self.assertFalse(BehaviorArchive.objects.exists())
+        np.testing.assert_array_equal(self.matrix(), before)
+
+    def test_command(self):
+        self.add_behaviors([(0, 0, 'view', (2024, 1, 3)), (0, 1, 'view', (2024, 2, 3))])
+        out = StringIO()
+        call_command('compact_behaviors', dry_run=True, stdout=out)
+        self.assertIn('分区 202401: 1 行', out.getvalue())
+        self.assertEqual(UserBehavior.objects.count(), 2)
+
+        call_command('compact_behaviors', period=[202402], stdout=StringIO())
+        self.assertEqual(UserBehavior.objects.periods(), [202401])
+        call_command('compact_behaviors', stdout=StringIO())
+        self.assertFalse(UserBehavior.objects.exists())
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+
+        current = int(timezone.localtime().strftime('%Y%m'))
+        with self.assertRaises(CommandError):
+            call_command('compact_behaviors', period=[current], stdout=StringIO())
+
+
+class CachedAuthenticationTests(TestCase):
+    """会话和用户查询走缓存"""
+
+    def setUp(self):
+        cache.clear()
+        self.family = Family.objects.create(name='家庭1')
+        Cart.objects.create(family=self.family)
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        self.client.force_login(self.user)
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries
+                if any(t in q['sql'] for t in ('"django_session"', '"shop_user"', '"shop_family"'))]
+
+    def test_cached_session_and_user(self):
+        self.client.get(reverse('cart'))  # 预热
+        self.assertEqual(self.auth_queries(reverse('cart')), [])
+        self.assertEqual(self.auth_queries(reverse('profile')), [])
+
+    def test_user_cache_invalidated_on_change(self):
+        self.client.get(reverse('cart'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.family.name = '新家庭'
+        self.family.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.get(reverse('cart'))
+        self.assertContains(response, '新家庭')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_sessions_from_model_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertContains(self.client.get(reverse('cart')), '家庭1')
+        self.client.logout()
+        self.client.post(reverse('login'), {'username': 'user1', 'password': '123456'})
+        self.assertEqual(self.client.session['_auth_user_backend'], 'shop.auth.CachedModelBackend')
+
+
+class GenerateTestDataTests(TestCase):
+    """测试数据生成命令"""
+
+    def generate(self, **options):
+        call_command('generate_test_data', families=3, users=6, products=30,
+                     behaviors=200, orders=10, stdout=StringIO(), **options)
+        return list(UserBehavior.objects.order_by('id').values_list(
+            'user__username', 'product__name', 'behavior_type'))
+
+    def test_generates_requested_scale(self):
+        self.generate()
+        self.assertEqual(Family.objects.count(), 3)
+        self.assertEqual(User.objects.filter(is_superuser=False).count(), 6)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(Cart.objects.count(), 3)
+        purchases = UserBehavior.objects.filter(behavior_type='purchase').count()
+        self.assertEqual(purchases, OrderItem.objects.count())
+        self.assertEqual(UserBehavior.objects.count(), 200 + purchases)
+        # 历史时间被保留，而不是全部写成当前时间
+        self.assertGreater(UserBehavior.objects.dates('timestamp', 'day').count(), 1)
+        self.assertTrue(User.objects.get(username='user1').check_password('123456'))
+
+    def test_seed_is_deterministic(self):
+        self.assertEqual(self.generate(seed=7), self.generate(seed=7))
+
+
+class ImportBehaviorsTests(TestCase):
+    """历史数据批量导入命令"""
+
+    def setUp(self):
+        self.family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        category = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'牛奶{i}', category=category, price=10)
+                         for i in range(3)]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def run_import(self, *args, **options):
+        call_command('import_behaviors', *args, stdout=StringIO(), **options)
+
+    def test_import_csv_with_rejects_and_timestamps(self):
+        p1, p2, _ = self.products
+        path = self.write('behaviors.csv', (
+            'user,product_id,behavior_type,timestamp\n'
+            f'user1,{p1.id},view,2025-01-01T08:00:00\n'
+            f'user1,{p2.id},purchase,2025-01-02T08:00:00\n'
+            f'nobody,{p2.id},view,2025-01-02T08:00:00\n'
+            f'user1,999999,view,2025-01-02T08:00:00\n'
+            f'user1,{p1.id},like,2025-01-02T08:00:00\n'
+        ))
+        rejects = os.path.join(self.tmpdir.name, 'rejects.jsonl')
+        self.run_import(path, rejects=rejects, chunk_size=1)
+        self.assertEqual(UserBehavior.objects.count(), 2)
+        self.assertEqual(UserBehavior.objects.earliest('timestamp').timestamp.year, 2025)
+        with open(rejects, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['line'] for line in f], [3, 4, 5])
+        with open(path + '.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'offset': 5, 'imported': 2, 'rejected': 3})
+
+    def test_resume_from_checkpoint(self):
+        lines = [json.dumps({'user_id': self.user.id, 'product_id': p.id, 'behavior_type': 'view',
+                             'timestamp': f'2025-03-0{i + 1}T10:00:00+08:00'})
+                 for i, p in enumerate(self.products)]
+        path = self.write('behaviors.jsonl', '\n'.join(lines) + '\n')
+        self.write('behaviors.jsonl.checkpoint', json.dumps({'offset': 2, 'imported': 2, 'rejected': 0}))
+        self.run_import(path, resume=True)
+        self.assertEqual(list(UserBehavior.objects.values_list('product_id', flat=True)),
+                         [self.products[2].id])
+
+    def test_resume_after_complete_import_skips_trailing_rejects(self):
+        row = json.dumps({'user_id': self.user.id, 'product_id': self.products[0].id, 'behavior_type': 'view',
+                          'timestamp': '2025-03-01T10:00:00+08:00'})
+        path = self.write('behaviors.jsonl', f'{row}\n[1]\n{{"behavior_type": "like"}}\n')
+        rejects = os.path.join(self.tmpdir.name, 'rejects.jsonl')
+        self.run_import(path, rejects=rejects)
+        self.run_import(path, rejects=rejects, resume=True)
+        self.assertEqual(UserBehavior.objects.count(), 1)
+        with open(rejects, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        with open(path + '.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'offset': 3, 'imported': 1, 'rejected': 2})
+
+    def test_jsonl_non_object_rows_rejected_and_blank_lines_skipped(self):
+        row = json.dumps({'user_id': self.user.id, 'product_id': self.products[0].id, 'behavior_type': 'view',
+                          'timestamp': '2025-03-01T10:00:00+08:00'})
+        path = self.write('behaviors.jsonl', f'[1, 2]\n\n{row}\nnull\n42\n')
+        rejects = os.path.join(self.tmpdir.name, 'rejects.jsonl')
+        self.run_import(path, rejects=rejects)
+        self.assertEqual(UserBehavior.objects.count(), 1)
+        with open(rejects, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_import_orders(self):
+        p1, p2, _ = self.products
+        path = self.write('items.csv', (
+            'order,user,product_id,quantity,price,purchase_date,status\n'
+            f'A1,user1,{p1.id},2,10.50,2025-01-01T08:00:00,completed\n'
+            f'A1,user1,{p2.id},1,3.00,2025-01-01T08:00:00,completed\n'
+            f'A2,user1,{p2.id},1,3.00,2025-02-01T08:00:00,\n'
+        ))
+        self.run_import(path, kind='orders', purchase_behaviors=True)
+        orders = list(Order.objects.order_by('created_at'))
+        self.assertEqual([(o.status, str(o.total_price), o.items.count()) for o in orders],
+                         [('completed', '24.00', 2), ('paid', '3.00', 1)])
+        self.assertEqual(orders[0].created_at.month, 1)
+        self.assertEqual(UserBehavior.objects.filter(behavior_type='purchase').count(), 3)
+
+    def test_order_with_different_users_rejected(self):
+        User.objects.create_user('user2', password='123456', family=self.family)
+        p1, p2, _ = self.products
+        path = self.write('items.csv', (
+            'order,user,product_id,quantity,price,purchase_date\n'
+            f'A1,user1,{p1.id},1,10.00,2025-01-01T08:00:00\n'
+            f'A1,user2,{p2.id},1,3.00,2025-01-01T08:00:00\n'
+        ))
+        rejects = os.path.join(self.tmpdir.name, 'rejects.jsonl')
+        self.run_import(path, kind='orders', rejects=rejects)
+        self.assertFalse(Order.objects.exists())
+        with open(rejects, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['line'] for line in f], [1, 2])
+
+
+class RecommenderEvaluationTests(TestCase):
+    """推荐系统离线评估"""
+
+    def setUp(self):
+        family = Family.objects.create(name='家庭1')
+        self.users = [User.objects.create_user(f'user{i}', password='123456', family=family)
+                      for i in range(1, 4)]
+        category = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'商品{i}', category=category, price=10)
+                         for i in range(4)]
+        self.start = timezone.make_aware(datetime(2025, 1, 1))
+        u1, u2, u3 = self.users
+        a, b, c, _ = self.products
+        self.add_behaviors([
+            (u1, a, 'view'), (u1, b, 'view'),
+            (u2, a, 'view'), (u2, b, 'view'), (u2, c, 'purchase'),
+            (u3, a, 'view'),
+            # 最后一条：user1 购买了相似用户买过的商品
+            (u1, c, 'purchase'),
+        ])
+
+    def add_behaviors(self, rows):
+        with explicit_timestamps(UserBehavior):
+            UserBehavior.objects.bulk_create([
+                UserBehavior(user=user, product=product, behavior_type=behavior_type,
+                             timestamp=self.start + timedelta(days=i))
+                for i, (user, product, behavior_type) in enumerate(rows)
+            ])
+
+    def test_temporal_split(self):
+        interactions = evaluation.load_interactions()
+        split = evaluation.temporal_split(interactions, cutoff=self.start + timedelta(days=6))
+        self.assertEqual(split.train.tolist(), [True] * 6 + [False])
+        self.assertEqual(split.test.tolist(), [False] * 6 + [True])
+
+    def test_leave_last_out_hides_later_rows_of_same_user(self):
+        interactions = evaluation.load_interactions()
+        split = evaluation.leave_last_out(interactions)
+        # user2 的购买和 user1 的购买分别留出
+        self.assertEqual(split.test.tolist(), [False] * 4 + [True, False, True])
+        self.assertEqual(split.train.tolist(), [True] * 4 + [False, True, False])
+        self.assertEqual(set(split.as_of), {self.users[0].id, self.users[1].id})
+
+    def test_batch_scores_match_single_user_recommendations(self):
+        recommender = RecommenderSystem()
+        user_idx, _ = recommender.build_matrices()
+        batch = recommender.score_users([user_idx[u.id] for u in self.users])
+        for user, scores in zip(self.users, batch):
+            single = RecommenderSystem().get_recommendations(user, top_n=4)
+            expected = [recommender.products[i] for i in np.argsort(scores)[::-1] if scores[i] > 0]
+            self.assertEqual([p.id for p in single], expected[:4])
+
+    def test_ranking_metrics(self):
+        metrics = evaluation.ranking_metrics(np.array([[False, True, False]]), np.array([2]), 3)
+        self.assertAlmostEqual(metrics['precision'][0], 1 / 3)
+        self.assertAlmostEqual(metrics['recall'][0], 0.5)
+        self.assertAlmostEqual(metrics['ndcg'][0], (1 / np.log2(3)) / (1 + 1 / np.log2(3)))
+
+    def test_evaluate_trains_on_train_slice_only(self):
+        report = evaluation.evaluate(split='temporal', k=2, cutoff=self.start + timedelta(days=6))
+        self.assertEqual(report['users'], 1)
+        self.assertEqual(report['train_interactions'], 6)
+        self.assertAlmostEqual(report['metrics']['recall']['mean'], 1.0)
+        self.assertAlmostEqual(report['metrics']['ndcg']['mean'], 1.0)
+        self.assertAlmostEqual(report['metrics']['precision']['mean'], 0.5)
+        self.assertGreater(report['coverage'], 0)
+        json.dumps(report)
+
+    def test_sweep_matches_single_evaluation(self):
+        cutoff = self.start + timedelta(days=6)
+        results, data = evaluation.sweep([0.5, 1.0], [0, 2.0], [None, 1], k=2, cutoff=cutoff,
+                                         processes=1)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(data.eval_rows), 1)
+        default = next(r for r in results
+                       if (r['alpha'], r['lifecycle_boost'], r['k_neighbors']) == (0.5, 2.0, None))
+        report = evaluation.evaluate(k=2, cutoff=cutoff)
+        self.assertAlmostEqual(default['ndcg'], report['metrics']['ndcg']['mean'])
+        self.assertAlmostEqual(default['coverage'], report['coverage'])
+        self.assertEqual([r['ndcg'] for r in results], sorted((r['ndcg'] for r in results), reverse=True))
+
+        parallel, _ = evaluation.sweep([0.5, 1.0], [0, 2.0], [None, 1], k=2, cutoff=cutoff,
+                                       processes=2)
+        key = lambda r: (r['alpha'], r['lifecycle_boost'], r['k_neighbors'] or 0)
+        self.assertEqual(sorted(parallel, key=key), sorted(results, key=key))
+
+    def test_k_neighbors_keeps_most_similar_users(self):
+        recommender = RecommenderSystem()
+        user_idx, _ = recommender.build_matrices()
+        row = [user_idx[self.users[2].id]]
+        everyone = recommender.user_cf_scores(row)[0]
+        nearest = recommender.user_cf_scores(row, k_neighbors=1)[0]
+        # user1 和 user2 的行为相同，只保留一个邻居时评分减半
+        positive = everyone > 0
+        self.assertTrue(positive.any())
+        np.testing.assert_allclose(nearest[positive] * 2, everyone[positive])
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """请求性能分析中间件"""
+
+    def setUp(self):
+        cache.clear()
+        family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=family)
+        self.staff = User.objects.create_user('staff', password='123456', family=family, is_staff=True)
+        category = Category.objects.create(name='食品饮料')
+        Product.objects.create(name='牛奶', category=category, price=10)
+
+    def test_not_profiled_without_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('products'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_header_ignored_for_regular_users(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('products'), HTTP_X_SHOP_PROFILE='1')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_staff_header_adds_server_timing_and_summary(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('products'), HTTP_X_SHOP_PROFILE='cprofile')
+        self.assertRegex(response['Server-Timing'], r'total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(response['Server-Timing'], r'tpl;dur=[\d.]+')
+
+        summary = next(s for s in profiling.get_summaries() if s['view'] == 'products')
+        self.assertEqual(summary['requests'], 1)
+        self.assertGreater(summary['queries'], 0)
+        self.assertIn('products.html', summary['slowest']['templates'])
+        self.assertIn('cumulative', summary['profile'])
+
+        page = self.client.get(reverse('profiling_summary'))
+        self.assertContains(page, 'products')
+        self.client.post(reverse('profiling_summary'))
+        self.assertEqual(profiling.get_summaries(), [])
+
+    @override_settings(SHOP_PROFILING={'ENABLED': True})
+    def test_enabled_by_setting(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('products'))
+        self.assertIn('Server-Timing', response)
+
+    def test_summary_page_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profiling_summary'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_duplicate_and_similar_queries(self):
+        recorder = profiling.RequestRecorder()
+        recorder.queries = [
+            ('default', 'SELECT * FROM shop_cart WHERE id = %s', '(1,)', 0.001),
+            ('default', 'SELECT * FROM shop_cart WHERE id = %s', '(1,)', 0.001),
+            ('default', 'SELECT * FROM shop_cart WHERE id = %s', '(2,)', 0.001),
+        ]
+        self.assertEqual(recorder.duplicates(), [(2, 'SELECT * FROM shop_cart WHERE id = %s')])
+        self.assertEqual(recorder.similar(), [(3, 'SELECT * FROM shop_cart WHERE id = %s')])
+        self.assertEqual(profiling.normalize_sql("SELECT 1 FROM t WHERE a IN (%s, %s) AND b = 'x'"),
+                         'SELECT %s FROM t WHERE a IN (...) AND b = %s')
+
+
+class MetricsTests(TestCase):
+    """运行指标与 /metrics"""
+
+    def setUp(self):
+        cache.clear()  # 去重窗口记录在缓存中，其他测试留下的记录会跳过这里的浏览
+        metrics.REGISTRY.reset()
+        self.family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        category = Category.objects.create(name='食品饮料')
+        self.product = Product.objects.create(name='牛奶', category=category, price=10, stock=5)
+        self.client.force_login(self.user)
+
+    def test_exposition_format(self):
+        registry = metrics.Registry()
+        counter = registry.counter('demo_total', '示例计数', ['kind'])
+        histogram = registry.histogram('demo_seconds', '示例耗时', buckets=(0.1, 1))
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        histogram.observe(0.5)
+        text = registry.exposition()
+        self.assertIn('# TYPE demo_total counter', text)
+        self.assertIn('demo_total{kind="a\\"b"} 3', text)
+        self.assertIn('demo_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn('demo_seconds_bucket{le="1.0"} 1', text)
+        self.assertIn('demo_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('demo_seconds_count 1', text)
+        with self.assertRaises(ValueError):
+            counter.inc(other='x')
+
+    def test_aggregates_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                override_settings(SHOP_METRICS={'DIR': tmpdir, 'FLUSH_INTERVAL': 0}):
+            registries = []
+            for pid in (1001, 1002):
+                registry = metrics.Registry()
+                registry.pid, registry._file_name = os.getpid(), f'{pid}.json'
+                registry.counter('demo_total', '示例计数').inc(pid - 1000)
+                registry.histogram('demo_seconds', '示例耗时').observe(0.2)
+                registries.append(registry)
+            text = registries[0].exposition()
+        self.assertIn('demo_total 3', text)
+        self.assertIn('demo_seconds_count 2', text)
+
+    def test_throttled_changes_are_flushed(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                override_settings(SHOP_METRICS={'DIR': tmpdir, 'FLUSH_INTERVAL': 0.05}):
+            worker, scraper = metrics.Registry(), metrics.Registry()
+            counter = worker.counter('demo_total', '示例计数')
+            scraper.counter('demo_total', '示例计数')
+            counter.inc()
+            counter.inc()  # 在写入间隔内，由定时器稍后写入
+            self.assertTrue(worker.dirty)
+            worker.timer.join(1)
+            self.assertIn('demo_total 2', scraper.exposition())
+
+    def test_views_and_checkout_are_instrumented(self):
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 404)  # 家庭还没有购物车
+        self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.get(reverse('checkout'))
+        self.client.get(reverse('checkout'))
+
+        text = scrape_metrics(self.client)
+        self.assertIn('shop_http_requests_total{view="product_detail",method="GET",status="200"} 1', text)
+        self.assertIn('shop_http_request_duration_seconds_count{view="checkout"} 3', text)
+        self.assertIn('shop_checkouts_total{result="success"} 1', text)
+        self.assertIn('shop_checkouts_total{result="empty_cart"} 1', text)
+        self.assertIn('shop_checkouts_total{result="no_cart"} 1', text)
+        self.assertIn('shop_order_items_total 1', text)
+        for behavior_type in ('view', 'add_to_cart', 'purchase'):
+            self.assertIn(
+                f'shop_behaviors_inserted_total{{behavior_type="{behavior_type}",source="web"}} 1', text)
+
+    def test_recommender_stages(self):
+        UserBehavior.objects.create(user=self.user, product=self.product, behavior_type='view')
+        self.client.get(reverse('home'))
+        text = scrape_metrics(self.client)
+        for stage in ('total', 'build_matrices', 'lifecycle', 'scoring', 'fetch_products'):
+            self.assertIn(f'shop_recommender_stage_duration_seconds_count{{stage="{stage}"}} 1', text)
+        self.assertIn('shop_recommendations_total{source="cf"} 1', text)
+
+    @override_settings(SHOP_METRICS={'TOKEN': 'secret'})
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_staff_only_without_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class TracingTests(TestCase):
+    """推荐系统阶段追踪"""
+
+    def setUp(self):
+        self.family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        other = User.objects.create_user('user2', password='123456')
+        category = Category.objects.create(name='食品饮料')
+        milk = Product.objects.create(name='牛奶', category=category, price=10, stock=5)
+        bread = Product.objects.create(name='面包', category=category, price=5, stock=5)
+        UserBehavior.objects.create(user=self.user, product=milk, behavior_type='purchase')
+        UserBehavior.objects.create(user=other, product=milk, behavior_type='purchase')
+        UserBehavior.objects.create(user=other, product=bread, behavior_type='view')
+
+    def test_stage_spans_with_attributes(self):
+        with tracing.collect_spans() as collector:
+            recommendations = RecommenderSystem().get_recommendations(self.user)
+        self.assertEqual(collector.names(), [
+            'build_matrices', 'lifecycle', 'user_similarity', 'item_similarity',
+            'scoring', 'fetch_products', 'total'])
+        total = collector.get('total')
+        self.assertEqual(total.depth, 0)
+        self.assertEqual(total.attrs['results'], len(recommendations))
+        build = collector.get('build_matrices')
+        self.assertIs(build.parent, total)
+        self.assertEqual(build.attrs['shape'], (2, 2))
+        self.assertEqual(build.attrs['nnz'], 3)
+        self.assertIs(collector.get('user_similarity').parent, collector.get('scoring'))
+        self.assertEqual(collector.get('scoring').attrs['candidates'], 1)
+        self.assertEqual(collector.get('fetch_products').attrs['fetched'], 1)
+        self.assertTrue(all(s.duration >= 0 for s in collector.spans))
+
+    def test_error_recorded_on_span(self):
+        with tracing.collect_spans() as collector, self.assertRaises(ValueError):
+            with tracing.span('outer'):
+                raise ValueError
+        self.assertEqual(collector.get('outer').attrs['error'], 'ValueError')
+
+    @override_settings(SHOP_TRACING={'RECORDERS': []})
+    def test_disabled_returns_null_span(self):
+        self.assertIs(tracing.span('total'), tracing.NULL_SPAN)
+        self.assertFalse(tracing.NULL_SPAN)
+        RecommenderSystem().get_recommendations(self.user)
+
+    def test_metrics_recorder_skips_attributes(self):
+        with tracing.span('total') as sp:
+            self.assertFalse(sp)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """后台列表页的查询数不随行数增长"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', '123456')
+        self.client.force_login(self.admin)
+        self.categories = [Category.objects.create(name=f'分类{i}') for i in range(7)]
+        self.batches = 0
+
+    def add_rows(self, count=3):
+        for _ in range(count):
+            n = self.batches = self.batches + 1
+            family = Family.objects.create(name=f'家庭{n}')
+            user = User.objects.create_user(f'user{n}', password='123456', family=family)
+            profile = FamilyProfile.objects.create(family=family)
+            profile.preferred_categories.set(self.categories[:n % len(self.categories) + 1])
+            product = Product.objects.create(name=f'商品{n}', category=self.categories[n % 7], price=10, stock=5)
+            cart = Cart.objects.create(family=family)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+            order = Order.objects.create(family=family, user=user, total_price=10, status='paid')
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=10)
+            UserBehavior.objects.create(user=user, product=product, behavior_type='view')
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:shop_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_constant_queries_per_changelist(self):
+        models = [User, Family, FamilyProfile, Category, Product, Cart, CartItem, Order, OrderItem, UserBehavior]
+        self.add_rows()
+        # 用户行为列表按统计信息估算总数（空表 ANALYZE 后没有统计行，需有数据后执行）
+        pagination.refresh_statistics(UserBehavior, 'default')
+        self.changelist_queries(Product)  # 预热会话和内容类型缓存
+        before = {model: self.changelist_queries(model) for model in models}
+        self.add_rows()
+        after = {model: self.changelist_queries(model) for model in models}
+        self.assertEqual(after, before)
+
+    def test_annotated_columns(self):
+        self.add_rows(1)
+        family = Family.objects.get()
+        FamilyProfile.objects.get().preferred_categories.set(self.categories)
+        CartItem.objects.create(cart=family.cart, product=Product.objects.create(
+            name='面包', category=self.categories[0], price='2.50', stock=5), quantity=3)
+
+        response = self.client.get(reverse('admin:shop_cart_changelist'))
+        self.assertContains(response, '>5</span>')
+        self.assertContains(response, '¥27.50')
+        response = self.client.get(reverse('admin:shop_familyprofile_changelist'))
+        self.assertContains(response, '分类0, 分类1, 分类2, 分类3, 分类4...')
+        self.assertContains(response, '>7</span>')
+        response = self.client.get(reverse('admin:shop_family_changelist') + '?o=3')
+        self.assertContains(response, '>1</span>')
+        self.assertContains(response, '✓', count=2)
+
+
+class LargeTableAdminTests(TestCase):
+    """用户行为后台：估算总数和键集分页"""
+
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', '123456')
+        self.client.force_login(admin)
+        category = Category.objects.create(name='食品饮料')
+        products = [Product.objects.create(name=f'商品{i}', category=category, price=10) for i in range(3)]
+        now = timezone.now()
+        # 同一时间戳的多条记录，验证游标按 (timestamp, id) 推进
+        with explicit_timestamps(UserBehavior):
+            UserBehavior.objects.bulk_create([
+                UserBehavior(user=admin, product=products[i % 3], behavior_type='view' if i % 2 else 'purchase',
+                             timestamp=now - timedelta(minutes=i // 3))
+                for i in range(250)
+            ])
+        pagination.refresh_statistics(UserBehavior, 'default')
+        self.url = reverse('admin:shop_userbehavior_changelist')
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            cl = response.context['cl']
+            self.assertTrue(cl.keyset)
+            seen.extend(obj.pk for obj in cl.result_list)
+            url = cl.next_page_url and self.url + cl.next_page_url
+        return seen
+
+    def test_keyset_pages_cover_all_rows_in_order(self):
+        seen = self.walk(self.url)
+        expected = list(UserBehavior.objects.order_by('-timestamp', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+        filtered = self.walk(self.url + '?behavior_type__exact=view')
+        self.assertEqual(filtered, [pk for pk in expected if UserBehavior.objects.get(pk=pk).behavior_type == 'view'])
+
+    def test_no_full_count_and_bounded_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([sql for sql in sqls if 'COUNT(' in sql.upper()])
+        self.assertTrue(response.context['cl'].paginator.count_is_estimate)
+        self.assertContains(response, '约 250')
+
+        page = response.context['cl'].next_page_url
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url + page)
+        self.assertLessEqual(len(ctx.captured_queries), len(sqls))
+        self.assertFalse([q for q in ctx.captured_queries if 'OFFSET' in q['sql'].upper()])
+
+    def test_estimate_uses_statistics_not_id_range(self):
+        # 删除中间的行（如压缩某个月份分区）后，主键首尾之差会高估总数
+        ids = list(UserBehavior.objects.order_by('id').values_list('id', flat=True))
+        UserBehavior.objects.filter(id__in=ids[1:-1]).delete()
+        pagination.refresh_statistics(UserBehavior, 'default')
+        self.assertEqual(pagination.table_row_estimate(UserBehavior, 'default'), 2)
+
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM sqlite_stat1')
+        self.assertIsNone(pagination.table_row_estimate(UserBehavior, 'default'))
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['cl'].paginator.count_is_estimate)
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_other_ordering_falls_back_to_pages(self):
+        response = self.client.get(self.url + '?o=2&behavior_type__exact=view')
+        cl = response.context['cl']
+        self.assertFalse(cl.keyset)
+        self.assertEqual(cl.result_count, 125)
+        self.assertFalse(cl.paginator.count_is_estimate)
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.client.get(self.url + '?after=bad')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['cl'].first_page_url)
+
+
+class ExportDataTests(TestCase):
+    """订单和行为的流式导出"""
+
+    def setUp(self):
+        self.family = Family.objects.create(name='家庭1')
+        self.user = User.objects.create_user('user1', password='123456', family=self.family)
+        category = Category.objects.create(name='食品饮料')
+        self.products = [Product.objects.create(name=f'牛奶{i}', category=category, price=10)
+                         for i in range(3)]
+        base = timezone.make_aware(datetime(2025, 1, 1, 8))
+        with explicit_timestamps(UserBehavior, Order, OrderItem):
+            UserBehavior.objects.bulk_create([
+                UserBehavior(user=self.user, product=self.products[i % 3], behavior_type='view',
+                             timestamp=base + timedelta(days=i))
+                for i in range(10)
+            ])
+            for i in range(5):
+                order = Order.objects.create(family=self.family, user=self.user, status='paid', total_price=20,
+                                             created_at=base + timedelta(days=i), updated_at=base)
+                for product in self.products[:2]:
+                    OrderItem.objects.create(order=order, product=product, quantity=1, price=10,
+                                             purchase_date=order.created_at)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def run_export(self, *args, **options):
+        call_command('export_data', *args, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def read_csv(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_behaviors_with_date_range(self):
+        path = os.path.join(self.tmpdir.name, 'behaviors.csv')
+        self.run_export('behaviors', output=path, start='2025-01-03', end='2025-01-06', batch_size=2)
+        rows = self.read_csv(path)
+        self.assertEqual([r['timestamp'][:10] for r in rows], ['2025-01-03', '2025-01-04', '2025-01-05'])
+        self.assertEqual(rows[0]['user'], 'user1')
+
+    def test_orders_round_trip_through_import(self):
+        path = os.path.join(self.tmpdir.name, 'orders.jsonl')
+        self.run_export('orders', output=path, batch_size=2)
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual([r['order'] for r in rows], sorted(r['order'] for r in rows))
+        with open(path + '.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['cursor'], Order.objects.latest('id').id)
+
+        call_command('import_behaviors', path, kind='orders', stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(OrderItem.objects.count(), 20)
+
+    def test_resume_truncates_partial_output(self):
+        path = os.path.join(self.tmpdir.name, 'behaviors.csv.gz')
+        def interrupted(queryset, after, batch_size):
+            # 写完第一批（3行）、第二批写到一半时中断
+            for i, item in enumerate(export.behavior_rows(queryset, after, batch_size)):
+                if i == 5:
+                    raise KeyboardInterrupt
+                yield item
+
+        behaviors = (UserBehavior.objects.all, 'timestamp', export.BEHAVIOR_FIELDS, interrupted)
+        with mock.patch.dict('shop.management.commands.export_data.EXPORTS', {'behaviors': behaviors}), \
+                self.assertRaises(KeyboardInterrupt):
+            self.run_export('behaviors', output=path, batch_size=3)
+        self.run_export('behaviors', output=path, batch_size=3, resume=True)
+        rows = self.read_csv(path)
+        self.assertEqual([int(r['id']) for r in rows],
+                         list(UserBehavior.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_admin_action_streams(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', '123456')
+        self.client.force_login(admin)
+        ids = list(UserBehavior.objects.values_list('id', flat=True)[:4])
+        response = self.client.post(reverse('admin:shop_userbehavior_changelist'), {
+            'action': 'export_jsonl', '_selected_action': ids,
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(r['id'] for r in rows), sorted(ids))
+
+        response = self.client.post(reverse('admin:shop_order_changelist'), {
+            'action': 'export_csv', 'select_across': '1', '_selected_action': [Order.objects.first().id],
+        })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('order,family_id'))
+        self.assertEqual(len(lines), 11)
+
+
+class CatalogBulkTests(TestCase):
+    """商品批量导入和库存调整"""
+
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', '123456')
+        self.client.force_login(admin)
+        self.food = Category.objects.create(name='食品饮料')
+        self.milk = Product.objects.create(name='牛奶', category=self.food, price=10, stock=5)
+        self.bread = Product.objects.create(name='面包', category=self.food, price=5, stock=0)
+
+    def upload(self, text, **data):
+        upload = SimpleUploadedFile('catalog.csv', text.encode('utf-8'), content_type='text/csv')
+        return self.client.post(reverse('admin:shop_product_import'), {
+            'file': upload, 'create_categories': 'on', 'batch_size': 2, **data,
+        })
+
+    def test_plan_resolves_categories_and_matches_products(self):
+        rows = catalog.read_csv(StringIO(
+            'id,name,category,price,stock\n'
+            f'{self.milk.id},,,12,\n'
+            ',面包,食品饮料,,40\n'
+            ',洗衣液,日用品,25,10\n'
+            ',洗衣液,日用品,,12\n'
+            ',香皂,日用品,,3\n'
+            '999999,,,1,\n'
+        ))
+        with self.assertNumQueries(3):
+            plan = catalog.plan_import(rows)
+        self.assertEqual([(p.name, sorted(c)) for p, c in plan.updates],
+                         [('牛奶', ['price']), ('面包', ['stock'])])
+        self.assertEqual([(p.name, p.stock) for p in plan.creates], [('洗衣液', 12)])
+        self.assertEqual([c.name for c in plan.new_categories], ['日用品'])
+        self.assertEqual([line for line, _ in plan.errors], [6, 7])
+
+    def test_dry_run_does_not_write(self):
+        response = self.upload('name,category,price\n酸奶,食品饮料,8\n', dry_run='on')
+        self.assertContains(response, '试运行结果')
+        self.assertFalse(Product.objects.filter(name='酸奶').exists())
+
+    def test_import_writes_in_batches_and_reindexes(self):
+        text = 'name,category,price,stock\n' + ''.join(f'酸奶{i},乳制品,8,{i}\n' for i in range(5))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(text + '牛奶,食品饮料,11,\n')
+        self.assertRedirects(response, reverse('admin:shop_product_changelist'))
+        self.assertEqual(Product.objects.filter(category__name='乳制品').count(), 5)
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.price, 11)
+        message = str(list(response.wsgi_request._messages)[0])
+        self.assertIn('新建 5 个商品', message)
+        self.assertIn('新建商品 2 行', message)
+        if search.is_enabled():
+            self.assertEqual(len(search.search_products(Product.objects.all(), '酸奶')), 5)
+
+    def test_stock_adjustment_preview_then_apply(self):
+        url = reverse('admin:shop_product_changelist')
+        data = {'action': 'adjust_stock', '_selected_action': [self.milk.id, self.bread.id],
+                'operation': 'add', 'quantity': 10, 'batch_size': 1}
+        response = self.client.post(url, {**data, 'preview': '1'})
+        self.assertContains(response, '2 个商品库存将变化')
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.stock, 5)
+
+        response = self.client.post(url, {**data, 'apply': '1'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(sorted(Product.objects.values_list('stock', flat=True)), [10, 15])
+        self.assertIn('2 批', str(list(response.wsgi_request._messages)[0]))
+
+        changes = catalog.plan_stock_adjustment(Product.objects.all(), 'subtract', 12)
+        self.assertEqual([(old, new) for _, old, new in changes], [(15, 3), (10, 0)])
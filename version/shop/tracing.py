@@ -0,0 +1,178 @@
+"""
+阶段追踪 - 推荐系统等代码中的轻量级span
+
+    with tracing.span('build_matrices') as sp:
+        ...
+        if sp:  # 没有记录器需要属性时跳过属性计算
+            sp.set(shape=matrix.shape, nnz=int(np.count_nonzero(matrix)))
+
+span结束时交给 settings.SHOP_TRACING['RECORDERS'] 中配置的记录器（日志、指标等），
+测试中可用 collect_spans() 收集。没有任何记录器时 span() 直接返回共享的空span，几乎没有开销；
+只有指标记录器时只计时，不计算属性。
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+DEFAULT_RECORDERS = ['shop.tracing.MetricsRecorder']
+
+logger = logging.getLogger('shop.tracing')
+
+# 当前上下文中正在执行的span（用于记录父子关系）
+_current_span = ContextVar('shop_current_span', default=None)
+# collect_spans() 注册的临时收集器
+_collectors = ContextVar('shop_span_collectors', default=())
+_recorders = None
+
+
+class Span:
+    """一个阶段的耗时和属性"""
+    __slots__ = ('name', 'attrs', 'parent', 'depth', 'detailed', 'started', 'duration')
+
+    def __init__(self, name, attrs, parent, detailed=True):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.detailed = detailed
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def __bool__(self):
+        # 是否有记录器需要属性
+        return self.detailed
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __repr__(self):
+        return f'<Span {self.name} {self.duration}s {self.attrs}>'
+
+
+class _NullSpan:
+    """未开启追踪时使用的空span"""
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+# ---- 记录器 ----
+
+class LogRecorder:
+    """以缩进树的形式写日志（logger: shop.tracing）"""
+    wants_attrs = True
+
+    def record(self, span):
+        if logger.isEnabledFor(logging.INFO):
+            attrs = ' '.join(f'{k}={v}' for k, v in span.attrs.items())
+            logger.info('%s%s %.2fms %s', '  ' * span.depth, span.name, span.duration * 1000, attrs)
+
+
+class MetricsRecorder:
+    """把span耗时写入 shop_recommender_stage_duration_seconds 直方图"""
+    wants_attrs = False
+
+    def record(self, span):
+        metrics.RECOMMENDER_STAGE_DURATION.observe(span.duration, stage=span.name)
+
+
+class CollectingRecorder:
+    """把span保存在列表中，供测试断言"""
+    wants_attrs = True
+
+    def __init__(self):
+        self.spans = []
+
+    def record(self, span):
+        self.spans.append(span)
+
+    def get(self, name):
+        return next(s for s in self.spans if s.name == name)
+
+    def names(self):
+        return [s.name for s in self.spans]
+
+
+def get_recorders():
+    global _recorders
+    if _recorders is None:
+        config = getattr(settings, 'SHOP_TRACING', {})
+        _recorders = [import_string(path)() for path in config.get('RECORDERS', DEFAULT_RECORDERS)]
+    return _recorders
+
+
+@receiver(setting_changed)
+def _reset_recorders(setting, **kwargs):
+    global _recorders
+    if setting == 'SHOP_TRACING':
+        _recorders = None
+
+
+@contextmanager
+def collect_spans():
+    """在代码块内额外收集所有span：with collect_spans() as collector: ..."""
+    collector = CollectingRecorder()
+    token = _collectors.set(_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
+
+
+# ---- span ----
+
+class _SpanContext:
+    __slots__ = ('span', 'recorders', 'token')
+
+    def __init__(self, name, attrs, recorders):
+        detailed = any(getattr(r, 'wants_attrs', True) for r in recorders)
+        self.span = Span(name, attrs, _current_span.get(), detailed)
+        self.recorders = recorders
+
+    def __enter__(self):
+        self.token = _current_span.set(self.span)
+        self.span.started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter() - span.started
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            span.attrs['error'] = exc_type.__name__
+        for recorder in self.recorders:
+            try:
+                recorder.record(span)
+            except Exception:
+                logger.exception('span记录失败: %s', span.name)
+        return False
+
+
+def span(name, **attrs):
+    """开始一个span；没有记录器时返回空span"""
+    recorders = get_recorders()
+    collectors = _collectors.get()
+    if not recorders and not collectors:
+        return NULL_SPAN
+    return _SpanContext(name, attrs, (*recorders, *collectors))
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# ASGI部署（version/asgi.py）时首页、商品列表和商品详情使用异步版本
+hot_views = async_views if settings.SHOP_ASYNC_VIEWS else views
 
 urlpatterns = [
     # 认证
@@ -8,11 +12,11 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     
     # 主页
-    path('', views.home, name='home'),
+    path('', hot_views.home, name='home'),
     
     # 商品
-    path('products/', views.products, name='products'),
-    path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('products/', hot_views.products, name='products'),
+    path('product/<int:product_id>/', hot_views.product_detail, name='product_detail'),
     
     # 购物车
     path('cart/', views.cart_view, name='cart'),
@@ -25,5 +29,11 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('profile/update/', views.update_family_profile, name='update_family_profile'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
+    
+    # 性能分析（工作人员）
+    path('profiling/', views.profiling_summary, name='profiling_summary'),
+    
+    # 运行指标（Prometheus）
+    path('metrics', views.metrics_view, name='metrics'),
 ]
 
@@ -1,14 +1,22 @@
+import hmac
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.db.models import Sum
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.functional import SimpleLazyObject
 from .models import (
     User, Family, FamilyProfile, Category, Product, 
-    Cart, CartItem, Order, OrderItem, UserBehavior
+    Cart, CartItem, Order, OrderItem
 )
-from .recommender import get_user_recommendations
+from . import catalog_cache, fragments, metrics, profiling
+from .behaviors import record_behavior, records_product_view
+from .conditional import catalog_page
+from .recommender import get_popular_products, get_user_recommendations
+from .search import search_products
 from django.db import transaction
 
 
@@ -24,20 +32,20 @@ def register(request):
             messages.error(request, '用户名已存在')
             return render(request, 'register.html')
         
-        # 获取或创建家庭
-        family, created = Family.objects.get_or_create(name=family_name)
-        
-        # 创建用户
-        user = User.objects.create_user(
-            username=username,
-            password=password,
-            family=family
-        )
-        
-        # 如果是新家庭，创建家庭画像和购物车
-        if created:
-            FamilyProfile.objects.create(family=family)
-            Cart.objects.create(family=family)
+        with transaction.atomic():
+            # 获取或创建家庭
+            family, _ = Family.objects.get_or_create(name=family_name)
+            
+            # 创建用户
+            user = User.objects.create_user(
+                username=username,
+                password=password,
+                family=family
+            )
+            
+            # 确保家庭画像和购物车存在（加入已有家庭时也检查），之后的页面只读取不创建
+            FamilyProfile.objects.get_or_create(family=family)
+            Cart.objects.get_or_create(family=family)
         
         messages.success(request, '注册成功！请登录')
         return redirect('login')
@@ -70,63 +78,61 @@ def user_logout(request):
 
 @login_required
 def home(request):
-    """首页"""
+    """首页（只读：家庭画像和购物车在注册时创建，GET请求不写数据库）"""
     user = request.user
     
-    # 获取家庭画像
-    family_profile = None
-    if user.family:
-        family_profile, _ = FamilyProfile.objects.get_or_create(family=user.family)
+    # 家庭偏好分类（家庭画像块的片段缓存未命中时才查询）
+    profile_categories = Category.objects.none()
+    if user.family_id:
+        profile_categories = Category.objects.filter(families__family_id=user.family_id)
     
-    # 获取推荐列表
-    recommendations = get_user_recommendations(user, top_n=10)
+    # 获取推荐列表（推荐块的片段缓存未命中时才计算）
+    recommendations = SimpleLazyObject(lambda: get_user_recommendations(user, top_n=10))
     
-    # 获取购物车信息
-    cart = None
+    # 购物车商品数量（一次聚合查询，没有购物车时为0）
     cart_count = 0
-    if user.family:
-        cart, _ = Cart.objects.get_or_create(family=user.family)
-        cart_count = cart.get_items_count()
+    if user.family_id:
+        cart_count = CartItem.objects.filter(cart__family_id=user.family_id).aggregate(
+            total=Sum('quantity'))['total'] or 0
     
-    # 获取热门商品
-    popular_products = Product.objects.annotate(
-        behavior_count=Count('behaviors')
-    ).order_by('-behavior_count')[:8]
+    # 获取热门商品（聚合结果缓存，商品从目录缓存读取）
+    popular_products = get_popular_products(top_n=8)
     
     context = {
         'user': user,
-        'family_profile': family_profile,
+        'profile_categories': profile_categories,
         'recommendations': recommendations,
         'popular_products': popular_products,
         'cart_count': cart_count,
+        'profile_version': fragments.get_version(fragments.FAMILY_PROFILE, user.family_id),
+        'recommendation_version': fragments.get_version(fragments.RECOMMENDATIONS, user.family_id),
     }
     
     return render(request, 'home.html', context)
 
 
 @login_required
+@catalog_page
 def products(request):
     """商品浏览页面"""
-    # 获取所有分类
-    categories = Category.objects.all()
+    # 获取所有分类（目录缓存）
+    categories = catalog_cache.get_categories()
     
     # 获取筛选参数
     category_id = request.GET.get('category')
     search_query = request.GET.get('search', '')
     
     # 构建查询
-    products_list = Product.objects.all()
+    products_list = Product.objects.select_related('category')
     
     if category_id:
         products_list = products_list.filter(category_id=category_id)
     
     if search_query:
-        products_list = products_list.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    products_list = products_list.order_by('-created_at')
+        # 全文检索，结果按相关度排序
+        products_list = search_products(products_list, search_query)
+    else:
+        products_list = products_list.order_by('-created_at')
     
     # 获取购物车数量
     cart_count = 0
@@ -136,32 +142,29 @@ def products(request):
             cart_count = cart.get_items_count()
     
     context = {
+        # 商品网格片段缓存命中时不会执行查询
         'products': products_list,
         'categories': categories,
         'selected_category': category_id,
         'search_query': search_query,
         'cart_count': cart_count,
+        'stock_version': fragments.get_version(fragments.STOCK, 'all'),
     }
     
     return render(request, 'products.html', context)
 
 
 @login_required
+@records_product_view
+@catalog_page
 def product_detail(request, product_id):
-    """商品详情"""
-    product = get_object_or_404(Product, id=product_id)
-    
-    # 记录浏览行为
-    UserBehavior.objects.create(
-        user=request.user,
-        product=product,
-        behavior_type='view'
-    )
+    """商品详情（浏览行为在条件GET之前记录，见 records_product_view）"""
+    product = catalog_cache.get_product(product_id)
+    if product is None:
+        raise Http404('商品不存在')
     
     # 获取相似商品（同分类）
-    similar_products = Product.objects.filter(
-        category=product.category
-    ).exclude(id=product.id)[:4]
+    similar_products = catalog_cache.get_similar_products(product, limit=4)
     
     # 获取购物车数量
     cart_count = 0
@@ -205,10 +208,12 @@ def add_to_cart(request, product_id):
         messages.error(request, '您还没有加入家庭')
         return redirect('products')
     
-    product = get_object_or_404(Product, id=product_id)
+    product = catalog_cache.get_product(product_id)
+    if product is None:
+        raise Http404('商品不存在')
     cart, _ = Cart.objects.get_or_create(family=request.user.family)
     
-    # 检查库存
+    # 检查库存（缓存的库存可能略旧，结算时会重新检查）
     if product.stock <= 0:
         messages.error(request, '商品库存不足')
         return redirect('products')
@@ -225,11 +230,7 @@ def add_to_cart(request, product_id):
         cart_item.save()
     
     # 记录行为
-    UserBehavior.objects.create(
-        user=request.user,
-        product=product,
-        behavior_type='add_to_cart'
-    )
+    record_behavior(request.user, product, 'add_to_cart')
     
     messages.success(request, f'{product.name} 已添加到购物车')
     return redirect(request.META.get('HTTP_REFERER', 'products'))
@@ -278,25 +279,37 @@ def remove_from_cart(request, item_id):
 
 
 @login_required
-@transaction.atomic
 def checkout(request):
     """结算"""
+    try:
+        with metrics.CHECKOUT_DURATION.time():
+            response, result = _checkout(request)
+    except Http404:
+        metrics.CHECKOUTS.inc(result='no_cart')
+        raise
+    metrics.CHECKOUTS.inc(result=result)
+    return response
+
+
+@transaction.atomic
+def _checkout(request):
+    """结算流程，返回 (响应, 结算结果)"""
     if not request.user.family:
         messages.error(request, '您还没有加入家庭')
-        return redirect('home')
+        return redirect('home'), 'no_family'
     
     cart = get_object_or_404(Cart, family=request.user.family)
     cart_items = cart.items.all().select_related('product')
     
     if not cart_items:
         messages.error(request, '购物车为空')
-        return redirect('cart')
+        return redirect('cart'), 'empty_cart'
     
     # 检查库存
     for item in cart_items:
         if item.quantity > item.product.stock:
             messages.error(request, f'{item.product.name} 库存不足')
-            return redirect('cart')
+            return redirect('cart'), 'out_of_stock'
     
     # 创建订单
     total_price = cart.get_total_price()
@@ -316,22 +329,20 @@ def checkout(request):
             price=item.product.price
         )
         
-        # 更新库存
+        # 更新库存（只写库存字段，目录缓存只失效该商品）
         item.product.stock -= item.quantity
-        item.product.save()
+        item.product.save(update_fields=['stock'])
         
         # 记录购买行为
-        UserBehavior.objects.create(
-            user=request.user,
-            product=item.product,
-            behavior_type='purchase'
-        )
+        record_behavior(request.user, item.product, 'purchase')
+    
+    metrics.ORDER_ITEMS.inc(len(cart_items))
     
     # 清空购物车
     cart_items.delete()
     
     messages.success(request, f'订单创建成功！订单号：{order.id}')
-    return redirect('order_detail', order_id=order.id)
+    return redirect('order_detail', order_id=order.id), 'success'
 
 
 @login_required
@@ -347,8 +358,8 @@ def profile(request):
     if user.family:
         family_profile, _ = FamilyProfile.objects.get_or_create(family=user.family)
     
-    # 获取所有分类
-    categories = Category.objects.all()
+    # 获取所有分类（目录缓存）
+    categories = catalog_cache.get_categories()
     
     # 获取购物车数量
     cart_count = 0
@@ -414,3 +425,29 @@ def order_detail(request, order_id):
     }
     
     return render(request, 'order_detail.html', context)
+
+
+@staff_member_required
+def profiling_summary(request):
+    """请求性能分析汇总（仅工作人员）"""
+    if request.method == 'POST':
+        profiling.reset_summaries()
+        messages.success(request, '性能分析数据已清空')
+        return redirect('profiling_summary')
+    
+    context = {
+        'summaries': profiling.get_summaries(),
+        'profiling': profiling.get_profiling_settings(),
+    }
+    
+    return render(request, 'profiling.html', context)
+
+
+def metrics_view(request):
+    """Prometheus 指标（文本格式）：带正确的 Bearer 令牌或已登录的管理员可访问，未配置令牌时只对管理员开放"""
+    token = metrics.get_metrics_settings()['TOKEN']
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token_valid = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not (token_valid or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.REGISTRY.exposition(), content_type=metrics.CONTENT_TYPE)
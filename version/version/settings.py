@@ -35,16 +35,23 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
+    'shop.middleware.MetricsMiddleware',
+    'shop.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'version.urls'
 
+# 首页、商品列表和商品详情使用异步视图（shop/async_views.py），version/asgi.py 中默认开启
+SHOP_ASYNC_VIEWS = os.environ.get('SHOP_ASYNC_VIEWS') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -56,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.fragments.context_processor',
             ],
         },
     },
@@ -67,12 +75,116 @@ WSGI_APPLICATION = 'version.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# 通过环境变量 DJANGO_DB_PROFILE 选择数据库配置：
+#   development（默认）: SQLite，每个请求新建连接
+#   production: SQLite + WAL模式、持久连接，PRAGMA见 SQLITE_PRAGMAS
+#   postgresql: PostgreSQL + 持久连接，可经PgBouncer连接池接入
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'development')
+
+if DB_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'shop_db'),
+            'USER': os.environ.get('POSTGRES_USER', 'shop_user'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            # 使用PgBouncer时指向连接池端口（默认6432）
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # PgBouncer事务级连接池不支持服务端游标
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER') == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# 生产环境显式使用缓存模板加载器：模板只编译一次，修改模板后需重启进程
+if DB_PROFILE in ('production', 'postgresql'):
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# SQLite连接建立时执行的PRAGMA（shop.db.configure_sqlite）
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    # 事务以 BEGIN IMMEDIATE 开始，避免读后写的锁升级失败
+    DATABASES['default']['ENGINE'] = 'shop.backends.sqlite3'
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DJANGO_CONN_MAX_AGE', 600))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',        # 读写互不阻塞
+        'synchronous': 'NORMAL',      # WAL模式下安全且减少fsync
+        'busy_timeout': 5000,         # 写锁等待(毫秒)，避免 database is locked
+        'mmap_size': 268435456,       # 256MB内存映射读
+        'cache_size': -65536,         # 64MB页缓存（负数单位为KB）
+        'temp_store': 'MEMORY',
+    }
+
+# 只读副本（可选）：推荐训练、评估和后台列表的读取路由到副本（shop.routers）
+#   SQLite: DJANGO_SQLITE_REPLICA_PATH 指向由 snapshot_replica 命令定期生成的快照
+#   PostgreSQL: POSTGRES_REPLICA_HOST 指向流复制备库
+if DB_PROFILE == 'postgresql' and os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+        'PORT': os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif DB_PROFILE != 'postgresql' and os.environ.get('DJANGO_SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': DATABASES['default']['ENGINE'],
+        'NAME': os.environ['DJANGO_SQLITE_REPLICA_PATH'],
+        # 不保持持久连接，快照替换后新请求即可读到新文件
+        'CONN_MAX_AGE': 0,
+        # 副本只读，仅应用读相关的PRAGMA
+        'PRAGMAS': {
+            'query_only': 1,
+            **{k: v for k, v in SQLITE_PRAGMAS.items() if k in ('mmap_size', 'cache_size', 'temp_store')},
+        },
+        'TEST': {'MIRROR': 'default'},
     }
-}
+
+DATABASE_ROUTERS = ['shop.routers.ReadReplicaRouter']
+SHOP_READ_DB_ALIAS = 'replica' if 'replica' in DATABASES else 'default'
+# 写入后把该客户端固定到主库的时长（秒），应大于副本延迟/快照间隔
+SHOP_READ_YOUR_WRITES_SECONDS = int(os.environ.get('DJANGO_READ_YOUR_WRITES_SECONDS', 5))
+
+
+# Cache
+# 默认使用进程内缓存；多进程部署时设置 DJANGO_REDIS_URL 使用Redis共享缓存
+
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shop',
+        }
+    }
+
+# 会话先读缓存，未命中再查数据库
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 
 # Password validation
@@ -100,6 +212,14 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# 生产环境 collectstatic 生成带内容哈希的文件名和 .gz 预压缩文件（shop/storage.py），
+# 由Web服务器提供并设置永久缓存（配置见README）；开发环境由 runserver 直接提供原文件
+if DB_PROFILE in ('production', 'postgresql'):
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'shop.storage.CompressedManifestStaticFilesStorage'},
+    }
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -113,3 +233,67 @@ AUTH_USER_MODEL = 'shop.User'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
+# 用户（含所属家庭）按ID缓存，见 shop.auth；保留 ModelBackend，切换前登录的会话仍然有效，
+# 重新登录后改用带缓存的后端（登录时按顺序尝试，第一个即可认证）
+AUTHENTICATION_BACKENDS = [
+    'shop.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+SHOP_USER_CACHE_TIMEOUT = 300
+
+# 商品全文检索（SQLite FTS5，其他数据库回退到 icontains）
+# TOKENIZER: 'cjk' 中文按二元组切分，'unicode61' 按词切分；修改后需执行 rebuild_search_index
+SHOP_SEARCH = {
+    'BACKEND': 'fts5',
+    'TOKENIZER': 'cjk',
+    'MAX_RESULTS': 500,
+}
+
+# 请求性能分析（见 shop.profiling）：ENABLED 对所有请求开启；
+# 否则工作人员可在请求头加 X-Shop-Profile: 1（或 cprofile）分析单个请求，汇总见 /profiling/
+SHOP_PROFILING = {
+    'ENABLED': os.environ.get('SHOP_PROFILING') == '1',
+    'HEADER': 'X-Shop-Profile',
+    'CPROFILE': False,
+    'CPROFILE_LIMIT': 30,
+}
+
+# 运行指标（见 shop.metrics），Prometheus 从 /metrics 抓取
+# 多进程部署时设置 SHOP_METRICS_DIR 为各worker共享的目录（部署启动前清空）；/metrics 只对管理员开放，
+# 设置 TOKEN 后 Prometheus 可带 Bearer 令牌抓取
+SHOP_METRICS = {
+    'DIR': os.environ.get('SHOP_METRICS_DIR') or None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': os.environ.get('SHOP_METRICS_TOKEN') or None,
+}
+
+# 推荐系统阶段追踪（shop/tracing.py）：默认只把各阶段耗时写入运行指标；
+# 加入 'shop.tracing.LogRecorder' 可在日志中输出带矩阵形状、候选数等属性的span树，设为 [] 则完全关闭
+SHOP_TRACING = {
+    'RECORDERS': ['shop.tracing.MetricsRecorder'],
+}
+
+# 模板片段缓存（{% cache %}，键中的版本号见 shop/fragments.py）
+SHOP_FRAGMENT_CACHE = {
+    'TIMEOUT': 3600,                  # 商品卡片、家庭画像块（秒）
+    'RECOMMENDATIONS_TIMEOUT': 300,   # 首页推荐块（秒）
+}
+
+# 网页行为去重窗口（秒，见 shop/behaviors.py）：同一用户对同一商品的同类行为在窗口内只写入一次，0 表示不去重
+SHOP_BEHAVIOR_DEDUP = {
+    'view': 1800,
+    'add_to_cart': 0,
+    'purchase': 0,
+}
+
+# 行为表按月分区（见 shop/partitions.py）：更早的分区由 compact_behaviors 命令归档为压缩文件并汇总
+SHOP_BEHAVIOR_PARTITIONS = {
+    'HOT_MONTHS': 3,        # 保留原始行为的月数（含当月）
+    'ARCHIVE_DIR': os.environ.get('SHOP_BEHAVIOR_ARCHIVE_DIR') or BASE_DIR / 'archive' / 'behaviors',
+}
+
+# 商品目录缓存（分类和商品卡片，见 shop/catalog_cache.py）
+SHOP_CATALOG_CACHE = {
+    'TIMEOUT': 3600,        # 共享缓存过期时间（秒）
+    'LOCAL_TIMEOUT': 5,     # 进程内缓存过期时间（秒），结算扣减的库存在其他进程最多延迟这么久
+}